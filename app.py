@@ -1,8 +1,13 @@
+import logging
+import os
 from flask import Flask, render_template, session, redirect, url_for
 from flask_cors import CORS
-import routes
+import routes.student
+import routes.teacher
+from models.indexes import IndexBuildError, ensure_indexes
 
 app = Flask(__name__)
+logger = logging.getLogger(__name__)
 app.secret_key = "secret key"
 
 @app.route("/")
@@ -14,5 +19,14 @@ def index():
 app.register_blueprint(routes.teacher.bp)
 app.register_blueprint(routes.student.bp)
 
+# Set ENSURE_INDEXES=0 to skip this and run `python manage.py indexes` instead. An index that
+# cannot be built (existing duplicates) is logged rather than keeping the app from starting;
+# `python manage.py indexes` lists the colliding documents
+if os.environ.get("ENSURE_INDEXES", "1") == "1":
+    try:
+        ensure_indexes(routes.student.handler.db)
+    except IndexBuildError as e:
+        logger.error("%s", e)
+
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,50 @@
+"""
+ASGI entry point: `hypercorn asgi:application` (or `uvicorn asgi:application`).
+
+The student exam-time endpoints (class list, class page, quiz view and submit) run on
+Quart and the async handlers, so waiting on MongoDB does not hold a thread. Every
+other route is handed to the Flask app from app.py through a WSGI adapter.
+"""
+from asgiref.wsgi import WsgiToAsgi
+from quart import Quart
+from werkzeug.exceptions import HTTPException
+from app import app as flask_app
+import routes.student_async
+
+quart_app = Quart(__name__)
+quart_app.secret_key = flask_app.secret_key
+quart_app.register_blueprint(routes.student_async.bp)
+
+# Templates rendered here link to Flask-served pages, so their URLs must be buildable too
+for rule in flask_app.url_map.iter_rules():
+    if rule.endpoint not in quart_app.view_functions:
+        build_rule = quart_app.url_rule_class(rule.rule, endpoint=rule.endpoint, methods=rule.methods)
+        build_rule.build_only = True
+        quart_app.url_map.add(build_rule)
+
+wsgi_app = WsgiToAsgi(flask_app)
+
+
+@quart_app.after_serving
+async def close_clients():
+    await routes.student_async.handler.close()
+
+
+def is_async_route(scope) -> bool:
+    adapter = quart_app.url_map.bind('', path_info=scope['path'], url_scheme=scope.get('scheme', 'http'))
+    try:
+        endpoint, _ = adapter.match(method=scope['method'])
+    except HTTPException:
+        # Not found, wrong method or a slash redirect: Flask answers those as it always has
+        return False
+    return endpoint != 'static'
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and is_async_route(scope):
+        await quart_app(scope, receive, send)
+    elif scope['type'] == 'http':
+        await wsgi_app(scope, receive, send)
+    else:
+        # lifespan (and websocket) events go to Quart, which owns the async clients
+        await quart_app(scope, receive, send)
@@ -0,0 +1,110 @@
+"""
+Request latencies of the full Flask app on a storage backend.
+
+    python benchmarks/app_benchmark.py --uri memory://
+    python benchmarks/app_benchmark.py --uri mongodb://localhost:27017 --db quizmaster_bench
+
+A teacher creates a class and a quiz, every student joins, opens and submits
+it, then the teacher loads the quiz's dashboard and item analysis. Reports
+per-endpoint latency percentiles, so runs against different backends (or
+before and after a change) compare directly. The database is dropped first:
+point --db at a scratch database.
+"""
+import argparse
+import os
+import random
+import re
+import statistics
+import sys
+import time
+from collections import defaultdict
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uri', default='memory://', help='MONGO_URI to run against (default: memory://)')
+    parser.add_argument('--db', default='quizmaster_bench', help='Database name; dropped before the run')
+    parser.add_argument('--students', type=int, default=200)
+    parser.add_argument('--questions', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    return parser.parse_args()
+
+
+class Timer:
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def request(self, name: str, call, *args, **kwargs):
+        start = time.perf_counter()
+        response = call(*args, **kwargs)
+        self.samples[name].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            raise SystemExit(f'{name}: HTTP {response.status_code}: {response.data[:300]!r}')
+        return response
+
+    def report(self):
+        print(f"{'endpoint':<22}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+        for name, samples in self.samples.items():
+            samples = sorted(samples)
+            p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+            print(f'{name:<22}{len(samples):>6}{statistics.median(samples) * 1e3:>10.2f}{p95 * 1e3:>10.2f}{samples[-1] * 1e3:>10.2f}')
+
+
+def main():
+    args = parse_args()
+    # Read by models.connection at import, so set before the app is loaded
+    os.environ['MONGO_URI'] = args.uri
+    os.environ['MONGO_DB'] = args.db
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from models.handler import Handler
+    handler = Handler()
+    for name in handler.db.list_collection_names():
+        handler.db.drop_collection(name)
+    import app as app_module  # creates the indexes
+    app = app_module.app
+    app.config['TESTING'] = True
+
+    rng = random.Random(args.seed)
+    timer = Timer()
+    teacher = app.test_client()
+    timer.request('teacher register', teacher.post, '/teacher/register', data={'username': 'bench', 'password': 'pw', 'name': 'Bench', 'email': 'bench@example.com', 'dob': '1990-01-01'})
+    timer.request('teacher login', teacher.post, '/teacher/login', data={'username': 'bench', 'password': 'pw'})
+    timer.request('class create', teacher.post, '/teacher/class/create', data={'name': 'Bench', 'students': ''})
+    class_id = handler.classes.find_one({}, {'class_id': 1})['class_id']
+
+    questions = {
+        str(i): {
+            'title': f'Question {i}', 'type': 'mcq', 'marks': 1,
+            'options': [{'opt_id': option, 'opt_val': f'Option {option} of {i}'} for option in 'abcd'],
+            'correct_options': [rng.choice('abcd')]
+        }
+        for i in range(args.questions)
+    }
+    response = timer.request('quiz create', teacher.post, f'/teacher/quiz/create/{class_id}', json={'title': 'Bench', 'description': '', 'questions': questions})
+    quiz_id = response.get_json()['id']
+    question_ids = handler.quizzes.find_one({'quiz_id': quiz_id})['question_ids']
+
+    started = time.perf_counter()
+    for n in range(args.students):
+        student = app.test_client()
+        timer.request('student register', student.post, '/student/register', data={'username': f's{n}', 'password': 'pw', 'name': f'S{n}', 'email': f's{n}@example.com', 'dob': '2005-01-01'})
+        timer.request('student login', student.post, '/student/login', data={'username': f's{n}', 'password': 'pw'})
+        timer.request('class join', student.post, '/student/class/join', data={'class_id': class_id})
+        page = timer.request('quiz page', student.get, f'/student/quiz/{quiz_id}')
+        form = {question_id: rng.choice('abcd') for question_id in question_ids}
+        if (submission := re.search(rb'name="submission_id" value="([^"]+)"', page.data)):
+            form['submission_id'] = submission.group(1).decode()
+        timer.request('quiz submit', student.post, f'/student/quiz/{quiz_id}/submit', data=form)
+    elapsed = time.perf_counter() - started
+
+    for _ in range(10):
+        timer.request('teacher quiz page', teacher.get, f'/teacher/quiz/{quiz_id}')
+        timer.request('item analysis', teacher.get, f'/teacher/api/quiz/{quiz_id}/item-analysis')
+
+    print(f'{args.uri}: {args.students} students x {args.questions} questions, {args.students / elapsed:.0f} students/s')
+    timer.report()
+
+
+if __name__ == '__main__':
+    main()
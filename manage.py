@@ -0,0 +1,276 @@
+import argparse
+import json
+from datetime import datetime
+from itertools import groupby
+from operator import itemgetter
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from models.grading import grade_answer, selection_mask, summarize_answers
+from models.handler import BUMP_BANK_VERSION, Handler, QuestionHandler, QuizHandler, StatsHandler, StudentHandler, RegradeHandler, batches
+from models.models import Answer, Attempt
+from models.question_bank import bank_fields
+from utils import generate_uuid, normalize_email
+from models.indexes import INDEX_VERSION, IndexBuildError, duplicate_keys, ensure_indexes, get_index_version, index_report
+
+
+def cmd_indexes(handler: Handler, args):
+    try:
+        applied = ensure_indexes(handler.db, force=args.force)
+    except IndexBuildError as e:
+        for collection_name, failures in e.failures.items():
+            for index_name, message in failures.items():
+                print(f"{collection_name}.{index_name} failed: {message}")
+                for duplicate in duplicate_keys(handler.db, collection_name, index_name):
+                    print(f"    {duplicate['count']} documents share {duplicate['key']}: _id {', '.join(map(str, duplicate['_ids']))}")
+        print(f"Index spec v{INDEX_VERSION} not applied; resolve the documents above and run this again")
+        raise SystemExit(1)
+    if applied:
+        print(f"Applied index spec v{INDEX_VERSION}")
+    else:
+        print(f"Index spec v{get_index_version(handler.db)} is already up to date")
+
+
+def cmd_index_report(handler: Handler, args):
+    print(json.dumps(index_report(handler.db), indent=4))
+
+
+def migrate_quiz_results(handler: Handler, quiz_id: str, questions: list, groups: dict) -> int:
+    # Folds one batch of a quiz's legacy rows (student_id -> rows) into the students' attempts;
+    # returns how many attempts had to be created
+    questions_by_id = {question['question_id']: question for question in questions}
+    existing = {
+        attempt['student_id']: attempt['attempt_id']
+        for attempt in handler.attempts.find({'quiz_id': quiz_id, 'student_id': {'$in': list(groups)}}, {'_id': 0, 'attempt_id': 1, 'student_id': 1})
+    }
+
+    requests = []
+    for student_id, rows in groups.items():
+        answers = {}
+        for row in rows:
+            selected = [row['option_id']] if row.get('option_id') else []
+            question = questions_by_id.get(row['question_id'])
+            if row.get('attempt_id'):
+                graded = {
+                    'mask': selection_mask(question, selected) if question else 0,
+                    'marks': float(row.get('marks', 0)),
+                    'correct': bool(row.get('correct'))
+                }
+            elif question is not None:
+                # Rows written before grading moved into submission are graded here
+                graded = grade_answer(question, selected)
+            else:
+                graded = {'mask': 0, 'marks': 0.0, 'correct': False}
+            answers[row['question_id']] = Answer(question_id=row['question_id'], option_ids=selected, **graded).model_dump()
+        answers = list(answers.values())
+
+        if student_id in existing:
+            requests.append(UpdateOne({'attempt_id': existing[student_id]}, {'$set': {'answers': answers}}))
+        else:
+            requests.append(InsertOne(Attempt(
+                attempt_id=rows[0].get('attempt_id') or generate_uuid(),
+                student_id=student_id,
+                quiz_id=quiz_id,
+                answers=answers,
+                submitted_on=max((row['created_on'] for row in rows if row.get('created_on')), default=datetime.now()),
+                **summarize_answers(answers, questions)
+            ).model_dump()))
+
+    handler.attempts.bulk_write(requests, ordered=False)
+    return sum(1 for request in requests if isinstance(request, InsertOne))
+
+
+def cmd_migrate_results(handler: Handler, args):
+    quiz_handler = QuizHandler(handler)
+    question_handler = QuestionHandler(handler)
+    stats_handler = StatsHandler(handler)
+    answers = created = 0
+    touched = set()
+
+    # Legacy rows stream in (quiz_id, student_id) order, so a student's rows arrive together and only
+    # one quiz's questions are held at a time. The index spec no longer covers `results`, so the index
+    # that order walks is built here (a no-op if it exists); without it the sort would be a blocking
+    # in-memory sort over the whole collection. It goes with the collection once it is emptied. Each
+    # batch is deleted once it is folded into the attempts, so an interrupted run is resumed by
+    # running it again.
+    handler.results.create_index([('quiz_id', 1), ('student_id', 1)], name='quiz_id_student_id')
+    rows = handler.results.find({}, {'_id': 1, 'attempt_id': 1, 'quiz_id': 1, 'student_id': 1, 'question_id': 1, 'option_id': 1, 'marks': 1, 'correct': 1, 'created_on': 1})
+    rows = rows.sort([('quiz_id', 1), ('student_id', 1)]).batch_size(args.batch_size)
+    quiz_id, questions, groups, row_ids = None, [], {}, []
+
+    def flush():
+        nonlocal created, answers
+        if groups:
+            created += migrate_quiz_results(handler, quiz_id, questions, groups)
+            handler.results.delete_many({'_id': {'$in': row_ids}})
+            answers += len(row_ids)
+            touched.add(quiz_id)
+            print(f"{quiz_id}: {answers} answers migrated")
+        groups.clear()
+        row_ids.clear()
+
+    for (row_quiz_id, student_id), student_rows in groupby(rows, key=itemgetter('quiz_id', 'student_id')):
+        if row_quiz_id != quiz_id or len(row_ids) >= args.batch_size:
+            flush()
+        if row_quiz_id != quiz_id:
+            quiz_id = row_quiz_id
+            questions = question_handler.get_questions(quiz_handler.get_quiz_questions(quiz_id))
+        student_rows = list(student_rows)
+        groups[student_id] = student_rows
+        row_ids.extend(row['_id'] for row in student_rows)
+    flush()
+
+    for touched_quiz_id in touched:
+        stats_handler.rebuild_quiz_stats(touched_quiz_id)
+    if not handler.results.estimated_document_count():
+        handler.db.drop_collection('results')
+    print(f"Migrated {answers} answers into attempts ({created} attempts created) across {len(touched)} quizzes")
+
+
+def cmd_rebuild_stats(handler: Handler, args):
+    stats_handler = StatsHandler(handler)
+    quiz_ids = args.quiz or handler.attempts.distinct('quiz_id')
+    for quiz_id in quiz_ids:
+        attempts = stats_handler.rebuild_quiz_stats(quiz_id)
+        print(f"{quiz_id}: {attempts} attempts")
+    print(f"Rebuilt stats for {len(quiz_ids)} quizzes")
+
+
+def cmd_regrade(handler: Handler, args):
+    regrade_handler = RegradeHandler(handler)
+    question_ids = args.question or QuizHandler(handler).get_quiz_questions(args.quiz)
+    job_id = regrade_handler.create_job(args.quiz, question_ids)
+    regrade_handler.run_job(job_id)
+    job = regrade_handler.get_job(job_id)
+    print(f"{job['status']}: {job['changed']} of {job['processed']} answers regraded" + (f" ({job['error']})" if job['error'] else ""))
+
+
+def cmd_encode_answers(handler: Handler, args):
+    quiz_handler = QuizHandler(handler)
+    regrade_handler = RegradeHandler(handler)
+
+    # Answers stored before multi-select hold a single `option_id`; they are given `option_ids`, then the
+    # quiz is regraded, which encodes their masks against the current option order
+    legacy = {'answers.option_id': {'$exists': True}}
+    quiz_ids = handler.attempts.distinct('quiz_id', legacy)
+    for quiz_id in quiz_ids:
+        attempts = handler.attempts.find({'quiz_id': quiz_id, **legacy}, {'_id': 0, 'attempt_id': 1, 'answers': 1})
+        for batch in batches(attempts, args.batch_size):
+            handler.attempts.bulk_write([
+                UpdateOne({'attempt_id': attempt['attempt_id']}, {'$set': {'answers': [
+                    {
+                        'question_id': answer['question_id'],
+                        'option_ids': answer.get('option_ids') or ([answer['option_id']] if answer.get('option_id') else []),
+                        'mask': answer.get('mask', 0),
+                        'marks': answer.get('marks', 0.0),
+                        'correct': answer.get('correct', False)
+                    }
+                    for answer in attempt['answers']
+                ]}})
+                for attempt in batch
+            ], ordered=False)
+        result = regrade_handler.regrade(quiz_id, quiz_handler.get_quiz_questions(quiz_id), batch_size=args.batch_size)
+        print(f"{quiz_id}: {result['processed']} attempts encoded")
+    print(f"Encoded answers of {len(quiz_ids)} quizzes")
+
+
+def cmd_backfill_question_bank(handler: Handler, args):
+    # Questions stored before the question bank get their content hash, near-duplicate signature and
+    # searchable option texts
+    questions = handler.questions.find(
+        {'$or': [{'content_hash': {'$in': [None, '']}}, {'minhash': None}]},
+        {'_id': 0, 'question_id': 1, 'type': 1, 'marks': 1, 'data': 1, 'created_by': 1}
+    )
+    count = 0
+    for batch in batches(questions, args.batch_size):
+        handler.questions.bulk_write([
+            UpdateOne({'question_id': question['question_id']}, {'$set': bank_fields(question)}) for question in batch
+        ], ordered=False)
+        # Running workers rebuild these teachers' near-duplicate indexes with the new signatures
+        handler.teachers.update_many({'teacher_id': {'$in': list({question.get('created_by') for question in batch})}}, BUMP_BANK_VERSION)
+        count += len(batch)
+        print(f"{count} questions indexed")
+    print(f"Backfilled {count} questions")
+
+
+def cmd_migrate_class_rosters(handler: Handler, args):
+    student_handler = StudentHandler(handler)
+    updates, unknown = [], 0
+
+    # Classes created before student_ids keep the raw usernames in `students`
+    for class_ in handler.classes.find({'students': {'$exists': True}}, {'_id': 0, 'class_id': 1, 'students': 1, 'student_ids': 1}):
+        student_ids, missing = student_handler.resolve_roster([str(entry).strip() for entry in class_['students'] or []])
+        unknown += len(missing)
+        updates.append(UpdateOne(
+            {'class_id': class_['class_id']},
+            {'$set': {'student_ids': list(dict.fromkeys((class_.get('student_ids') or []) + student_ids))}, '$unset': {'students': ''}}
+        ))
+
+    if updates:
+        handler.classes.bulk_write(updates, ordered=False)
+    print(f"Migrated {len(updates)} classes, dropped {unknown} unknown entries")
+
+
+def cmd_normalize_emails(handler: Handler, args):
+    # Accounts registered before emails were stored lowercased. An address that another account
+    # already holds in lowercase is reported and left as it is
+    for collection in (handler.students, handler.teachers):
+        updated, conflicts = 0, []
+        for user in collection.find({'email': {'$regex': '[A-Z]'}}, {'_id': 1, 'email': 1}):
+            try:
+                collection.update_one({'_id': user['_id']}, {'$set': {'email': normalize_email(user['email'])}})
+                updated += 1
+            except DuplicateKeyError:
+                conflicts.append(user['email'])
+        print(f"{collection.name}: normalized {updated} emails")
+        for email in conflicts:
+            print(f"    {email} left unchanged: {normalize_email(email)} belongs to another account")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="QuizMaster database maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    indexes = commands.add_parser("indexes", help="create missing indexes")
+    indexes.add_argument("--force", action="store_true", help="re-apply even if the stored version is current")
+    indexes.set_defaults(func=cmd_indexes)
+
+    report = commands.add_parser("index-report", help="list missing, extra and unused indexes")
+    report.set_defaults(func=cmd_index_report)
+
+    migrate = commands.add_parser("migrate-results", help="fold legacy per-answer result rows into their attempts")
+    migrate.add_argument("--batch-size", type=int, default=1000, help="answers per write batch")
+    migrate.set_defaults(func=cmd_migrate_results)
+
+    encode = commands.add_parser("encode-answers", help="convert single option_id answers to option_ids and masks")
+    encode.add_argument("--batch-size", type=int, default=1000, help="attempts per write batch")
+    encode.set_defaults(func=cmd_encode_answers)
+
+    stats = commands.add_parser("rebuild-stats", help="recompute quiz_stats documents from the graded results")
+    stats.add_argument("--quiz", action="append", metavar="QUIZ_ID", help="only this quiz (repeatable); default is every attempted quiz")
+    stats.set_defaults(func=cmd_rebuild_stats)
+
+    regrade = commands.add_parser("regrade", help="regrade stored answers against the current answer key")
+    regrade.add_argument("--quiz", required=True, metavar="QUIZ_ID")
+    regrade.add_argument("--question", action="append", metavar="QUESTION_ID", help="only this question (repeatable); default is every question")
+    regrade.set_defaults(func=cmd_regrade)
+
+    bank = commands.add_parser("backfill-question-bank", help="add content hashes, near-duplicate signatures and option texts to questions stored without them")
+    bank.add_argument("--batch-size", type=int, default=1000, help="questions per write batch")
+    bank.set_defaults(func=cmd_backfill_question_bank)
+
+    rosters = commands.add_parser("migrate-class-rosters", help="convert legacy class username lists to student_ids")
+    rosters.set_defaults(func=cmd_migrate_class_rosters)
+
+    emails = commands.add_parser("normalize-emails", help="lowercase student and teacher emails stored before emails were case-insensitive")
+    emails.set_defaults(func=cmd_normalize_emails)
+
+    args = parser.parse_args()
+    handler = Handler()
+    try:
+        args.func(handler, args)
+    finally:
+        handler.close()
+
+
+if __name__ == "__main__":
+    main()
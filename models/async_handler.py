@@ -0,0 +1,166 @@
+import asyncio
+from pymongo.errors import DuplicateKeyError
+from .backends import Backend, get_backend
+from .connection import MONGO_DB, MONGO_URI
+from .handler import (
+    AlreadyExists, CLASS_LIST, USER_PUBLIC, session_cache, quiz_payload_cache, quiz_payload_key,
+    cache_quiz_payloads, order_by_ids, student_class_quiz_list_pipeline, quiz_stats_update
+)
+from .models import Attempt
+from .pagination import PAGE_SIZE, keyset_match, keyset_sort, split_page
+from utils import generate_uuid
+
+# Async counterparts of the handlers on the student hot path (quiz view, submit, class list).
+# They share the caches, projections and pipelines of models.handler, so both stacks stay in step.
+
+class AsyncHandler:
+    def __init__(self, uri: str | None = None, db_name: str | None = None, backend: Backend | None = None):
+        self.uri = uri or MONGO_URI
+        self.db_name = db_name or MONGO_DB
+        self.backend = backend or get_backend(self.uri)
+
+    @property
+    def db(self):
+        return self.backend.async_database(self.db_name)
+
+    @property
+    def teachers(self):
+        return self.db['teachers']
+
+    @property
+    def students(self):
+        return self.db['students']
+
+    @property
+    def classes(self):
+        return self.db['classes']
+
+    @property
+    def quizzes(self):
+        return self.db['quizzes']
+
+    @property
+    def questions(self):
+        return self.db['questions']
+
+    @property
+    def attempts(self):
+        return self.db['attempts']
+
+    @property
+    def sessions(self):
+        return self.db['sessions']
+
+    @property
+    def quiz_stats(self):
+        return self.db['quiz_stats']
+
+    async def close(self):
+        await self.backend.aclose()
+
+
+class AsyncSessionHandler:
+    def __init__(self, handler: AsyncHandler):
+        self.handler = handler
+
+    async def verify_session(self, session_id: str, user_id: str, ip_address: str, user_type: str):
+        cached = session_cache.get(session_id)
+        if cached and cached[:3] == (user_id, ip_address, user_type):
+            return cached[3]
+
+        if user_type == 'teacher':
+            collection, id_field = self.handler.teachers, 'teacher_id'
+        elif user_type == 'student':
+            collection, id_field = self.handler.students, 'student_id'
+        else:
+            return None
+
+        # The session check and the user lookup are independent, so they go out together
+        session, user = await asyncio.gather(
+            self.handler.sessions.find_one({'session_id': session_id, 'user_id': user_id, 'ip_address': ip_address}, {'_id': 1}),
+            collection.find_one({id_field: user_id}, USER_PUBLIC)
+        )
+        if not session or not user:
+            return None
+        session_cache.set(session_id, (user_id, ip_address, user_type, user))
+        return user
+
+
+class AsyncClassHandler:
+    def __init__(self, handler: AsyncHandler):
+        self.handler = handler
+
+    @property
+    def collection(self):
+        return self.handler.classes
+
+    async def get_class(self, class_id: str, projection: dict | None = None):
+        return await self.collection.find_one({'class_id': class_id}, projection)
+
+    async def get_student_class_list(self, student_id: str, after: str | None = None, limit: int = PAGE_SIZE, projection: dict | None = CLASS_LIST):
+        cursor = self.collection.find(
+            {'student_ids': student_id, **keyset_match(after, 'created_on', 'class_id')}, projection
+        ).sort(list(keyset_sort('created_on', 'class_id').items())).limit(limit + 1)
+        return split_page(await cursor.to_list(None), limit, 'created_on', 'class_id')
+
+
+class AsyncQuizHandler:
+    def __init__(self, handler: AsyncHandler):
+        self.handler = handler
+
+    @property
+    def collection(self):
+        return self.handler.quizzes
+
+    async def get_quiz(self, quiz_id: str, projection: dict | None = None):
+        return await self.collection.find_one({'quiz_id': quiz_id}, projection)
+
+    async def get_quiz_payload(self, quiz_id: str, include_answers: bool = False):
+        quiz = await self.get_quiz(quiz_id)
+        if not quiz:
+            return None
+        if (payload := quiz_payload_cache.get(quiz_payload_key(quiz, include_answers))) is not None:
+            return payload
+        question_ids = quiz.get('question_ids', [])
+        cursor = self.handler.questions.find({'question_id': {'$in': question_ids}}, {'minhash': 0})
+        questions = order_by_ids(await cursor.to_list(None), question_ids, 'question_id')
+        return cache_quiz_payloads(quiz, questions, include_answers)
+
+    async def get_student_class_quiz_list(self, student_id: str, class_id: str, after: str | None = None, limit: int = PAGE_SIZE):
+        cursor = await self.collection.aggregate(student_class_quiz_list_pipeline(student_id, class_id, after, limit))
+        return split_page(await cursor.to_list(None), limit, 'created_on', 'quiz_id')
+
+
+class AsyncAttemptHandler:
+    def __init__(self, handler: AsyncHandler):
+        self.handler = handler
+
+    @property
+    def collection(self):
+        return self.handler.attempts
+
+    async def create_attempt(self, attempt: Attempt):
+        attempt.attempt_id = attempt.attempt_id or generate_uuid()
+        try:
+            await self.collection.insert_one(attempt.model_dump())
+        except DuplicateKeyError:
+            raise AlreadyExists('attempt')
+        return attempt.attempt_id
+
+    async def get_attempt(self, student_id: str, quiz_id: str, projection: dict | None = None):
+        return await self.collection.find_one({'student_id': student_id, 'quiz_id': quiz_id}, projection)
+
+    async def get_attempt_with_answers(self, student_id: str, quiz_id: str):
+        return await self.collection.find_one({'quiz_id': quiz_id, 'student_id': student_id}, {'_id': 0})
+
+
+class AsyncStatsHandler:
+    def __init__(self, handler: AsyncHandler):
+        self.handler = handler
+
+    @property
+    def collection(self):
+        return self.handler.quiz_stats
+
+    async def record_attempt(self, quiz_id: str, grade: dict):
+        return await self.collection.update_one({'quiz_id': quiz_id}, quiz_stats_update(grade), upsert=True)
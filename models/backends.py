@@ -0,0 +1,101 @@
+import threading
+from .connection import MONGO_URI, close_async_client, close_client, get_async_client, get_client, pool_stats
+from .memory import AsyncMemoryDatabase, MemoryDatabase
+
+
+MEMORY_SCHEME = 'memory://'
+
+
+class Backend:
+    """
+    Storage behind the handlers. `database(name)` returns an object that hands out
+    pymongo-compatible collections with `db[name]`; `async_database(name)` does the
+    same with the pymongo async API.
+    """
+
+    def database(self, name: str):
+        raise NotImplementedError
+
+    def async_database(self, name: str):
+        raise NotImplementedError
+
+    def pool_stats(self) -> dict:
+        return {}
+
+    def close(self):
+        pass
+
+    async def aclose(self):
+        pass
+
+
+class MongoBackend(Backend):
+    """MongoDB through the shared, per-process MongoClient for `uri`."""
+
+    def __init__(self, uri: str | None = None):
+        self.uri = uri or MONGO_URI
+
+    def database(self, name: str):
+        return get_client(self.uri)[name]
+
+    def async_database(self, name: str):
+        return get_async_client(self.uri)[name]
+
+    def pool_stats(self) -> dict:
+        return pool_stats().get(self.uri, {})
+
+    def close(self):
+        close_client(self.uri)
+
+    async def aclose(self):
+        await close_async_client(self.uri)
+
+
+class MemoryBackend(Backend):
+    """
+    Process-local in-memory engine (see models.memory). Data lives as long as the
+    backend object, and is not shared between prefork workers.
+    """
+
+    def __init__(self):
+        self._databases = {}
+        self._lock = threading.Lock()
+
+    def database(self, name: str) -> MemoryDatabase:
+        database = self._databases.get(name)
+        if database is None:
+            with self._lock:
+                database = self._databases.setdefault(name, MemoryDatabase(name))
+        return database
+
+    def async_database(self, name: str) -> AsyncMemoryDatabase:
+        return AsyncMemoryDatabase(self.database(name))
+
+    def clear(self):
+        with self._lock:
+            self._databases.clear()
+
+
+# Handlers created with the same memory:// URI share one backend, the same way Mongo
+# URIs share one client.
+_memory_backends: dict[str, MemoryBackend] = {}
+_lock = threading.Lock()
+
+
+def get_backend(uri: str | None = None) -> Backend:
+    """
+    Pick the backend for a connection URI.
+
+    Args:
+        uri: A mongodb:// URI, or memory:// (optionally memory://<name>) for the in-memory engine
+
+    Returns:
+        The Backend instance to use for that URI
+    """
+    uri = uri or MONGO_URI
+    if not uri.startswith(MEMORY_SCHEME):
+        return MongoBackend(uri)
+    with _lock:
+        if uri not in _memory_backends:
+            _memory_backends[uri] = MemoryBackend()
+        return _memory_backends[uri]
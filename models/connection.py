@@ -0,0 +1,160 @@
+import os
+import threading
+from pymongo import AsyncMongoClient, MongoClient, monitoring
+
+
+# Connection settings, overridable through the environment
+MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017")
+MONGO_DB = os.environ.get("MONGO_DB", "database")
+
+
+def client_options() -> dict:
+    """
+    Build the MongoClient pool and timeout options from the environment.
+
+    Returns:
+        Keyword arguments for MongoClient
+    """
+    options = {
+        "maxPoolSize": int(os.environ.get("MONGO_MAX_POOL_SIZE", 100)),
+        "minPoolSize": int(os.environ.get("MONGO_MIN_POOL_SIZE", 0)),
+        "maxIdleTimeMS": int(os.environ.get("MONGO_MAX_IDLE_TIME_MS", 60000)),
+        "connectTimeoutMS": int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", 5000)),
+        "serverSelectionTimeoutMS": int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)),
+        "waitQueueTimeoutMS": int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", 10000)),
+    }
+    if socket_timeout := os.environ.get("MONGO_SOCKET_TIMEOUT_MS"):
+        options["socketTimeoutMS"] = int(socket_timeout)
+    # e.g. "zstd,snappy,zlib"; zstd and snappy need the zstandard / python-snappy packages
+    if compressors := os.environ.get("MONGO_COMPRESSORS"):
+        options["compressors"] = compressors
+    return options
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Counts connection pool events for one client."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.created = 0
+        self.closed = 0
+        self.checked_out = 0
+        self.checked_in = 0
+        self.checkout_failed = 0
+        self.pools_cleared = 0
+
+    def _inc(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._inc("pools_cleared")
+
+    def connection_created(self, event):
+        self._inc("created")
+
+    def connection_closed(self, event):
+        self._inc("closed")
+
+    def connection_checked_out(self, event):
+        self._inc("checked_out")
+
+    def connection_checked_in(self, event):
+        self._inc("checked_in")
+
+    def connection_check_out_failed(self, event):
+        self._inc("checkout_failed")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "open": self.created - self.closed,
+                "in_use": self.checked_out - self.checked_in,
+                "created": self.created,
+                "closed": self.closed,
+                "checked_out": self.checked_out,
+                "checkout_failed": self.checkout_failed,
+                "pools_cleared": self.pools_cleared,
+            }
+
+
+# One client per URI per process. Clients are created on first use and dropped in forked
+# children, so a prefork server never shares sockets between workers.
+_clients: dict[str, tuple[MongoClient, PoolStats]] = {}
+_async_clients: dict[str, tuple[AsyncMongoClient, PoolStats]] = {}
+_lock = threading.Lock()
+
+
+def get_client(uri: str | None = None) -> MongoClient:
+    uri = uri or MONGO_URI
+    entry = _clients.get(uri)
+    if entry is None:
+        with _lock:
+            entry = _clients.get(uri)
+            if entry is None:
+                stats = PoolStats()
+                client = MongoClient(uri, connect=False, event_listeners=[stats], **client_options())
+                entry = _clients[uri] = (client, stats)
+    return entry[0]
+
+
+def close_client(uri: str | None = None):
+    with _lock:
+        entry = _clients.pop(uri or MONGO_URI, None)
+    if entry:
+        entry[0].close()
+
+
+def get_async_client(uri: str | None = None) -> AsyncMongoClient:
+    # AsyncMongoClient binds to the event loop it is first used on; the ASGI server runs one loop per process
+    uri = uri or MONGO_URI
+    entry = _async_clients.get(uri)
+    if entry is None:
+        with _lock:
+            entry = _async_clients.get(uri)
+            if entry is None:
+                stats = PoolStats()
+                client = AsyncMongoClient(uri, connect=False, event_listeners=[stats], **client_options())
+                entry = _async_clients[uri] = (client, stats)
+    return entry[0]
+
+
+async def close_async_client(uri: str | None = None):
+    with _lock:
+        entry = _async_clients.pop(uri or MONGO_URI, None)
+    if entry:
+        await entry[0].close()
+
+
+def pool_stats() -> dict:
+    stats = {uri: stats.snapshot() for uri, (_, stats) in list(_clients.items())}
+    for uri, (_, async_stats) in list(_async_clients.items()):
+        stats[f"{uri} (async)"] = async_stats.snapshot()
+    return stats
+
+
+def _reset_after_fork():
+    global _lock
+    # The parent's clients (and their sockets and monitor threads) are not usable in the child
+    _lock = threading.Lock()
+    _clients.clear()
+    _async_clients.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,183 @@
+from typing import Dict, Iterable, List, Tuple
+import numpy as np
+
+
+def option_ids(question: dict) -> List[str]:
+    """
+    The answer choices of a question, in display order.
+    """
+    if question.get('type') == 'trueorfalse':
+        return ['true', 'false']
+    return list((question.get('data') or {}).get('options', {}))
+
+
+def selected_options(question: dict, values: Iterable[str]) -> List[str]:
+    """
+    The submitted values that are options of the question, in option order.
+    """
+    values = set(values)
+    return [option_id for option_id in option_ids(question) if option_id in values]
+
+
+def option_bits(question: dict) -> Dict[str, int]:
+    """
+    Bit of each answer choice in a question's masks: the n-th option in display
+    order is bit n, so a key or a selection is an int with one bit per option.
+    """
+    return {option_id: 1 << i for i, option_id in enumerate(option_ids(question))}
+
+
+def selection_mask(question: dict, selected: Iterable[str]) -> int:
+    """
+    Encode selected option ids as a mask; ids that are not options of the question are ignored.
+    """
+    bits = option_bits(question)
+    mask = 0
+    for option_id in selected:
+        mask |= bits.get(option_id, 0)
+    return mask
+
+
+def key_mask(question: dict) -> int:
+    """
+    The question's answer key as a mask ('true'/'false' are the options of a trueorfalse question).
+    """
+    data = question.get('data') or {}
+    if question.get('type') == 'trueorfalse':
+        return selection_mask(question, ['true' if data.get('answer') else 'false'])
+    if question.get('type') == 'mcq':
+        return selection_mask(question, data.get('correct_options', []))
+    return 0
+
+
+# Set bits of every byte value, for NumPy < 2.0, which has no bitwise_count
+_BYTE_BITS = np.array([bin(i).count('1') for i in range(256)], dtype=np.int64)
+
+
+def _popcount_table(masks: np.ndarray) -> np.ndarray:
+    masks = np.asarray(masks, dtype=np.int64)
+    flat = np.ascontiguousarray(masks.reshape(-1))
+    return _BYTE_BITS[flat.view(np.uint8)].reshape(masks.shape + (8,)).sum(axis=-1)
+
+
+def popcount(masks: np.ndarray) -> np.ndarray:
+    """
+    Set bits of each (non-negative) mask, as int64.
+    """
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(masks).astype(np.int64)
+    return _popcount_table(masks)
+
+
+def answer_keys(questions: List[dict]) -> dict:
+    """
+    A quiz's answer keys as arrays, one column per question, for grade_masks.
+
+    Returns:
+        Dictionary with the `columns` index (question_id -> column), the `bits` of
+        each question's options, and the `keys` masks, `marks` and `partial` credit
+        flags as arrays in column order
+    """
+    return {
+        'columns': {question['question_id']: i for i, question in enumerate(questions)},
+        'bits': [option_bits(question) for question in questions],
+        'keys': np.array([key_mask(question) for question in questions], dtype=np.int64),
+        'marks': np.array([float(question.get('marks', 0)) for question in questions], dtype=np.float64),
+        'partial': np.array([bool((question.get('data') or {}).get('partial_credit')) for question in questions], dtype=bool)
+    }
+
+
+def grade_masks(keys: dict, columns: np.ndarray, responses: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Grade any number of responses at once.
+
+    A response is correct when it selects exactly the key's options. Questions
+    with partial credit earn their marks in proportion to correct selections minus
+    wrong ones, out of the key's option count and never below zero, so guessing
+    every option earns nothing; other questions are all or nothing. A
+    single-answer key grades the same either way.
+
+    Args:
+        keys: The quiz's answer_keys
+        columns: Question column of every response
+        responses: Selection mask of every response (0 when unanswered)
+
+    Returns:
+        The marks earned and the correct flags, one per response
+    """
+    key, marks, partial = keys['keys'][columns], keys['marks'][columns], keys['partial'][columns]
+    correct = (responses == key) & (key != 0)
+    hits, wrong = popcount(responses & key), popcount(responses & ~key)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        credit = np.clip((hits - wrong) / popcount(key), 0.0, 1.0)
+    credit = np.where(partial & (key != 0), credit, correct)
+    return marks * credit, correct
+
+
+def grade_answer(question: dict, selected: List[str]) -> dict:
+    """
+    Grade one question of a submission.
+
+    Returns:
+        Dictionary with the selection `mask`, the `marks` earned and whether the
+        answer is `correct`
+    """
+    mask = selection_mask(question, selected)
+    marks, correct = grade_masks(answer_keys([question]), np.zeros(1, dtype=np.intp), np.array([mask], dtype=np.int64))
+    return {'mask': mask, 'marks': float(marks[0]), 'correct': bool(correct[0])}
+
+
+def summarize_answers(answers: List[dict], questions: List[dict]) -> dict:
+    """
+    An attempt's summary fields, recomputed from its graded answers.
+
+    Only the quiz's current questions count: answers to removed questions are
+    ignored, and questions added after the attempt (so never answered) do not
+    count towards its max_score.
+
+    Args:
+        answers: The attempt's graded answers (`question_id`, `marks`, `correct`)
+        questions: The quiz's current question documents
+
+    Returns:
+        Dictionary with `score`, `max_score`, `correct_count` and `total_questions`
+    """
+    marks = {question['question_id']: float(question.get('marks', 0)) for question in questions}
+    current = [answer for answer in answers if answer['question_id'] in marks]
+    return {
+        'score': sum(answer.get('marks', 0.0) for answer in current),
+        'max_score': sum(marks[answer['question_id']] for answer in current),
+        'correct_count': sum(1 for answer in current if answer.get('correct')),
+        'total_questions': len(current)
+    }
+
+
+def grade_quiz(questions: List[dict], answers: Dict[str, List[str]]) -> dict:
+    """
+    Grade a full submission.
+
+    Args:
+        questions: The quiz's question documents with their answer keys
+        answers: Selected option ids keyed by question_id
+
+    Returns:
+        Dictionary with per-question `mask`, `marks` and `correct` flags plus the
+        attempt's `score`, `max_score`, `correct_count` and `total_questions`
+    """
+    keys = answer_keys(questions)
+    responses = np.array([
+        selection_mask(question, answers.get(question['question_id'], [])) for question in questions
+    ], dtype=np.int64)
+    marks, correct = grade_masks(keys, np.arange(len(questions)), responses)
+    graded = {
+        question['question_id']: {'mask': int(responses[i]), 'marks': float(marks[i]), 'correct': bool(correct[i])}
+        for i, question in enumerate(questions)
+    }
+
+    return {
+        'questions': graded,
+        'score': float(marks.sum()),
+        'max_score': float(keys['marks'].sum()),
+        'correct_count': int(correct.sum()),
+        'total_questions': len(questions)
+    }
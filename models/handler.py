@@ -1,66 +1,256 @@
-from pymongo import MongoClient
-from .models import Student, Teacher, Class, Quiz, Question, Result, Session
-from utils import generate_uuid, hash_password
-from datetime import datetime
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import numpy as np
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from .backends import Backend, get_backend
+from .connection import MONGO_DB, MONGO_URI
+from .grading import answer_keys, grade_masks, summarize_answers
+from .models import Student, Teacher, Class, Quiz, Question, Session, Attempt, RegradeJob
+from .near_duplicates import MinHashIndex
+from .pagination import PAGE_SIZE, keyset_match, keyset_sort, split_page
+from .question_bank import bank_fields
+from .stats import build_stats, stats_delta, stats_increment, summarize_stats
+from utils import generate_uuid, hash_password, normalize_email
+from utils.cache import TTLCache
+from datetime import datetime, timedelta
+
+
+logger = logging.getLogger(__name__)
+
 
 class Handler:
-    def __init__(self):
-        self.client = MongoClient('localhost', 27017)
-        self.db = self.client['database']
-        self.teachers = self.db['teachers']
-        self.students = self.db['students']
-        self.classes = self.db['classes']
-        self.quizzes = self.db['quizzes']
-        self.questions = self.db['questions']
-        self.results = self.db['results']
+    def __init__(self, uri: str | None = None, db_name: str | None = None, backend: Backend | None = None):
+        # Nothing connects here; the shared client is created on first use (and again after a fork).
+        # MONGO_URI=memory:// runs every handler on the in-memory engine instead of MongoDB.
+        self.uri = uri or MONGO_URI
+        self.db_name = db_name or MONGO_DB
+        self.backend = backend or get_backend(self.uri)
+    
+    @property
+    def db(self):
+        return self.backend.database(self.db_name)
+    
+    @property
+    def teachers(self):
+        return self.db['teachers']
+    
+    @property
+    def students(self):
+        return self.db['students']
+    
+    @property
+    def classes(self):
+        return self.db['classes']
+    
+    @property
+    def quizzes(self):
+        return self.db['quizzes']
+    
+    @property
+    def questions(self):
+        return self.db['questions']
+    
+    @property
+    def results(self):
+        # Legacy one-row-per-answer collection, only read by `manage.py migrate-results`
+        return self.db['results']
+    
+    @property
+    def attempts(self):
+        return self.db['attempts']
+    
+    @property
+    def sessions(self):
+        return self.db['sessions']
+    
+    @property
+    def quiz_stats(self):
+        return self.db['quiz_stats']
+    
+    @property
+    def regrade_jobs(self):
+        return self.db['regrade_jobs']
+    
+    @property
+    def regrade_locks(self):
+        return self.db['regrade_locks']
+    
+    def pool_stats(self):
+        return self.backend.pool_stats()
     
     def close(self):
-        self.client.close()
-        self.db.close()
+        self.backend.close()
+
+
+class AlreadyExists(Exception):
+    def __init__(self, field: str):
+        super().__init__(f'{field.capitalize()} already exists')
+        self.field = field
+
+
+# Assembled quiz payloads keyed by (quiz_id, version, include_answers). The version is a counter
+# in the quiz document that every write to the quiz or its questions increments after writing, and
+# the quiz document is read on every request, so an edit is seen by all processes at once.
+quiz_payload_cache = TTLCache(maxsize=512, ttl=300)
+
+
+# Verified sessions keyed by session_id -> (user_id, ip_address, user_type, slim user record).
+# Kept short so a session deleted by another worker stops working within seconds.
+session_cache = TTLCache(maxsize=10000, ttl=30)
+
+# teacher_id -> (bank_version, MinHashIndex of the teacher's question bank; see models.near_duplicates).
+# Every write to a teacher's questions increments bank_version in their teacher document afterwards,
+# and an index is only used while the stored version is the one it was built at, so other processes
+# rebuild after a write. Bounded by indexed rows (~0.8 KB each), not by teachers.
+near_duplicate_cache = TTLCache(maxsize=200_000, ttl=1800, weigh=lambda entry: entry[1].capacity)
+
+
+# Merged into quiz updates; see quiz_payload_cache
+BUMP_VERSION = {'$inc': {'version': 1}}
+
+# Applied to teacher documents after their questions are written; see near_duplicate_cache
+BUMP_BANK_VERSION = {'$inc': {'bank_version': 1}}
+
+
+def strip_answers(question: dict) -> dict:
+    data = {k: v for k, v in question.get('data', {}).items() if k not in ('correct_options', 'answer')}
+    if question.get('type') == 'mcq':
+        # Students see checkboxes when more than one option is correct, without learning which
+        data['multiple'] = len(question.get('data', {}).get('correct_options', [])) > 1
+    return {**question, 'data': data}
+
+
+def quiz_payload_key(quiz: dict, include_answers: bool) -> tuple:
+    return (quiz['quiz_id'], quiz.get('version', 0), include_answers)
+
+
+def cache_quiz_payloads(quiz: dict, questions: list, include_answers: bool) -> dict:
+    # Both variants come from the same read, so whichever is asked for next is already cached
+    payload = {'quiz': quiz, 'questions': questions}
+    stripped = {'quiz': quiz, 'questions': [strip_answers(q) for q in questions]}
+    quiz_payload_cache.set(quiz_payload_key(quiz, True), payload)
+    quiz_payload_cache.set(quiz_payload_key(quiz, False), stripped)
+    return payload if include_answers else stripped
+
+
+def order_by_ids(docs, ids: list, id_field: str) -> list:
+    found = {doc[id_field]: doc for doc in docs}
+    return [found[i] for i in ids if i in found]
+
+
+# Default projections for hot paths: never ship the password hash or the ObjectId around
+USER_PUBLIC = {'_id': 0, 'password': 0}
+USER_PASSWORD = {'_id': 0, 'password': 1}
+CLASS_LIST = {'_id': 0, 'class_id': 1, 'name': 1, 'created_on': 1}
+
+
+def duplicate_field(error: DuplicateKeyError) -> str:
+    key_pattern = (error.details or {}).get('keyPattern') or {}
+    return next(iter(key_pattern), 'record')
+
+
+def quiz_stats_update(grade: dict) -> dict:
+    # Counters only ever grow, so concurrent submissions can upsert the same document safely
+    return {
+        '$inc': stats_increment(grade),
+        '$set': {'max_score': grade['max_score'], 'updated_on': datetime.now()}
+    }
+
+
+def student_class_quiz_list_pipeline(student_id: str, class_id: str, after: str | None = None, limit: int = PAGE_SIZE) -> list:
+    # One page plus one row, so split_page can tell whether another page follows
+    return [
+        {'$match': {'class_id': class_id, 'excluded_student_ids': {'$ne': student_id}, **keyset_match(after, 'created_on', 'quiz_id')}},
+        {'$sort': keyset_sort('created_on', 'quiz_id')},
+        {'$limit': limit + 1},
+        {'$lookup': {
+            'from': 'attempts',
+            'localField': 'quiz_id',
+            'foreignField': 'quiz_id',
+            'pipeline': [
+                {'$match': {'student_id': student_id}},
+                {'$project': {'_id': 0, 'score': 1, 'max_score': 1, 'submitted_on': 1}}
+            ],
+            'as': 'attempts'
+        }},
+        {'$project': {
+            '_id': 0,
+            'quiz_id': 1,
+            'title': 1,
+            'description': 1,
+            'created_on': 1,
+            'attended': {'$gt': [{'$size': '$attempts'}, 0]},
+            'attempt': {'$arrayElemAt': ['$attempts', 0]}
+        }}
+    ]
 
 
 class StudentHandler:
     def __init__(self, handler: Handler):
         self.handler = handler
-        self.collection = handler.students
+    
+    @property
+    def collection(self):
+        return self.handler.students
     
     def student_id_exists(self, student_id: str) -> bool:
-        return bool(self.collection.find_one({'student_id': student_id}))
+        return bool(self.collection.find_one({'student_id': student_id}, {'_id': 1}))
     
     def student_username_exists(self, username: str):
-        return bool(self.collection.find_one({'username': username}))
+        return bool(self.collection.find_one({'username': username}, {'_id': 1}))
     
     def student_email_exists(self, email: str):
-        return bool(self.collection.find_one({'email': email}))
-    
-    def get_student(self, student_id: str):
-        return self.collection.find_one({'student_id': student_id})
-    
-    def get_student_from_username(self, username: str):
-        return self.collection.find_one({'username': username})
-    
-    def get_student_from_email(self, email: str):
-        return self.collection.find_one({'email': email})
+        return bool(self.collection.find_one({'email': normalize_email(email)}, {'_id': 1}))
+    
+    def get_student(self, student_id: str, projection: dict | None = USER_PUBLIC):
+        return self.collection.find_one({'student_id': student_id}, projection)
+    
+    def get_student_from_username(self, username: str, projection: dict | None = USER_PUBLIC):
+        return self.collection.find_one({'username': username}, projection)
+    
+    def get_student_from_email(self, email: str, projection: dict | None = USER_PUBLIC):
+        return self.collection.find_one({'email': normalize_email(email)}, projection)
+    
+    def get_students(self, student_ids: list, projection: dict | None = USER_PUBLIC):
+        return self.collection.find({'student_id': {'$in': list(student_ids)}}, projection)
+    
+    def resolve_roster(self, entries: list):
+        # Usernames and emails resolved together in one query; returns (student_ids, unknown entries).
+        # Emails match in any case (they are stored lowercased), usernames exactly
+        if not entries:
+            return [], []
+        usernames, emails = {}, {}
+        for student in self.collection.find(
+            {'$or': [{'username': {'$in': entries}}, {'email': {'$in': list({normalize_email(entry) for entry in entries})}}]},
+            {'_id': 0, 'student_id': 1, 'username': 1, 'email': 1}
+        ):
+            usernames[student['username']] = emails[student['email']] = student['student_id']
+        found = {entry: usernames.get(entry) or emails.get(normalize_email(entry)) for entry in entries}
+        student_ids = list(dict.fromkeys(student_id for student_id in found.values() if student_id))
+        return student_ids, [entry for entry, student_id in found.items() if not student_id]
     
     def create_student(self, student: Student):
         student.student_id = generate_uuid()
         student.created_on = datetime.now()
-        if self.student_username_exists(student.username):
-            raise Exception('Username already exists')
-        student.student_id = generate_uuid()
         student.password = hash_password(student.password)
-        if self.collection.insert_one(student.model_dump()):
-            return student.student_id
-        return None
+        student.email = normalize_email(student.email)
+        try:
+            self.collection.insert_one(student.model_dump())
+        except DuplicateKeyError as e:
+            raise AlreadyExists(duplicate_field(e))
+        return student.student_id
     
     def match_username_password(self, username: str, password: str):
-        student = self.get_student_from_username(username)
+        student = self.get_student_from_username(username, USER_PASSWORD)
         if not student:
             return False
         return student['password'] == hash_password(password)
     
     def match_email_password(self, email: str, password: str):
-        student = self.get_student_from_email(email)
+        student = self.get_student_from_email(email, USER_PASSWORD)
         if not student:
             return False
         return student['password'] == hash_password(password)
@@ -76,48 +266,49 @@ class StudentHandler:
 class TeacherHandler:
     def __init__(self, handler: Handler):
         self.handler = handler
-        self.collection = handler.teachers
+    
+    @property
+    def collection(self):
+        return self.handler.teachers
         
-    def get_teacher(self, teacher_id: str):
-        return self.collection.find_one({'teacher_id': teacher_id})
+    def get_teacher(self, teacher_id: str, projection: dict | None = USER_PUBLIC):
+        return self.collection.find_one({'teacher_id': teacher_id}, projection)
     
     def teacher_username_exists(self, username: str):
-        return bool(self.collection.find_one({'username': username}))
+        return bool(self.collection.find_one({'username': username}, {'_id': 1}))
     
     def teacher_email_exists(self, email: str):
-        return bool(self.collection.find_one({'email': email}))
+        return bool(self.collection.find_one({'email': normalize_email(email)}, {'_id': 1}))
     
     def create_teacher(self, teacher: Teacher):
         teacher.teacher_id = generate_uuid()
         teacher.created_on = datetime.now()
-        if self.teacher_username_exists(teacher.username):
-            raise Exception('Username already exists')
-        if self.teacher_email_exists(teacher.email):
-            raise Exception('Email already exists')
-        teacher.teacher_id = generate_uuid()
         teacher.password = hash_password(teacher.password)
-        if self.collection.insert_one(teacher.model_dump()):
-            return teacher.teacher_id
-        return None
+        teacher.email = normalize_email(teacher.email)
+        try:
+            self.collection.insert_one(teacher.model_dump())
+        except DuplicateKeyError as e:
+            raise AlreadyExists(duplicate_field(e))
+        return teacher.teacher_id
 
     
     def match_username_password(self, username: str, password: str):
-        teacher = self.get_teacher_from_username(username)
+        teacher = self.get_teacher_from_username(username, USER_PASSWORD)
         if not teacher:
             return False
         return teacher['password'] == hash_password(password)
     
     def match_email_password(self, email: str, password: str):
-        teacher = self.get_teacher_from_email(email)
+        teacher = self.get_teacher_from_email(email, USER_PASSWORD)
         if not teacher:
             return False
         return teacher['password'] == hash_password(password)
     
-    def get_teacher_from_username(self, username: str):
-        return self.collection.find_one({'username': username})
+    def get_teacher_from_username(self, username: str, projection: dict | None = USER_PUBLIC):
+        return self.collection.find_one({'username': username}, projection)
     
-    def get_teacher_from_email(self, email: str):
-        return self.collection.find_one({'email': email})
+    def get_teacher_from_email(self, email: str, projection: dict | None = USER_PUBLIC):
+        return self.collection.find_one({'email': normalize_email(email)}, projection)
     
     def change_name(self, teacher_id: str, name: str):
         return self.collection.update_one({'teacher_id': teacher_id}, {'$set': {'name': name}})
@@ -129,10 +320,13 @@ class TeacherHandler:
 class SessionHandler:
     def __init__(self, handler: Handler) -> None:
         self.handler = handler
-        self.sessions = handler.db['sessions']
     
-    def get_session(self, session_id: str) -> Session | None:
-        return self.sessions.find_one({'session_id': session_id})
+    @property
+    def sessions(self):
+        return self.handler.sessions
+    
+    def get_session(self, session_id: str, projection: dict | None = None) -> Session | None:
+        return self.sessions.find_one({'session_id': session_id}, projection)
     
     def get_user_session(self, session_id: str) -> Session | None:
         session = self.get_session(session_id)
@@ -148,19 +342,43 @@ class SessionHandler:
         return None
     
     def check_session(self, session_id: str, user_id, ip_address: str):
-        return bool(self.sessions.find_one({'session_id': session_id, 'user_id': user_id, 'ip_address': ip_address}))
+        return bool(self.sessions.find_one({'session_id': session_id, 'user_id': user_id, 'ip_address': ip_address}, {'_id': 1}))
+    
+    def verify_session(self, session_id: str, user_id: str, ip_address: str, user_type: str):
+        # Returns the user's record without the password hash, or None if the session is invalid
+        cached = session_cache.get(session_id)
+        if cached and cached[:3] == (user_id, ip_address, user_type):
+            return cached[3]
+        
+        if user_type == 'teacher':
+            collection, id_field = self.handler.teachers, 'teacher_id'
+        elif user_type == 'student':
+            collection, id_field = self.handler.students, 'student_id'
+        else:
+            return None
+        
+        if not self.check_session(session_id, user_id, ip_address):
+            return None
+        user = collection.find_one({id_field: user_id}, USER_PUBLIC)
+        if user:
+            session_cache.set(session_id, (user_id, ip_address, user_type, user))
+        return user
     
     def delete_session(self, session_id: str):
+        session_cache.pop(session_id)
         return self.sessions.delete_one({'session_id': session_id})
     
     
 class ClassHandler:
     def __init__(self, handler: Handler):
         self.handler = handler
-        self.collection = handler.classes
     
-    def get_class(self, class_id: str):
-        return self.collection.find_one({'class_id': class_id})
+    @property
+    def collection(self):
+        return self.handler.classes
+    
+    def get_class(self, class_id: str, projection: dict | None = None):
+        return self.collection.find_one({'class_id': class_id}, projection)
     
     def create_class(self, class_: Class):
         class_.class_id = generate_uuid()
@@ -175,11 +393,13 @@ class ClassHandler:
         return self.collection.update_one({'class_id': class_id}, {'$set': {'description': description}})
     
     def add_student_to_class(self, class_id: str, student_id: str):
-        return self.collection.update_one({'class_id': class_id}, {'$push': {'student_ids': student_id}})
+        return self.collection.update_one({'class_id': class_id}, {'$addToSet': {'student_ids': student_id}})
+    
+    def add_students_to_class(self, class_id: str, student_ids: list):
+        return self.collection.update_one({'class_id': class_id}, {'$addToSet': {'student_ids': {'$each': list(student_ids)}}})
     
     def get_class_students(self, class_id: str):
-        if (a := self.collection.find_one({'class_id': class_id})):
-            return a.get('student_ids')
+        return (self.collection.find_one({'class_id': class_id}, {'_id': 0, 'student_ids': 1}) or {}).get('student_ids', [])
     
     def remove_student_from_class(self, class_id: str, student_id: str):
         return self.collection.update_one({'class_id': class_id}, {'$pull': {'student_ids': student_id}})
@@ -189,6 +409,34 @@ class ClassHandler:
     
     def get_teacher_classes(self, teacher_id: str):
         return self.collection.find({'teacher_id': teacher_id}).distinct('class_id')
+    
+    def get_student_class_list(self, student_id: str, after: str | None = None, limit: int = PAGE_SIZE, projection: dict | None = CLASS_LIST):
+        # Dashboard listing: one page of the class documents, newest first; returns (classes, next cursor)
+        cursor = self.collection.find(
+            {'student_ids': student_id, **keyset_match(after, 'created_on', 'class_id')}, projection
+        ).sort(list(keyset_sort('created_on', 'class_id').items())).limit(limit + 1)
+        return split_page(list(cursor), limit, 'created_on', 'class_id')
+    
+    def get_teacher_class_list(self, teacher_id: str, after: str | None = None, limit: int = PAGE_SIZE):
+        # Dashboard listing with per-class student and quiz counts, one page per aggregation;
+        # the counts are only looked up for the classes on the page
+        return split_page(list(self.collection.aggregate([
+            {'$match': {'teacher_id': teacher_id, **keyset_match(after, 'created_on', 'class_id')}},
+            {'$sort': keyset_sort('created_on', 'class_id')},
+            {'$limit': limit + 1},
+            {'$lookup': {
+                'from': 'quizzes',
+                'localField': 'class_id',
+                'foreignField': 'class_id',
+                'pipeline': [{'$project': {'_id': 1}}],
+                'as': 'quizzes'
+            }},
+            {'$project': {
+                **CLASS_LIST,
+                'student_count': {'$size': {'$ifNull': ['$student_ids', []]}},
+                'quiz_count': {'$size': '$quizzes'}
+            }}
+        ])), limit, 'created_on', 'class_id')
 
     def class_delete(self, class_id: str):
         return self.collection.delete_one({'class_id': class_id})
@@ -196,10 +444,27 @@ class ClassHandler:
 class QuizHandler:
     def __init__(self, handler: Handler):
         self.handler = handler
-        self.collection = handler.quizzes
+    
+    @property
+    def collection(self):
+        return self.handler.quizzes
         
-    def get_quiz(self, quiz_id: str):
-        return self.collection.find_one({'quiz_id': quiz_id})
+    def get_quiz(self, quiz_id: str, projection: dict | None = None):
+        return self.collection.find_one({'quiz_id': quiz_id}, projection)
+    
+    def get_quiz_payload(self, quiz_id: str, include_answers: bool = False):
+        # Quiz document plus its ordered questions; students get the variant without the answer key.
+        # The quiz is always read (a point lookup) so the cached questions are those of its current version
+        quiz = self.get_quiz(quiz_id)
+        if not quiz:
+            return None
+        if (payload := quiz_payload_cache.get(quiz_payload_key(quiz, include_answers))) is not None:
+            return payload
+        questions = QuestionHandler(self.handler).get_questions(quiz.get('question_ids', []), {'minhash': 0})
+        return cache_quiz_payloads(quiz, questions, include_answers)
+    
+    def _update(self, quiz_id: str, update: dict):
+        return self.collection.update_one({'quiz_id': quiz_id}, {**update, **BUMP_VERSION})
     
     def create_quiz(self, quiz: Quiz):
         quiz.quiz_id = generate_uuid()
@@ -208,49 +473,70 @@ class QuizHandler:
         return None
     
     def update_quiz(self, quiz_id, data):
-        return self.collection.update_one({'quiz_id': quiz_id}, {'$set': data})
+        return self._update(quiz_id, {'$set': data})
     
     def change_quiz_title(self, quiz_id: str, title: str):
-        return self.collection.update_one({'quiz_id': quiz_id}, {'$set': {'title': title}})
+        return self._update(quiz_id, {'$set': {'title': title}})
     
     def change_quiz_description(self, quiz_id: str, description: str):
-        return self.collection.update_one({'quiz_id': quiz_id}, {'$set': {'description': description}})
+        return self._update(quiz_id, {'$set': {'description': description}})
     
     def add_question_to_quiz(self, quiz_id: str, question_id: str):
-        return self.collection.update_one({'quiz_id': quiz_id}, {'$push': {'question_ids': question_id}})
+        return self._update(quiz_id, {'$push': {'question_ids': question_id}})
     
     def get_quiz_questions(self, quiz_id: str):
-        if (a := self.collection.find_one({'quiz_id': quiz_id})):
-            return a.get('question_ids')
+        if (a := self.collection.find_one({'quiz_id': quiz_id}, {'_id': 0, 'question_ids': 1})):
+            return a.get('question_ids', [])
         else:
             return []
     
+    def get_quizzes_with_questions(self, question_ids: list):
+        if not question_ids:
+            return []
+        return list(self.collection.find({'question_ids': {'$in': list(question_ids)}}, {'_id': 0, 'quiz_id': 1, 'question_ids': 1}))
+    
     def remove_question_from_quiz(self, quiz_id: str, question_id: str):
-        return self.collection.update_one({'quiz_id': quiz_id}, {'$pull': {'question_ids': question_id}})
+        return self._update(quiz_id, {'$pull': {'question_ids': question_id}})
     
     def add_class_to_quiz(self, quiz_id: str, class_id: str):
-        return self.collection.update_one({'quiz_id': quiz_id}, {'$set': {'class_id': class_id}})
+        return self._update(quiz_id, {'$set': {'class_id': class_id}})
     
     def get_quiz_class(self, quiz_id: str):
-        if (a := self.collection.find_one({'quiz_id': quiz_id})):
+        if (a := self.collection.find_one({'quiz_id': quiz_id}, {'_id': 0, 'class_id': 1})):
             return a.get('class_id')
     
     def set_public(self, quiz_id: str, is_public: bool):
-        return self.collection.update_one({'quiz_id': quiz_id}, {'$set': {'is_public': is_public}})
+        return self._update(quiz_id, {'$set': {'is_public': is_public}})
     
     def add_excluded_student_to_quiz(self, quiz_id: str, student_id: str):
-        return self.collection.update_one({'quiz_id': quiz_id}, {'$push': {'excluded_student_ids': student_id}})
+        return self._update(quiz_id, {'$push': {'excluded_student_ids': student_id}})
     
     def get_excluded_students(self, quiz_id: str):
-        if (a := self.collection.find_one({'quiz_id': quiz_id})):
-            return a.get('excluded_student_ids')
+        if (a := self.collection.find_one({'quiz_id': quiz_id}, {'_id': 0, 'excluded_student_ids': 1})):
+            return a.get('excluded_student_ids', [])
         
     def remove_excluded_student_from_quiz(self, quiz_id: str, student_id: str):
-        return self.collection.update_one({'quiz_id': quiz_id}, {'$pull': {'excluded_student_ids': student_id}})
+        return self._update(quiz_id, {'$pull': {'excluded_student_ids': student_id}})
 
     def get_student_class_quizzes(self, student_id: str, class_id: str):
-        return self.collection.find({'class_id': class_id, 'exclude': {'$ne': student_id}}).distinct('quiz_id')
+        return self.collection.find({'class_id': class_id, 'excluded_student_ids': {'$ne': student_id}}).distinct('quiz_id')
+    
+    def get_student_class_quiz_list(self, student_id: str, class_id: str, after: str | None = None, limit: int = PAGE_SIZE):
+        # One page of the quizzes of a class visible to the student, each with the student's attempt status and score
+        docs = list(self.collection.aggregate(student_class_quiz_list_pipeline(student_id, class_id, after, limit)))
+        return split_page(docs, limit, 'created_on', 'quiz_id')
 
+    def get_class_quiz_list(self, class_id: str, projection: dict | None = None):
+        return list(self.collection.find({'class_id': class_id}, projection).sort('created_on', 1))
+    
+    def get_class_quiz_page(self, class_id: str, after: str | None = None, limit: int = PAGE_SIZE, projection: dict | None = None):
+        if projection:
+            projection = {**projection, 'created_on': 1, 'quiz_id': 1}
+        cursor = self.collection.find(
+            {'class_id': class_id, **keyset_match(after, 'created_on', 'quiz_id')}, projection
+        ).sort(list(keyset_sort('created_on', 'quiz_id').items())).limit(limit + 1)
+        return split_page(list(cursor), limit, 'created_on', 'quiz_id')
+    
     def get_teacher_class_quizzes(self, teacher_id: str, class_id: str):
         return self.collection.find({'class_id': class_id, 'teacher_id': teacher_id}).distinct('quiz_id')
 
@@ -258,23 +544,44 @@ class QuizHandler:
 class QuestionHandler:
     def __init__(self, handler: Handler):
         self.handler = handler
-        self.collection = handler.questions
+    
+    @property
+    def collection(self):
+        return self.handler.questions
         
+    def _bump_quizzes(self, question_ids: list):
+        # Called after the questions are written, so a payload cached under the new version is current
+        return self.handler.quizzes.update_many({'question_ids': {'$in': list(question_ids)}}, BUMP_VERSION)
+    
     def update_question(self, question_id: str, data: dict):
-        return self.collection.update_one({'question_id': question_id}, {'$set': data})
+        result = self.collection.update_one({'question_id': question_id}, {'$set': data})
+        self._bump_quizzes([question_id])
+        return result
 
-    def get_question(self, question_id: str):
-        return self.collection.find_one({'question_id': question_id})
+    def get_question(self, question_id: str, projection: dict | None = None):
+        return self.collection.find_one({'question_id': question_id}, projection)
+    
+    def get_questions(self, question_ids: list, projection: dict | None = None):
+        # One $in query, returned in the order of `question_ids` (missing ids are skipped)
+        if not question_ids:
+            return []
+        if projection and any(v for k, v in projection.items() if k != '_id'):
+            # question_id is needed to restore the order
+            projection = {**projection, 'question_id': 1}
+        cursor = self.collection.find({'question_id': {'$in': list(question_ids)}}, projection)
+        return order_by_ids(cursor, question_ids, 'question_id')
     
     def get_question_type(self, question_id: str):
-        if (a := self.collection.find_one({'question_id': question_id})):
+        if (a := self.collection.find_one({'question_id': question_id}, {'_id': 0, 'type': 1})):
             return a.get('type')
     
     def set_question_data(self, question_id: str, data: dict):
-        return self.collection.update_one({'question_id': question_id}, {'$set': {'data': data}})
+        result = self.collection.update_one({'question_id': question_id}, {'$set': {'data': data}})
+        self._bump_quizzes([question_id])
+        return result
 
     def get_question_data(self, question_id: str):
-        if (a := self.collection.find_one({'question_id': question_id})):
+        if (a := self.collection.find_one({'question_id': question_id}, {'_id': 0, 'data': 1})):
             return a.get('data')
         
     def create_question(self, question: Question):
@@ -284,12 +591,148 @@ class QuestionHandler:
         else:
             return False
     
+    def apply_question_diff(self, diff: dict):
+        # A quiz edit's inserts and updates (see models.quiz_diff) go out in one unordered bulk_write.
+        # Removed questions are only detached from the quiz, so the answers given to them are kept.
+        added = [{**question, **bank_fields(question)} for question in diff['added']]
+        changed = [{**question, **bank_fields(question)} for question in diff['changed']]
+        requests = [InsertOne(question) for question in added] + [
+            UpdateOne({'question_id': question['question_id']}, {'$set': {
+                field: question[field] for field in ('type', 'marks', 'data', 'content_hash', 'minhash', 'option_texts')
+            }})
+            for question in changed
+        ]
+        if not requests:
+            return None
+        result = self.collection.bulk_write(requests, ordered=False)
+        self._index_signatures(added + changed)
+        if diff['changed']:
+            self._bump_quizzes([question['question_id'] for question in diff['changed']])
+        return result
+    
+    def find_in_bank(self, teacher_id: str, hashes: list):
+        # content_hash -> question_id of the teacher's stored questions with those hashes
+        if not hashes:
+            return {}
+        cursor = self.collection.find(
+            {'created_by': teacher_id, 'content_hash': {'$in': list(hashes)}},
+            {'_id': 0, 'question_id': 1, 'content_hash': 1}
+        ).sort('created_on', 1)
+        found = {}
+        for question in cursor:
+            found.setdefault(question['content_hash'], question['question_id'])
+        return found
+    
+    def add_questions(self, questions: list):
+        # Bank insert: a question whose normalized content its creator already has is reused (its tags
+        # merged in) instead of stored again. One lookup and one bulk_write for the whole list; returns
+        # the question ids in input order, so duplicates within the list share an id.
+        questions = [{**question, **bank_fields(question)} for question in questions]
+        existing = {}
+        for teacher_id in {question['created_by'] for question in questions}:
+            hashes = [question['content_hash'] for question in questions if question['created_by'] == teacher_id]
+            existing.update({(teacher_id, h): question_id for h, question_id in self.find_in_bank(teacher_id, hashes).items()})
+        
+        question_ids, requests, inserted = [], [], []
+        for question in questions:
+            key = (question['created_by'], question['content_hash'])
+            if key in existing:
+                if question.get('tags'):
+                    requests.append(UpdateOne({'question_id': existing[key]}, {'$addToSet': {'tags': {'$each': question['tags']}}}))
+            else:
+                question['question_id'] = question.get('question_id') or generate_uuid()
+                existing[key] = question['question_id']
+                requests.append(InsertOne(question))
+                inserted.append(question)
+            question_ids.append(existing[key])
+        if requests:
+            self.collection.bulk_write(requests, ordered=False)
+        self._index_signatures(inserted)
+        return question_ids
+    
+    def search_bank(self, teacher_id: str, text: str | None = None, tags: list | None = None,
+                    difficulty: str | None = None, language: str | None = None, type: str | None = None,
+                    after: str | None = None, limit: int = PAGE_SIZE):
+        # One page of the teacher's questions, newest first; `text` matches words of titles and options,
+        # `tags` must all be present
+        query = {'created_by': teacher_id, **keyset_match(after, 'created_on', 'question_id')}
+        if text:
+            query['$text'] = {'$search': text}
+        if tags:
+            query['tags'] = {'$all': list(tags)}
+        for field, value in (('difficulty', difficulty), ('language', language), ('type', type)):
+            if value:
+                query[field] = value
+        cursor = self.collection.find(query, {'_id': 0, 'content_hash': 0, 'minhash': 0, 'option_texts': 0})
+        cursor = cursor.sort(list(keyset_sort('created_on', 'question_id').items())).limit(limit + 1)
+        return split_page(list(cursor), limit, 'created_on', 'question_id')
+    
+    def get_near_duplicate_index(self, teacher_id: str):
+        # The teacher's bank as a MinHashIndex keyed by question_id, rebuilt with one projected read when
+        # the cached one is missing or older than the stored bank_version. The version is read before the
+        # questions, so a write landing during the build costs at most one extra rebuild.
+        version = self._bank_version(teacher_id)
+        if (cached := near_duplicate_cache.get(teacher_id)) is not None and cached[0] == version:
+            return cached[1]
+        index = MinHashIndex()
+        index.update(
+            (question['question_id'], question.get('minhash') or [])
+            for question in self.collection.find({'created_by': teacher_id}, {'_id': 0, 'question_id': 1, 'minhash': 1})
+        )
+        near_duplicate_cache.set(teacher_id, (version, index))
+        return index
+    
+    def _bank_version(self, teacher_id: str) -> int:
+        teacher = self.handler.teachers.find_one({'teacher_id': teacher_id}, {'_id': 0, 'bank_version': 1}) or {}
+        return teacher.get('bank_version', 0)
+    
+    def _index_signatures(self, questions: list):
+        # Called after questions are written (a question without `minhash` is dropped from the index).
+        # Each creator's bank_version is incremented; this process's cached index takes the change in
+        # place if no other write came in between, and is dropped otherwise.
+        signatures = {}
+        for question in questions:
+            if question.get('created_by'):
+                signatures.setdefault(question['created_by'], []).append((question['question_id'], question.get('minhash') or []))
+        for teacher_id, items in signatures.items():
+            self.handler.teachers.update_one({'teacher_id': teacher_id}, BUMP_BANK_VERSION)
+            if (cached := near_duplicate_cache.get(teacher_id)) is None:
+                continue
+            version, index = cached
+            if self._bank_version(teacher_id) == version + 1:
+                index.update(items)
+                near_duplicate_cache.set(teacher_id, (version + 1, index))
+            else:
+                near_duplicate_cache.pop(teacher_id)
+    
+    def attach_to_quiz(self, quiz_id: str, teacher_id: str, question_ids: list):
+        # Adds the teacher's own bank questions to the end of one of their quizzes with a single update
+        # ($addToSet leaves questions already in the quiz where they are); ids that are not theirs are
+        # skipped. Returns the ids that are now in the quiz, or [] if the quiz is not theirs.
+        owned = {
+            question['question_id']
+            for question in self.collection.find({'created_by': teacher_id, 'question_id': {'$in': list(question_ids)}}, {'_id': 0, 'question_id': 1})
+        }
+        question_ids = [question_id for question_id in dict.fromkeys(question_ids) if question_id in owned]
+        if not question_ids:
+            return []
+        result = self.handler.quizzes.update_one(
+            {'quiz_id': quiz_id, 'teacher_id': teacher_id},
+            {'$addToSet': {'question_ids': {'$each': question_ids}}, **BUMP_VERSION}
+        )
+        return question_ids if result.matched_count else []
+    
     def delete_question(self, question_id: str):
-        return self.collection.delete_one({'question_id': question_id})
+        question = self.get_question(question_id, {'_id': 0, 'question_id': 1, 'created_by': 1})
+        result = self.collection.delete_one({'question_id': question_id})
+        if question:
+            self._index_signatures([question])
+        self._bump_quizzes([question_id])
+        return result
     
     def get_correct_answer(self, question_id: str):
-        qtype = self.get_question_type(question_id)
-        data = self.get_question_data(question_id)
+        question = self.get_question(question_id, {'_id': 0, 'type': 1, 'data': 1}) or {}
+        qtype, data = question.get('type'), question.get('data')
         if data and qtype:
             if qtype == 'mcq':
                 return data.get('correct_option')
@@ -299,35 +742,389 @@ class QuestionHandler:
         return None
 
 class ResultHandler :
+    # Graded answers live inside the attempt documents (see models.Attempt); these are the
+    # read paths over them, shaped as one row per answer where callers expect rows
     def __init__(self, handler: Handler):
         self.handler = handler
-        self.collection = handler.results
-        
-    def create_result(self, result: Result):
-        result.result_id = generate_uuid()
-        return self.collection.insert_one(result.model_dump())
     
-    def get_result(self, result_id: str):
-        return self.collection.find_one({'result_id': result_id})
+    @property
+    def collection(self):
+        return self.handler.attempts
     
     def get_student_quiz_results(self, student_id: str, quiz_id: str):
-        return self.collection.find({'student_id': student_id, 'quiz_id': quiz_id})
+        attempt = self.collection.find_one({'student_id': student_id, 'quiz_id': quiz_id}, {'_id': 0, 'answers': 1})
+        return attempt.get('answers', []) if attempt else []
     
     def get_quiz_attended_students(self, quiz_id: str):
-        return self.collection.find({'quiz_id': quiz_id}).distinct('student_id')
+        return self.collection.distinct('student_id', {'quiz_id': quiz_id})
     
     def get_student_attended_quizzes(self, student_id: str):
+        return self.collection.distinct('quiz_id', {'student_id': student_id})
+    
+    def get_quiz_answer_rows(self, quiz_id: str, fields: dict, batch_size: int = 1000):
+        # Unwinds the answers of a quiz's attempts into rows; walks the (quiz_id, student_id) index,
+        # so rows arrive grouped by student without a blocking sort
+        return self.collection.aggregate([
+            {'$match': {'quiz_id': quiz_id}},
+            {'$sort': {'quiz_id': 1, 'student_id': 1}},
+            {'$project': {'_id': 0, 'attempt_id': 1, 'student_id': 1, 'submitted_on': 1, 'answers': 1}},
+            {'$unwind': '$answers'},
+            {'$project': fields}
+        ], batchSize=batch_size)
+    
+    def get_quiz_export_cursor(self, quiz_id: str, batch_size: int = 1000):
+        return self.get_quiz_answer_rows(quiz_id, {
+            'attempt_id': 1,
+            'student_id': 1,
+            'question_id': '$answers.question_id',
+            'option_ids': '$answers.option_ids',
+            'correct': '$answers.correct',
+            'marks': '$answers.marks',
+            'created_on': '$submitted_on'
+        }, batch_size)
+    
+    def get_quiz_item_answers(self, quiz_id: str):
+        # One document per attempt holding its answers' fields as parallel arrays of scalars, the
+        # shape item analysis loads; no unwind and no answer subdocuments to decode
+        return self.collection.aggregate([
+            {'$match': {'quiz_id': quiz_id}},
+            {'$project': {'_id': 0, 'question_ids': '$answers.question_id', 'masks': '$answers.mask', 'correct': '$answers.correct'}}
+        ], batchSize=1000)
+    
+    def count_quiz_attempts(self, quiz_id: str) -> int:
+        return self.collection.count_documents({'quiz_id': quiz_id})
+    
+    def get_quiz_report(self, quiz_id: str, after: str | None = None, limit: int = PAGE_SIZE):
+        # One page of attempts, latest submissions first, with their answers inline; only the
+        # student's name is joined, and only for the attempts on the page
+        return split_page(list(self.collection.aggregate([
+            {'$match': {'quiz_id': quiz_id, **keyset_match(after, 'submitted_on', 'attempt_id')}},
+            {'$sort': keyset_sort('submitted_on', 'attempt_id')},
+            {'$limit': limit + 1},
+            {'$lookup': {
+                'from': 'students',
+                'localField': 'student_id',
+                'foreignField': 'student_id',
+                'as': 'student'
+            }},
+            {'$unwind': '$student'},
+            {'$project': {
+                '_id': 0,
+                'attempt_id': 1,
+                'student_id': 1,
+                'name': '$student.name',
+                'score': 1,
+                'max_score': 1,
+                'correct_answers': '$correct_count',
+                'total_questions': 1,
+                'submitted_on': 1,
+                'results': '$answers'
+            }}
+        ])), limit, 'submitted_on', 'attempt_id')
+
+
+class AttemptHandler:
+    def __init__(self, handler: Handler):
+        self.handler = handler
+    
+    @property
+    def collection(self):
+        return self.handler.attempts
+    
+    def create_attempt(self, attempt: Attempt):
+        attempt.attempt_id = attempt.attempt_id or generate_uuid()
+        try:
+            self.collection.insert_one(attempt.model_dump())
+        except DuplicateKeyError:
+            raise AlreadyExists('attempt')
+        return attempt.attempt_id
+    
+    def get_attempt(self, student_id: str, quiz_id: str, projection: dict | None = None):
+        return self.collection.find_one({'student_id': student_id, 'quiz_id': quiz_id}, projection)
+    
+    def has_attempted(self, student_id: str, quiz_id: str) -> bool:
+        # Point lookup on the unique (quiz_id, student_id) index
+        return bool(self.collection.find_one({'quiz_id': quiz_id, 'student_id': student_id}, {'_id': 1}))
+    
+    def get_attempt_with_answers(self, student_id: str, quiz_id: str):
+        # The answers are part of the attempt document, so this is a point lookup
+        return self.collection.find_one({'quiz_id': quiz_id, 'student_id': student_id}, {'_id': 0})
+    
+    def rename_answer_questions(self, quiz_id: str, renamed: dict):
+        # Points a quiz's stored answers at the copies its shared questions were forked into
+        # (see models.quiz_diff.fork_shared); one update for all of them
+        if not renamed:
+            return None
+        return self.collection.update_many(
+            {'quiz_id': quiz_id, 'answers.question_id': {'$in': list(renamed)}},
+            {'$set': {f'answers.$[q{i}].question_id': new for i, new in enumerate(renamed.values())}},
+            array_filters=[{f'q{i}.question_id': old} for i, old in enumerate(renamed)]
+        )
+    
+    def get_quiz_student_ids(self, quiz_ids: list):
+        return self.collection.distinct('student_id', {'quiz_id': {'$in': list(quiz_ids)}})
+    
+    def get_quiz_attempts(self, quiz_id: str, projection: dict | None = None):
+        return self.collection.find({'quiz_id': quiz_id}, projection)
+    
+    def get_student_attempts(self, student_id: str, projection: dict | None = None):
+        return self.collection.find({'student_id': student_id}, projection)
+    
+    def delete_quiz_attempts(self, quiz_id: str):
+        return self.collection.delete_many({'quiz_id': quiz_id})
+    
+
+class StatsHandler:
+    def __init__(self, handler: Handler):
+        self.handler = handler
+    
+    @property
+    def collection(self):
+        return self.handler.quiz_stats
+    
+    def record_attempt(self, quiz_id: str, grade: dict):
+        return self.collection.update_one({'quiz_id': quiz_id}, quiz_stats_update(grade), upsert=True)
+    
+    def get_quiz_stats(self, quiz_id: str):
+        # Averages, histogram and per-question rates from one document, whatever the cohort size
+        return summarize_stats(self.collection.find_one({'quiz_id': quiz_id}, {'_id': 0}))
+    
+    def increment_quiz_stats(self, quiz_id: str, increment: dict):
+        if not increment:
+            return None
+        return self.collection.update_one({'quiz_id': quiz_id}, {'$inc': increment, '$set': {'updated_on': datetime.now()}})
+    
+    def set_quiz_questions(self, quiz_id: str, questions: list):
+        # After a regrade: counters of questions no longer in the quiz go, and max_score follows the
+        # current marks; the remaining counters are left to the concurrent $inc's
+        stats = self.collection.find_one({'quiz_id': quiz_id}, {'_id': 0, 'questions': 1})
+        if not stats:
+            return None
+        current = {question['question_id'] for question in questions}
+        update = {'$set': {'max_score': float(sum(question.get('marks', 0) for question in questions)), 'updated_on': datetime.now()}}
+        if removed := [question_id for question_id in stats.get('questions', {}) if question_id not in current]:
+            update['$unset'] = {f'questions.{question_id}': '' for question_id in removed}
+        return self.collection.update_one({'quiz_id': quiz_id}, update)
+    
+    def rebuild_quiz_stats(self, quiz_id: str):
+        # Recomputed from the attempts' stored grades over the quiz's current questions, for the
+        # offline `manage.py rebuild-stats`; submissions recorded while this runs can be lost, so run
+        # it when the quiz is quiet (or run it again)
+        quiz = self.handler.quizzes.find_one({'quiz_id': quiz_id}, {'_id': 0, 'question_ids': 1})
+        question_ids = set(quiz.get('question_ids', [])) if quiz else None
+        attempts = self.handler.attempts.find(
+            {'quiz_id': quiz_id}, {'_id': 0, 'score': 1, 'max_score': 1, 'answers.question_id': 1, 'answers.correct': 1}
+        ).sort('submitted_on', 1)
+        
+        count, max_score = 0, 0
+        def grades():
+            nonlocal count, max_score
+            for attempt in attempts:
+                count, max_score = count + 1, attempt.get('max_score', 0)
+                yield {
+                    'score': attempt.get('score', 0),
+                    'max_score': attempt.get('max_score', 0),
+                    'questions': {
+                        answer['question_id']: answer for answer in attempt.get('answers', [])
+                        if question_ids is None or answer['question_id'] in question_ids
+                    }
+                }
         
-        return self.collection.find({'student_id': student_id}).distinct('quiz_id')
+        stats = build_stats(grades())
+        if not count:
+            self.delete_quiz_stats(quiz_id)
+            return 0
+        
+        document = {'quiz_id': quiz_id, **stats, 'max_score': max_score, 'updated_on': datetime.now()}
+        self.collection.replace_one({'quiz_id': quiz_id}, document, upsert=True)
+        return count
     
-    def get_class_attended_quizzes(self, class_id: str):
-        return self.collection.find({'class_id': class_id}).distinct('quiz_id')
+    def rename_questions(self, quiz_id: str, renamed: dict):
+        if not renamed:
+            return None
+        return self.collection.update_one(
+            {'quiz_id': quiz_id}, {'$rename': {f'questions.{old}': f'questions.{new}' for old, new in renamed.items()}}
+        )
     
-    def get_result_by_student_and_question(self, student_id, question_id):
-        return self.collection.find({'student_id': student_id, 'question_id': question_id})
+    def delete_quiz_stats(self, quiz_id: str):
+        return self.collection.delete_one({'quiz_id': quiz_id})
     
-    def get_result_by_student_and_quiz(self, student_id, quiz_id):
-        return self.collection.find({'student_id': student_id, 'quiz_id': quiz_id})
+
+# Regrades run here so an answer-key fix never holds a web worker; progress is kept in the
+# job document, so any worker can report it
+regrade_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='regrade')
+
+REGRADE_BATCH_SIZE = 5000
+
+
+# A running job heartbeats at least once per batch; one silent for this long is taken for dead
+REGRADE_STALE_AFTER = timedelta(minutes=5)
+REGRADE_LOCK_POLL = 0.5
+
+
+def batches(iterable, size: int):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class RegradeHandler:
+    def __init__(self, handler: Handler):
+        self.handler = handler
     
-    def delete_quiz_results(self, quiz_id: str):
-        return self.collection.delete_many({'quiz_id': quiz_id})
\ No newline at end of file
+    @property
+    def collection(self):
+        return self.handler.regrade_jobs
+    
+    @property
+    def locks(self):
+        return self.handler.regrade_locks
+    
+    def create_job(self, quiz_id: str, question_ids: list):
+        now = datetime.now()
+        job = RegradeJob(job_id=generate_uuid(), quiz_id=quiz_id, question_ids=list(question_ids), created_on=now, updated_on=now)
+        self.collection.insert_one(job.model_dump())
+        return job.job_id
+    
+    def get_job(self, job_id: str, projection: dict | None = {'_id': 0}):
+        # A running job whose worker stopped heartbeating (its process died) is failed when next read
+        now = datetime.now()
+        self.collection.update_one(
+            {'job_id': job_id, 'status': 'running', 'updated_on': {'$lt': now - REGRADE_STALE_AFTER}},
+            {'$set': {'status': 'failed', 'error': 'Regrade stopped responding', 'finished_on': now, 'updated_on': now}}
+        )
+        return self.collection.find_one({'job_id': job_id}, projection)
+    
+    def _touch(self, job_id: str, fields: dict | None = None):
+        return self.collection.update_one({'job_id': job_id}, {'$set': {**(fields or {}), 'updated_on': datetime.now()}})
+    
+    def start_regrade(self, quiz_id: str, question_ids: list):
+        job_id = self.create_job(quiz_id, question_ids)
+        regrade_executor.submit(self.run_job, job_id)
+        return job_id
+    
+    def run_job(self, job_id: str, batch_size: int = REGRADE_BATCH_SIZE):
+        # Claimed atomically, so a job runs once even if it is submitted twice
+        now = datetime.now()
+        claimed = self.collection.update_one(
+            {'job_id': job_id, 'status': 'queued'}, {'$set': {'status': 'running', 'started_on': now, 'updated_on': now}}
+        )
+        if not claimed.matched_count:
+            return None
+        job = self.get_job(job_id)
+        quiz_id = job['quiz_id']
+        
+        try:
+            self._acquire_lock(quiz_id, job_id)
+        except Exception as e:
+            logger.exception('Regrade %s of quiz %s failed to start', job_id, quiz_id)
+            self._touch(job_id, {'status': 'failed', 'error': str(e), 'finished_on': datetime.now()})
+            return None
+        
+        def progress(processed: int, changed: int):
+            self._touch(job_id, {'processed': processed, 'changed': changed})
+            self.locks.update_one({'quiz_id': quiz_id, 'job_id': job_id}, {'$set': {'updated_on': datetime.now()}})
+        
+        try:
+            self._touch(job_id, {'total': self.handler.attempts.count_documents({'quiz_id': quiz_id})})
+            self.regrade(quiz_id, job['question_ids'], progress, batch_size)
+        except Exception as e:
+            logger.exception('Regrade %s of quiz %s failed', job_id, quiz_id)
+            self._touch(job_id, {'status': 'failed', 'error': str(e), 'finished_on': datetime.now()})
+            return None
+        finally:
+            self.locks.delete_one({'quiz_id': quiz_id, 'job_id': job_id})
+        self._touch(job_id, {'status': 'done', 'finished_on': datetime.now()})
+        return job_id
+    
+    def _acquire_lock(self, quiz_id: str, job_id: str):
+        # One regrade per quiz at a time: the unique quiz_id index admits a single lock document.
+        # Jobs queue behind it in order and each grades against the key current when it starts;
+        # a lock whose holder stopped heartbeating is taken over
+        while True:
+            try:
+                self.locks.insert_one({'quiz_id': quiz_id, 'job_id': job_id, 'updated_on': datetime.now()})
+                return
+            except DuplicateKeyError:
+                self.locks.delete_one({'quiz_id': quiz_id, 'updated_on': {'$lt': datetime.now() - REGRADE_STALE_AFTER}})
+            self._touch(job_id)
+            time.sleep(REGRADE_LOCK_POLL)
+    
+    def regrade(self, quiz_id: str, question_ids: list, progress=None, batch_size: int = REGRADE_BATCH_SIZE):
+        # Streams the quiz's attempts and regrades their answers to the given questions against the
+        # current answer key. Each batch's answers are re-encoded from their option ids (the option
+        # order may have changed) and graded in one vectorized call. Answers live in the attempt, so
+        # its summary is recomputed in the same pass and every changed attempt is one UpdateOne in the
+        # batch's bulk_write. Summaries are checked even when no answer changed: marks changes and
+        # removed questions move max_score.
+        # Each update is conditioned on the answers it was computed from, so an attempt changed
+        # meanwhile is left alone, and the stats get the difference of the attempts actually updated
+        # as one $inc per batch, so submissions recorded meanwhile are kept.
+        quiz_questions = QuestionHandler(self.handler).get_questions(QuizHandler(self.handler).get_quiz_questions(quiz_id))
+        keys = answer_keys([q for q in quiz_questions if q['question_id'] in set(question_ids)])
+        current = {question['question_id'] for question in quiz_questions}
+        stats_handler = StatsHandler(self.handler)
+        
+        attempts = self.handler.attempts.find(
+            {'quiz_id': quiz_id},
+            {'_id': 0, 'attempt_id': 1, 'answers': 1, 'score': 1, 'max_score': 1, 'correct_count': 1, 'total_questions': 1}
+        ).batch_size(batch_size)
+        processed = changed = 0
+        for batch in batches(attempts, batch_size):
+            answers = [list(attempt.get('answers', [])) for attempt in batch]
+            located, columns, responses = [], [], []
+            for i, attempt_answers in enumerate(answers):
+                for j, answer in enumerate(attempt_answers):
+                    if (column := keys['columns'].get(answer['question_id'])) is not None:
+                        bits = keys['bits'][column]
+                        located.append((i, j))
+                        columns.append(column)
+                        responses.append(sum(bits.get(option_id, 0) for option_id in answer.get('option_ids', [])))
+            
+            marks, correct = grade_masks(keys, np.array(columns, dtype=np.intp), np.array(responses, dtype=np.int64))
+            answer_changed = [0] * len(batch)
+            for (i, j), mask, answer_marks, answer_correct in zip(located, responses, marks.tolist(), correct.tolist()):
+                answer = answers[i][j]
+                if (answer.get('mask'), answer.get('marks'), answer.get('correct')) != (mask, answer_marks, answer_correct):
+                    answers[i][j] = {**answer, 'mask': mask, 'marks': answer_marks, 'correct': answer_correct}
+                    answer_changed[i] += 1
+            
+            updates = []
+            for attempt, attempt_answers, count in zip(batch, answers, answer_changed):
+                summary = summarize_answers(attempt_answers, quiz_questions)
+                if attempt_answers != attempt.get('answers', []) or any(attempt.get(field) != value for field, value in summary.items()):
+                    updates.append((attempt, attempt_answers, summary, count))
+            if updates:
+                result = self.handler.attempts.bulk_write([
+                    UpdateOne({'attempt_id': attempt['attempt_id'], 'answers': attempt.get('answers')}, {'$set': {'answers': attempt_answers, **summary}})
+                    for attempt, attempt_answers, summary, _ in updates
+                ], ordered=False)
+                if result.matched_count < len(updates):
+                    updates = self._applied(updates)
+                
+                increment = {}
+                for attempt, attempt_answers, summary, count in updates:
+                    old = {
+                        'score': attempt.get('score', 0), 'max_score': attempt.get('max_score', 0),
+                        'questions': {a['question_id']: a for a in attempt.get('answers', []) if a['question_id'] in current}
+                    }
+                    new = {**summary, 'questions': {a['question_id']: a for a in attempt_answers if a['question_id'] in current}}
+                    for path, value in stats_delta(old, new).items():
+                        increment[path] = increment.get(path, 0) + value
+                    changed += count
+                stats_handler.increment_quiz_stats(quiz_id, increment)
+            processed += len(batch)
+            if progress:
+                progress(processed, changed)
+        
+        stats_handler.set_quiz_questions(quiz_id, quiz_questions)
+        return {'processed': processed, 'changed': changed}
+    
+    def _applied(self, updates: list) -> list:
+        # The updates of a bulk_write whose attempt still matched: those attempts now hold the new answers
+        stored = {
+            attempt['attempt_id']: attempt.get('answers') for attempt in self.handler.attempts.find(
+                {'attempt_id': {'$in': [attempt['attempt_id'] for attempt, *_ in updates]}}, {'_id': 0, 'attempt_id': 1, 'answers': 1}
+            )
+        }
+        return [update for update in updates if stored.get(update[0]['attempt_id']) == update[1]]
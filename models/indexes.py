@@ -0,0 +1,183 @@
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure
+
+
+# Bump this whenever INDEXES changes so running instances re-apply the spec.
+INDEX_VERSION = 11
+
+INDEXES = {
+    'teachers': [
+        IndexModel([('teacher_id', ASCENDING)], name='teacher_id_unique', unique=True),
+        IndexModel([('username', ASCENDING)], name='username_unique', unique=True),
+        IndexModel([('email', ASCENDING)], name='email_unique', unique=True),
+    ],
+    'students': [
+        IndexModel([('student_id', ASCENDING)], name='student_id_unique', unique=True),
+        IndexModel([('username', ASCENDING)], name='username_unique', unique=True),
+        IndexModel([('email', ASCENDING)], name='email_unique', unique=True),
+    ],
+    'classes': [
+        IndexModel([('class_id', ASCENDING)], name='class_id_unique', unique=True),
+        # Keyset pagination walks (owner, created_on, class_id) newest first
+        IndexModel([('teacher_id', ASCENDING), ('created_on', DESCENDING), ('class_id', DESCENDING)], name='teacher_id_created_on_class_id'),
+        IndexModel([('student_ids', ASCENDING), ('created_on', DESCENDING), ('class_id', DESCENDING)], name='student_ids_created_on_class_id'),
+    ],
+    'quizzes': [
+        IndexModel([('quiz_id', ASCENDING)], name='quiz_id_unique', unique=True),
+        IndexModel([('class_id', ASCENDING), ('teacher_id', ASCENDING)], name='class_id_teacher_id'),
+        IndexModel([('question_ids', ASCENDING)], name='question_ids'),
+        IndexModel([('class_id', ASCENDING), ('created_on', DESCENDING), ('quiz_id', DESCENDING)], name='class_id_created_on_quiz_id'),
+    ],
+    'questions': [
+        IndexModel([('question_id', ASCENDING)], name='question_id_unique', unique=True),
+        # Question bank: dedup lookups, tag filters and newest-first keyset pages per teacher
+        IndexModel([('created_by', ASCENDING), ('content_hash', ASCENDING)], name='created_by_content_hash'),
+        IndexModel([('created_by', ASCENDING), ('tags', ASCENDING), ('created_on', DESCENDING), ('question_id', DESCENDING)], name='created_by_tags_created_on_question_id'),
+        IndexModel([('created_by', ASCENDING), ('created_on', DESCENDING), ('question_id', DESCENDING)], name='created_by_created_on_question_id'),
+        # Questions come in many languages, so no stemming or stop words; the documents' own
+        # `language` field must not be read as the index's language override
+        IndexModel(
+            [('data.title', TEXT), ('option_texts', TEXT)], name='title_options_text',
+            weights={'data.title': 3, 'option_texts': 1}, default_language='none', language_override='text_language'
+        ),
+    ],
+    'attempts': [
+        IndexModel([('attempt_id', ASCENDING)], name='attempt_id_unique', unique=True),
+        IndexModel([('quiz_id', ASCENDING), ('student_id', ASCENDING)], name='quiz_id_student_id_unique', unique=True),
+        IndexModel([('student_id', ASCENDING)], name='student_id'),
+        IndexModel([('quiz_id', ASCENDING), ('submitted_on', DESCENDING), ('attempt_id', DESCENDING)], name='quiz_id_submitted_on_attempt_id'),
+    ],
+    'sessions': [
+        IndexModel([('session_id', ASCENDING)], name='session_id_unique', unique=True),
+    ],
+    'quiz_stats': [
+        IndexModel([('quiz_id', ASCENDING)], name='quiz_id_unique', unique=True),
+    ],
+    'regrade_jobs': [
+        IndexModel([('job_id', ASCENDING)], name='job_id_unique', unique=True),
+    ],
+    # One document per quiz being regraded: the unique index is the lock
+    'regrade_locks': [
+        IndexModel([('quiz_id', ASCENDING)], name='quiz_id_unique', unique=True),
+    ],
+}
+
+META_COLLECTION = 'schema_meta'
+
+
+def get_index_version(db) -> int:
+    meta = db[META_COLLECTION].find_one({'_id': 'indexes'})
+    return meta.get('version', 0) if meta else 0
+
+
+class IndexBuildError(Exception):
+    def __init__(self, failures: dict):
+        # failures: collection name -> index name -> the server's error message
+        super().__init__('Could not build indexes: ' + '; '.join(
+            f'{collection_name}.{index_name}: {message}'
+            for collection_name, indexes in failures.items() for index_name, message in indexes.items()
+        ))
+        self.failures = failures
+
+
+def ensure_indexes(db, force: bool = False) -> bool:
+    """
+    Create every index in INDEXES that the database does not have yet.
+
+    Each index is built on its own, so one that fails (typically a unique index
+    over documents that already collide) does not keep the others from being
+    built. The version is only stored once every index exists, so the spec is
+    retried on the next call.
+
+    Args:
+        db: The pymongo database the handlers use
+        force: Re-apply the spec even if the stored version is current
+
+    Returns:
+        True if the spec was applied, False if it was already up to date
+
+    Raises:
+        IndexBuildError: Some indexes could not be built; see duplicate_keys
+    """
+    if not force and get_index_version(db) >= INDEX_VERSION:
+        return False
+
+    failures = {}
+    for collection_name, indexes in INDEXES.items():
+        for index in indexes:
+            try:
+                db[collection_name].create_indexes([index])
+            except OperationFailure as e:
+                failures.setdefault(collection_name, {})[index.document['name']] = (e.details or {}).get('errmsg') or str(e)
+    if failures:
+        raise IndexBuildError(failures)
+
+    db[META_COLLECTION].update_one(
+        {'_id': 'indexes'},
+        {'$set': {'version': INDEX_VERSION, 'applied_on': datetime.now()}},
+        upsert=True
+    )
+    return True
+
+
+def duplicate_keys(db, collection_name: str, index_name: str, limit: int = 20) -> list:
+    """
+    The documents that keep a unique index in INDEXES from being built.
+
+    Args:
+        db: The pymongo database the handlers use
+        collection_name: Collection of the index
+        index_name: Name of a unique index in INDEXES
+        limit: Most colliding keys to return
+
+    Returns:
+        List of dictionaries with the colliding `key` values, the `count` of
+        documents sharing it and their `_ids`; empty for an unknown or
+        non-unique index
+    """
+    index = next((index.document for index in INDEXES.get(collection_name, []) if index.document['name'] == index_name), None)
+    if not index or not index.get('unique'):
+        return []
+    fields = list(index['key'])
+    return list(db[collection_name].aggregate([
+        {'$group': {
+            '_id': {field.replace('.', '_'): f'${field}' for field in fields},
+            'count': {'$sum': 1},
+            '_ids': {'$push': '$_id'}
+        }},
+        {'$match': {'count': {'$gt': 1}}},
+        {'$sort': {'count': -1}},
+        {'$limit': limit},
+        {'$project': {'_id': 0, 'key': '$_id', 'count': 1, '_ids': 1}}
+    ], allowDiskUse=True))
+
+
+def index_report(db) -> dict:
+    """
+    Compare the indexes in the database against INDEXES.
+
+    Returns:
+        Dictionary keyed by collection name with the `missing`, `extra` and
+        `unused` index names. `unused` is None when $indexStats is unavailable.
+    """
+    report = {}
+    for collection_name, indexes in INDEXES.items():
+        collection = db[collection_name]
+        expected = {index.document['name'] for index in indexes}
+        existing = set(collection.index_information()) - {'_id_'}
+
+        try:
+            unused = sorted(
+                stat['name'] for stat in collection.aggregate([{'$indexStats': {}}])
+                if stat['name'] != '_id_' and stat['accesses']['ops'] == 0
+            )
+        except OperationFailure:
+            unused = None
+
+        report[collection_name] = {
+            'missing': sorted(expected - existing),
+            'extra': sorted(existing - expected),
+            'unused': unused,
+        }
+    return report
@@ -0,0 +1,1279 @@
+"""
+In-memory storage engine exposing the subset of the pymongo Collection API the
+handlers use: CRUD, bulk writes, cursors, aggregation pipelines and indexes.
+
+Secondary indexes are plain dicts from the first indexed field's value to the set
+of matching documents, so equality and $in lookups on indexed keys do not scan the
+collection. Unique indexes raise the same DuplicateKeyError/BulkWriteError as MongoDB.
+"""
+import copy
+import itertools
+from operator import itemgetter
+import re
+import threading
+from datetime import datetime
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pymongo.operations import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+
+MISSING = object()
+
+
+# --------------------------------------
+# Value helpers
+# --------------------------------------
+
+# Stored values other than documents and arrays are immutable, so copies can share them
+_IMMUTABLE = frozenset({str, int, float, bool, type(None), datetime, ObjectId, bytes})
+
+
+def clone(value):
+    # Deep copy of a document or array. copy.deepcopy's per-value bookkeeping made it the main
+    # cost of reads returning many answers; levels holding only immutable values (checked with
+    # map(type), at C speed) are copied shallowly
+    if isinstance(value, dict):
+        if _IMMUTABLE.issuperset(map(type, value.values())):
+            return dict(value)
+        return {key: clone(item) for key, item in value.items()}
+    if isinstance(value, list):
+        if _IMMUTABLE.issuperset(map(type, value)):
+            return list(value)
+        return [clone(item) for item in value]
+    if type(value) in _IMMUTABLE:
+        return value
+    return copy.deepcopy(value)
+
+
+def _type_rank(value) -> int:
+    # BSON comparison order: null < numbers < strings < objects < arrays < ObjectId < bool < date
+    if value is None or value is MISSING:
+        return 1
+    if isinstance(value, bool):
+        return 8
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, str):
+        return 3
+    if isinstance(value, dict):
+        return 4
+    if isinstance(value, (list, tuple)):
+        return 5
+    if isinstance(value, ObjectId):
+        return 7
+    if isinstance(value, datetime):
+        return 9
+    return 10
+
+
+def sort_key(value):
+    rank = _type_rank(value)
+    if rank == 1:
+        return (rank, 0)
+    if rank in (4, 5, 10):
+        return (rank, repr(value))
+    return (rank, value)
+
+
+def compare(a, b) -> int:
+    ka, kb = sort_key(a), sort_key(b)
+    return (ka > kb) - (ka < kb)
+
+
+def equal(a, b) -> bool:
+    if a is MISSING:
+        a = None
+    if b is MISSING:
+        b = None
+    if isinstance(a, bool) != isinstance(b, bool):
+        return False
+    return a == b
+
+
+def hashable(value):
+    if isinstance(value, dict):
+        return tuple((k, hashable(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(hashable(v) for v in value)
+    return value
+
+
+# $in lists of plain ids are matched through a set, built once per list object rather than
+# once per document; the list is kept alongside so its id() cannot be reused while cached.
+# Callers may mutate and reuse a list between queries, so each query starts with a fresh cache.
+_id_sets: dict = {}
+
+
+def _id_set(values: list):
+    cached = _id_sets.get(id(values))
+    if cached is None or cached[0] is not values:
+        if len(_id_sets) > 256:
+            _id_sets.clear()
+        ids = frozenset(values) if all(isinstance(v, (str, ObjectId)) for v in values) else None
+        cached = _id_sets[id(values)] = (values, ids)
+    return cached[1]
+
+
+def field_values(doc, parts: list) -> list:
+    """Values at a dotted path, fanning out over arrays the way MongoDB queries do."""
+    if not parts:
+        return [doc]
+    if isinstance(doc, dict):
+        if parts[0] in doc:
+            return field_values(doc[parts[0]], parts[1:])
+        return []
+    if isinstance(doc, list):
+        if parts[0].isdigit():
+            index = int(parts[0])
+            return field_values(doc[index], parts[1:]) if index < len(doc) else []
+        values = []
+        for element in doc:
+            if isinstance(element, dict):
+                values.extend(field_values(element, parts))
+        return values
+    return []
+
+
+def _expanded(values: list) -> list:
+    # A query against an array field matches the array itself or any of its elements
+    expanded = list(values)
+    for value in values:
+        if isinstance(value, list):
+            expanded.extend(value)
+    return expanded
+
+
+def get_path(doc: dict, path: str, default=MISSING):
+    current = doc
+    for part in path.split('.'):
+        if isinstance(current, dict) and part in current:
+            current = current[part]
+        elif isinstance(current, list) and part.isdigit() and int(part) < len(current):
+            current = current[int(part)]
+        else:
+            return default
+    return current
+
+
+def set_path(doc: dict, path: str, value):
+    parts = path.split('.')
+    current = doc
+    for part in parts[:-1]:
+        if isinstance(current, list):
+            current = current[int(part)]
+            continue
+        if not isinstance(current.get(part), (dict, list)):
+            current[part] = {}
+        current = current[part]
+    if isinstance(current, list):
+        current[int(parts[-1])] = value
+    else:
+        current[parts[-1]] = value
+
+
+def unset_path(doc: dict, path: str):
+    parts = path.split('.')
+    parent = get_path(doc, '.'.join(parts[:-1])) if len(parts) > 1 else doc
+    if isinstance(parent, dict):
+        parent.pop(parts[-1], None)
+
+
+# --------------------------------------
+# Query matching
+# --------------------------------------
+
+def _is_operator_dict(value) -> bool:
+    return isinstance(value, dict) and bool(value) and all(k.startswith('$') for k in value)
+
+
+def _match_operator(values: list, op: str, arg, doc=None) -> bool:
+    expanded = _expanded(values)
+    if op == '$eq':
+        return any(equal(v, arg) for v in expanded) if values else arg is None
+    if op == '$ne':
+        return not _match_operator(values, '$eq', arg)
+    if op == '$in':
+        if isinstance(arg, list) and (ids := _id_set(arg)) is not None:
+            return any(v in ids for v in expanded if isinstance(v, (str, ObjectId)))
+        return any(_match_operator(values, '$eq', a) for a in arg)
+    if op == '$nin':
+        return not _match_operator(values, '$in', arg)
+    if op in ('$gt', '$gte', '$lt', '$lte'):
+        for v in expanded:
+            if _type_rank(v) != _type_rank(arg):
+                continue
+            c = compare(v, arg)
+            if (op == '$gt' and c > 0) or (op == '$gte' and c >= 0) or \
+               (op == '$lt' and c < 0) or (op == '$lte' and c <= 0):
+                return True
+        return False
+    if op == '$exists':
+        return bool(values) == bool(arg)
+    if op == '$all':
+        return all(_match_operator(values, '$eq', a) for a in arg)
+    if op == '$size':
+        return any(isinstance(v, list) and len(v) == arg for v in values)
+    if op == '$elemMatch':
+        for v in values:
+            if not isinstance(v, list):
+                continue
+            for element in v:
+                if _is_operator_dict(arg):
+                    if all(_match_operator([element], o, a) for o, a in arg.items()):
+                        return True
+                elif isinstance(element, dict) and matches(element, arg):
+                    return True
+        return False
+    if op == '$regex':
+        pattern = arg if hasattr(arg, 'search') else re.compile(arg)
+        return any(isinstance(v, str) and pattern.search(v) for v in expanded)
+    if op == '$options':
+        return True
+    if op == '$not':
+        return not _match_condition(values, arg)
+    raise OperationFailure(f'Unsupported query operator {op}')
+
+
+def _match_condition(values: list, condition) -> bool:
+    if _is_operator_dict(condition):
+        if '$regex' in condition and '$options' in condition:
+            flags = re.IGNORECASE if 'i' in condition['$options'] else 0
+            condition = {**condition, '$regex': re.compile(condition['$regex'], flags)}
+        return all(_match_operator(values, op, arg) for op, arg in condition.items())
+    if hasattr(condition, 'search'):
+        return _match_operator(values, '$regex', condition)
+    return _match_operator(values, '$eq', condition)
+
+
+def matches(doc: dict, query: dict | None) -> bool:
+    if not query:
+        return True
+    for key, condition in query.items():
+        if key == '$and':
+            if not all(matches(doc, q) for q in condition):
+                return False
+        elif key == '$or':
+            if not any(matches(doc, q) for q in condition):
+                return False
+        elif key == '$nor':
+            if any(matches(doc, q) for q in condition):
+                return False
+        elif key == '$text':
+            raise OperationFailure('$text is only supported at the top level of a find filter')
+        elif key == '$expr':
+            if not evaluate(condition, doc):
+                return False
+        elif key.startswith('$'):
+            raise OperationFailure(f'Unsupported query operator {key}')
+        elif not _match_condition(field_values(doc, key.split('.')), condition):
+            return False
+    return True
+
+
+def text_matches(doc: dict, search: str, fields: tuple) -> bool:
+    """Any-word match of a $text search against the collection's text index fields."""
+    words = set(re.findall(r'\w+', search.lower()))
+    haystack = set()
+    for path in fields:
+        for value in _expanded(field_values(doc, path.split('.'))):
+            if isinstance(value, str):
+                haystack.update(re.findall(r'\w+', value.lower()))
+    return bool(words & haystack)
+
+
+# --------------------------------------
+# Updates
+# --------------------------------------
+
+def _pull_matches(element, condition) -> bool:
+    if _is_operator_dict(condition):
+        return _match_condition([element], condition)
+    if isinstance(condition, dict) and isinstance(element, dict):
+        return matches(element, condition)
+    return equal(element, condition)
+
+
+def _element_matches(element, conditions: dict) -> bool:
+    # conditions: {'' or sub-path: condition} of one array filter identifier
+    for sub_path, condition in conditions.items():
+        if sub_path:
+            if not isinstance(element, dict) or not matches(element, {sub_path: condition}):
+                return False
+        elif not _match_condition([element], condition):
+            return False
+    return True
+
+
+def _filtered_paths(doc: dict, path: str, array_filters: dict) -> list:
+    # Concrete paths of an update path with $[] / $[identifier] positional operators
+    parts = path.split('.')
+    for i, part in enumerate(parts):
+        if part.startswith('$[') and part.endswith(']'):
+            array = get_path(doc, '.'.join(parts[:i])) if i else doc
+            if not isinstance(array, list):
+                return []
+            identifier = part[2:-1]
+            if identifier and identifier not in array_filters:
+                raise OperationFailure(f'No array filter found for identifier {identifier!r}')
+            paths = []
+            for index, element in enumerate(array):
+                if not identifier or _element_matches(element, array_filters[identifier]):
+                    paths.extend(_filtered_paths(doc, '.'.join([*parts[:i], str(index), *parts[i + 1:]]), array_filters))
+            return paths
+    return [path]
+
+
+def _array_filter_map(array_filters: list | None) -> dict:
+    grouped = {}
+    for array_filter in array_filters or []:
+        for key, condition in array_filter.items():
+            identifier, _, sub_path = key.partition('.')
+            grouped.setdefault(identifier, {})[sub_path] = condition
+    return grouped
+
+
+def apply_update(doc: dict, update: dict, inserting: bool = False, array_filters: list | None = None) -> dict:
+    if not any(k.startswith('$') for k in update):
+        # Replacement document
+        return {'_id': doc.get('_id'), **clone(update)}
+
+    doc = clone(doc)
+    filters = _array_filter_map(array_filters)
+    for op, fields in update.items():
+        for path, value in ((p, v) for raw, v in fields.items() for p in (_filtered_paths(doc, raw, filters) if '$[' in raw else [raw])):
+            if op == '$set':
+                set_path(doc, path, clone(value))
+            elif op == '$setOnInsert':
+                if inserting:
+                    set_path(doc, path, clone(value))
+            elif op == '$unset':
+                unset_path(doc, path)
+            elif op == '$inc':
+                set_path(doc, path, get_path(doc, path, 0) + value)
+            elif op == '$mul':
+                set_path(doc, path, get_path(doc, path, 0) * value)
+            elif op == '$max':
+                current = get_path(doc, path)
+                if current is MISSING or compare(value, current) > 0:
+                    set_path(doc, path, value)
+            elif op == '$min':
+                current = get_path(doc, path)
+                if current is MISSING or compare(value, current) < 0:
+                    set_path(doc, path, value)
+            elif op in ('$push', '$addToSet'):
+                items = value['$each'] if isinstance(value, dict) and '$each' in value else [value]
+                array = get_path(doc, path)
+                array = list(array) if isinstance(array, list) else []
+                for item in items:
+                    if op == '$push' or not any(equal(item, a) for a in array):
+                        array.append(clone(item))
+                set_path(doc, path, array)
+            elif op == '$pull':
+                array = get_path(doc, path)
+                if isinstance(array, list):
+                    set_path(doc, path, [a for a in array if not _pull_matches(a, value)])
+            elif op == '$rename':
+                moved = get_path(doc, path)
+                if moved is not MISSING:
+                    unset_path(doc, path)
+                    set_path(doc, value, moved)
+            elif op == '$pullAll':
+                array = get_path(doc, path)
+                if isinstance(array, list):
+                    set_path(doc, path, [a for a in array if not any(equal(a, v) for v in value)])
+            else:
+                raise OperationFailure(f'Unsupported update operator {op}')
+    return doc
+
+
+def _upsert_base(query: dict) -> dict:
+    doc = {}
+    for key, condition in (query or {}).items():
+        if key.startswith('$'):
+            continue
+        if _is_operator_dict(condition):
+            if '$eq' in condition:
+                set_path(doc, key, clone(condition['$eq']))
+        else:
+            set_path(doc, key, clone(condition))
+    return doc
+
+
+# --------------------------------------
+# Projection
+# --------------------------------------
+
+def _include(src, dst: dict, parts: list):
+    if not isinstance(src, dict) or parts[0] not in src:
+        return
+    value = src[parts[0]]
+    if len(parts) == 1:
+        dst[parts[0]] = clone(value)
+    elif isinstance(value, dict):
+        _include(value, dst.setdefault(parts[0], {}), parts[1:])
+    elif isinstance(value, list):
+        elements = [e for e in value if isinstance(e, dict)]
+        if not isinstance(dst.get(parts[0]), list):
+            dst[parts[0]] = [{} for _ in elements]
+        for element, target in zip(elements, dst[parts[0]]):
+            _include(element, target, parts[1:])
+
+
+def _exclude(doc, parts: list):
+    if isinstance(doc, list):
+        for element in doc:
+            _exclude(element, parts)
+    elif isinstance(doc, dict) and parts[0] in doc:
+        if len(parts) == 1:
+            del doc[parts[0]]
+        else:
+            _exclude(doc[parts[0]], parts[1:])
+
+
+def _is_inclusion(value) -> bool:
+    return not isinstance(value, (dict, list, str)) and bool(value)
+
+
+def project(doc: dict, projection: dict | None, computed: bool = False) -> dict:
+    if not projection:
+        return clone(doc)
+    fields = {k: v for k, v in projection.items() if k != '_id'}
+    is_exclusion = fields and all(not isinstance(v, (dict, list, str)) and not v for v in fields.values())
+    if not fields:
+        is_exclusion = not projection.get('_id', 1)
+
+    if is_exclusion:
+        result = clone(doc)
+        for path, value in projection.items():
+            if not value:
+                _exclude(result, path.split('.'))
+        return result
+
+    result = {}
+    if projection.get('_id', 1) and '_id' in doc:
+        result['_id'] = clone(doc['_id']) if _is_inclusion(projection.get('_id', 1)) or not computed else None
+    for path, value in fields.items():
+        if computed and not _is_inclusion(value):
+            evaluated = evaluate(value, doc)
+            if evaluated is not MISSING:
+                set_path(result, path, evaluated)
+        elif value:
+            _include(doc, result, path.split('.'))
+    if computed and '_id' in projection and not _is_inclusion(projection['_id']) and projection['_id'] not in (0, False):
+        result['_id'] = evaluate(projection['_id'], doc)
+    return result
+
+
+# --------------------------------------
+# Aggregation expressions
+# --------------------------------------
+
+def _agg_path(value, parts: list):
+    for index, part in enumerate(parts):
+        if isinstance(value, dict):
+            value = value.get(part, MISSING)
+        elif isinstance(value, list):
+            if index == len(parts) - 1:
+                # The common last step, e.g. '$answers.mask', when every element has the field
+                try:
+                    return list(map(itemgetter(part), value))
+                except (KeyError, TypeError, IndexError):
+                    pass
+            values = [_agg_path(e, parts[index:]) for e in value if isinstance(e, dict)]
+            return [v for v in values if v is not MISSING]
+        else:
+            return MISSING
+        if value is MISSING:
+            return MISSING
+    return value
+
+
+def _none(value):
+    return None if value is MISSING else value
+
+
+def evaluate(expr, doc: dict, variables: dict | None = None):
+    variables = variables or {}
+    if isinstance(expr, str):
+        if expr.startswith('$$'):
+            name, _, rest = expr[2:].partition('.')
+            base = doc if name in ('ROOT', 'CURRENT') else variables.get(name, MISSING)
+            return _agg_path(base, rest.split('.')) if rest else base
+        if expr.startswith('$'):
+            return _agg_path(doc, expr[1:].split('.'))
+        return expr
+    if isinstance(expr, list):
+        return [_none(evaluate(e, doc, variables)) for e in expr]
+    if not isinstance(expr, dict):
+        return expr
+    if len(expr) == 1 and next(iter(expr)).startswith('$'):
+        op, arg = next(iter(expr.items()))
+        return _operator(op, arg, doc, variables)
+    result = {}
+    for key, value in expr.items():
+        evaluated = evaluate(value, doc, variables)
+        if evaluated is not MISSING:
+            result[key] = evaluated
+    return result
+
+
+def _args(arg, doc, variables) -> list:
+    if not isinstance(arg, list):
+        arg = [arg]
+    return [_none(evaluate(a, doc, variables)) for a in arg]
+
+
+def _operator(op: str, arg, doc: dict, variables: dict):
+    if op == '$literal':
+        return arg
+    if op == '$cond':
+        if isinstance(arg, dict):
+            arg = [arg['if'], arg['then'], arg['else']]
+        return evaluate(arg[1] if _none(evaluate(arg[0], doc, variables)) else arg[2], doc, variables)
+    if op == '$ifNull':
+        for a in arg:
+            value = evaluate(a, doc, variables)
+            if value is not MISSING and value is not None:
+                return value
+        return None
+    if op == '$map':
+        items = _none(evaluate(arg['input'], doc, variables)) or []
+        name = arg.get('as', 'this')
+        return [_none(evaluate(arg['in'], doc, {**variables, name: item})) for item in items]
+    if op == '$filter':
+        items = _none(evaluate(arg['input'], doc, variables)) or []
+        name = arg.get('as', 'this')
+        return [item for item in items if _none(evaluate(arg['cond'], doc, {**variables, name: item}))]
+
+    values = _args(arg, doc, variables)
+    if op in ('$eq', '$ne', '$gt', '$gte', '$lt', '$lte'):
+        c = compare(values[0], values[1])
+        if op == '$eq':
+            return equal(values[0], values[1])
+        if op == '$ne':
+            return not equal(values[0], values[1])
+        return {'$gt': c > 0, '$gte': c >= 0, '$lt': c < 0, '$lte': c <= 0}[op]
+    if op == '$cmp':
+        return compare(values[0], values[1])
+    if op == '$and':
+        return all(values)
+    if op == '$or':
+        return any(values)
+    if op == '$not':
+        return not values[0]
+    if op == '$in':
+        return any(equal(values[0], v) for v in values[1] or [])
+    if op == '$size':
+        return len(values[0])
+    if op == '$arrayElemAt':
+        array, index = values
+        return array[index] if array and -len(array) <= index < len(array) else MISSING
+    if op == '$first':
+        return values[0][0] if values[0] else MISSING
+    if op == '$last':
+        return values[0][-1] if values[0] else MISSING
+    if op == '$setEquals':
+        sets = [{hashable(v) for v in value or []} for value in values]
+        return all(s == sets[0] for s in sets)
+    if op == '$setUnion':
+        seen, result = set(), []
+        for value in values:
+            for v in value or []:
+                if hashable(v) not in seen:
+                    seen.add(hashable(v))
+                    result.append(v)
+        return result
+    if op == '$setIntersection':
+        common = set.intersection(*[{hashable(v) for v in value or []} for value in values])
+        return [v for v in values[0] or [] if hashable(v) in common]
+    if op == '$concatArrays':
+        return [v for value in values for v in value or []]
+    if op in ('$sum', '$avg', '$max', '$min'):
+        numbers = values[0] if len(values) == 1 and isinstance(values[0], list) else values
+        numbers = [n for n in numbers if isinstance(n, (int, float)) and not isinstance(n, bool)] \
+            if op in ('$sum', '$avg') else [n for n in numbers if n is not None]
+        if op == '$sum':
+            return sum(numbers)
+        if not numbers:
+            return None
+        if op == '$avg':
+            return sum(numbers) / len(numbers)
+        return max(numbers, key=sort_key) if op == '$max' else min(numbers, key=sort_key)
+    if op == '$add':
+        return sum(v for v in values if v is not None)
+    if op == '$subtract':
+        return values[0] - values[1]
+    if op == '$multiply':
+        result = 1
+        for v in values:
+            result *= v
+        return result
+    if op == '$divide':
+        return values[0] / values[1]
+    if op == '$mod':
+        return values[0] % values[1]
+    if op == '$pow':
+        return values[0] ** values[1]
+    if op == '$sqrt':
+        return values[0] ** 0.5
+    if op == '$floor':
+        return int(values[0] // 1)
+    if op == '$round':
+        return round(values[0], values[1] if len(values) > 1 else 0)
+    if op == '$concat':
+        return ''.join(values)
+    if op == '$toString':
+        return None if values[0] is None else str(values[0])
+    if op == '$toLower':
+        return (values[0] or '').lower()
+    if op == '$mergeObjects':
+        result = {}
+        for value in values:
+            result.update(value or {})
+        return result
+    if op == '$objectToArray':
+        return [{'k': k, 'v': v} for k, v in (values[0] or {}).items()]
+    if op == '$arrayToObject':
+        return {item['k']: item['v'] if isinstance(item, dict) else item[1] for item in values[0] or []}
+    raise OperationFailure(f'Unsupported expression operator {op}')
+
+
+# --------------------------------------
+# Aggregation stages
+# --------------------------------------
+
+def _accumulate(op: str, arg, docs: list):
+    if op == '$count':
+        return len(docs)
+    values = [evaluate(arg, d) for d in docs]
+    if op == '$first':
+        return _none(values[0]) if values else None
+    if op == '$last':
+        return _none(values[-1]) if values else None
+    values = [v for v in values if v is not MISSING]
+    if op == '$push':
+        return values
+    if op == '$addToSet':
+        seen, result = set(), []
+        for v in values:
+            if hashable(v) not in seen:
+                seen.add(hashable(v))
+                result.append(v)
+        return result
+    numbers = [v for v in values if isinstance(v, (int, float)) and not isinstance(v, bool)]
+    if op == '$sum':
+        return sum(numbers)
+    if op == '$avg':
+        return sum(numbers) / len(numbers) if numbers else None
+    if op in ('$max', '$min'):
+        values = [v for v in values if v is not None]
+        if not values:
+            return None
+        return max(values, key=sort_key) if op == '$max' else min(values, key=sort_key)
+    raise OperationFailure(f'Unsupported accumulator {op}')
+
+
+def sort_docs(docs: list, spec) -> list:
+    items = list(spec.items()) if isinstance(spec, dict) else list(spec)
+    docs = list(docs)
+    for path, direction in reversed(items):
+        docs.sort(key=lambda d: sort_key(_none(get_path(d, path))), reverse=direction < 0)
+    return docs
+
+
+def run_pipeline(collection, docs, pipeline: list) -> list:
+    docs = list(docs)
+    for stage in pipeline:
+        (name, spec), = stage.items()
+        if name == '$match':
+            _id_sets.clear()
+            docs = [d for d in docs if matches(d, spec)]
+        elif name == '$project':
+            docs = [project(d, spec, computed=True) for d in docs]
+        elif name in ('$addFields', '$set'):
+            updated = []
+            for d in docs:
+                d = clone(d)
+                for path, expr in spec.items():
+                    value = evaluate(expr, d)
+                    if value is not MISSING:
+                        set_path(d, path, value)
+                updated.append(d)
+            docs = updated
+        elif name == '$unset':
+            docs = [project(d, {path: 0 for path in ([spec] if isinstance(spec, str) else spec)}) for d in docs]
+        elif name == '$unwind':
+            if isinstance(spec, str):
+                spec = {'path': spec}
+            path = spec['path'][1:]
+            keep_empty = spec.get('preserveNullAndEmptyArrays', False)
+            unwound = []
+            for d in docs:
+                value = get_path(d, path)
+                if isinstance(value, list) and value:
+                    for element in value:
+                        copied = clone(d)
+                        set_path(copied, path, element)
+                        unwound.append(copied)
+                elif isinstance(value, list) or value is MISSING or value is None:
+                    if keep_empty:
+                        copied = clone(d)
+                        unset_path(copied, path)
+                        unwound.append(copied)
+                else:
+                    unwound.append(d)
+            docs = unwound
+        elif name == '$group':
+            groups = {}
+            for d in docs:
+                key = _none(evaluate(spec['_id'], d))
+                groups.setdefault(hashable(key), (key, []))[1].append(d)
+            docs = []
+            for key, members in groups.values():
+                group = {'_id': key}
+                for field, accumulator in spec.items():
+                    if field != '_id':
+                        (op, arg), = accumulator.items()
+                        group[field] = _accumulate(op, arg, members)
+                docs.append(group)
+        elif name == '$sort':
+            docs = sort_docs(docs, spec)
+        elif name == '$limit':
+            docs = docs[:spec]
+        elif name == '$skip':
+            docs = docs[spec:]
+        elif name == '$count':
+            docs = [{spec: len(docs)}] if docs else []
+        elif name == '$replaceRoot':
+            docs = [evaluate(spec['newRoot'], d) for d in docs]
+        elif name == '$lookup':
+            foreign = collection.database[spec['from']]
+            joined = []
+            for d in docs:
+                if 'localField' in spec:
+                    local = _expanded(field_values(d, spec['localField'].split('.'))) or [None]
+                    matched = foreign._find_docs({spec['foreignField']: {'$in': local}})
+                else:
+                    matched = foreign._find_docs({})
+                if 'pipeline' in spec:
+                    variables = {k: evaluate(v, d) for k, v in spec.get('let', {}).items()}
+                    matched = run_pipeline(foreign, matched, _bind(spec['pipeline'], variables))
+                d = clone(d)
+                set_path(d, spec['as'], [clone(m) for m in matched])
+                joined.append(d)
+            docs = joined
+        elif name == '$facet':
+            docs = [{key: run_pipeline(collection, docs, sub) for key, sub in spec.items()}]
+        elif name == '$indexStats':
+            raise OperationFailure('$indexStats is not supported by the in-memory engine')
+        else:
+            raise OperationFailure(f'Unsupported pipeline stage {name}')
+    return docs
+
+
+def _bind(pipeline: list, variables: dict) -> list:
+    # $lookup `let` variables are substituted as literals into the sub-pipeline's $expr
+    if not variables:
+        return pipeline
+
+    def substitute(value):
+        if isinstance(value, str) and value.startswith('$$'):
+            name, _, rest = value[2:].partition('.')
+            if name in variables:
+                return {'$literal': get_path(variables[name], rest) if rest else variables[name]}
+        if isinstance(value, list):
+            return [substitute(v) for v in value]
+        if isinstance(value, dict):
+            return {k: substitute(v) for k, v in value.items()}
+        return value
+
+    return substitute(pipeline)
+
+
+# --------------------------------------
+# Cursor, collection and database
+# --------------------------------------
+
+class MemoryCursor:
+    def __init__(self, collection, query: dict | None = None, projection: dict | None = None, docs: list | None = None):
+        self._collection = collection
+        self._query = query or {}
+        self._projection = projection
+        self._docs = docs
+        self._sort = None
+        self._skip = 0
+        self._limit = 0
+        self._iterator = None
+
+    def sort(self, key_or_list, direction: int = 1):
+        self._sort = [(key_or_list, direction)] if isinstance(key_or_list, str) else list(key_or_list)
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def batch_size(self, size: int):
+        return self
+
+    def _results(self) -> list:
+        if self._docs is not None:
+            return self._docs
+        docs = self._collection._find_docs(self._query)
+        if self._sort:
+            docs = sort_docs(docs, self._sort)
+        docs = docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+        return [project(d, self._projection) for d in docs]
+
+    def distinct(self, key: str) -> list:
+        seen, values = set(), []
+        for doc in self._results():
+            for value in _expanded(field_values(doc, key.split('.'))):
+                if not isinstance(value, list) and hashable(value) not in seen:
+                    seen.add(hashable(value))
+                    values.append(value)
+        return values
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._iterator is None:
+            self._iterator = iter(self._results())
+        return next(self._iterator)
+
+    def close(self):
+        self._iterator = iter(())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class MemoryCollection:
+    def __init__(self, database, name: str):
+        self.database = database
+        self.name = name
+        self.full_name = f'{database.name}.{name}'
+        self._docs = {}
+        self._ids = itertools.count()
+        # The implicit unique _id index: _id value -> internal id
+        self._by_id = {}
+        self._indexes = {}
+        self._text_fields = ()
+        self._lock = threading.RLock()
+
+    # ---- indexes ----
+
+    def _index_keys(self, doc: dict, fields: list) -> list:
+        per_field = []
+        for field, _ in fields:
+            values = _expanded(field_values(doc, field.split('.'))) or [None]
+            values = [v for v in values if not isinstance(v, list)] or [None]
+            per_field.append([hashable(v) for v in values])
+        return list(itertools.product(*per_field))
+
+    def _add_to_indexes(self, internal_id: int, doc: dict):
+        self._by_id[hashable(doc.get('_id'))] = internal_id
+        for index in self._indexes.values():
+            for key in self._index_keys(doc, index['key']):
+                index['prefix'].setdefault(key[0], set()).add(internal_id)
+                if index['unique']:
+                    index['entries'][key] = internal_id
+
+    def _remove_from_indexes(self, internal_id: int, doc: dict):
+        if self._by_id.get(hashable(doc.get('_id'))) == internal_id:
+            del self._by_id[hashable(doc.get('_id'))]
+        for index in self._indexes.values():
+            for key in self._index_keys(doc, index['key']):
+                index['prefix'].get(key[0], set()).discard(internal_id)
+                if index['unique'] and index['entries'].get(key) == internal_id:
+                    del index['entries'][key]
+
+    def _check_unique(self, doc: dict, internal_id: int | None = None):
+        for name, index in self._indexes.items():
+            if not index['unique']:
+                continue
+            for key in self._index_keys(doc, index['key']):
+                owner = index['entries'].get(key)
+                if owner is not None and owner != internal_id:
+                    key_pattern = {field: direction for field, direction in index['key']}
+                    key_value = {field: value for (field, _), value in zip(index['key'], key)}
+                    message = f'E11000 duplicate key error collection: {self.full_name} index: {name} dup key: {key_value}'
+                    raise DuplicateKeyError(message, 11000, {
+                        'code': 11000, 'errmsg': message, 'keyPattern': key_pattern, 'keyValue': key_value
+                    })
+        if internal_id is None and '_id' in doc and hashable(doc['_id']) in self._by_id:
+            message = f'E11000 duplicate key error collection: {self.full_name} index: _id_'
+            raise DuplicateKeyError(message, 11000, {'code': 11000, 'errmsg': message, 'keyPattern': {'_id': 1}})
+
+    def create_index(self, keys, unique: bool = False, name: str | None = None, **kwargs) -> str:
+        if isinstance(keys, str):
+            keys = [(keys, 1)]
+        keys = list(keys)
+        name = name or '_'.join(f'{field}_{direction}' for field, direction in keys)
+        with self._lock:
+            if any(direction == 'text' for _, direction in keys):
+                self._text_fields = tuple(field for field, direction in keys if direction == 'text')
+            index = {'key': keys, 'unique': unique, 'prefix': {}, 'entries': {}}
+            previous, self._indexes[name] = self._indexes.get(name), index
+            try:
+                for internal_id, doc in self._docs.items():
+                    if unique:
+                        self._check_unique(doc, internal_id)
+                    for key in self._index_keys(doc, keys):
+                        index['prefix'].setdefault(key[0], set()).add(internal_id)
+                        if unique:
+                            index['entries'][key] = internal_id
+            except DuplicateKeyError:
+                if previous is None:
+                    del self._indexes[name]
+                else:
+                    self._indexes[name] = previous
+                raise
+        return name
+
+    def create_indexes(self, indexes: list) -> list:
+        names = []
+        for model in indexes:
+            spec = dict(model.document)
+            keys = list(spec.pop('key').items())
+            names.append(self.create_index(keys, **spec))
+        return names
+
+    def drop_index(self, name: str):
+        with self._lock:
+            self._indexes.pop(name, None)
+
+    def index_information(self) -> dict:
+        info = {'_id_': {'key': [('_id', 1)], 'v': 2}}
+        for name, index in self._indexes.items():
+            info[name] = {'key': list(index['key']), 'v': 2}
+            if index['unique']:
+                info[name]['unique'] = True
+        return info
+
+    def _candidates(self, query: dict):
+        # Use the most selective index whose leading field has an equality or $in condition
+        best = None
+        if '_id' in query:
+            condition = query['_id']
+            values = condition['$in'] if _is_operator_dict(condition) and set(condition) == {'$in'} else \
+                [condition] if not isinstance(condition, (dict, list)) else None
+            if values is not None:
+                return sorted({self._by_id[key] for key in map(hashable, values) if key in self._by_id})
+        for index in self._indexes.values():
+            field = index['key'][0][0]
+            if field not in query or index['key'][0][1] == 'text':
+                continue
+            condition = query[field]
+            if _is_operator_dict(condition):
+                if set(condition) == {'$eq'}:
+                    values = [condition['$eq']]
+                elif set(condition) == {'$in'}:
+                    values = condition['$in']
+                else:
+                    continue
+            elif isinstance(condition, (dict, list)) or hasattr(condition, 'search'):
+                continue
+            else:
+                values = [condition]
+            postings = [index['prefix'].get(hashable(value), ()) for value in values]
+            size = sum(len(p) for p in postings)
+            if best is None or size < best[0]:
+                best = (size, postings)
+        if best is None:
+            return list(self._docs)
+        return sorted(set().union(*best[1]))
+
+    def _find_ids(self, query: dict | None, limit: int = 0) -> list:
+        query = dict(query or {})
+        text = query.pop('$text', None)
+        if text is not None and not self._text_fields:
+            raise OperationFailure('text index required for $text query')
+        ids = []
+        _id_sets.clear()
+        with self._lock:
+            for internal_id in self._candidates(query):
+                doc = self._docs.get(internal_id)
+                if doc is None or not matches(doc, query):
+                    continue
+                if text is not None and not text_matches(doc, text['$search'], self._text_fields):
+                    continue
+                ids.append(internal_id)
+                if limit and len(ids) >= limit:
+                    break
+        return ids
+
+    def _find_docs(self, query: dict | None) -> list:
+        with self._lock:
+            return [self._docs[internal_id] for internal_id in self._find_ids(query)]
+
+    # ---- reads ----
+
+    def find(self, filter: dict | None = None, projection: dict | None = None, **kwargs) -> MemoryCursor:
+        if isinstance(projection, (list, tuple)):
+            projection = {field: 1 for field in projection}
+        return MemoryCursor(self, filter, projection)
+
+    def find_one(self, filter: dict | None = None, projection: dict | None = None, **kwargs):
+        for doc in self.find(filter, projection, **kwargs).limit(1):
+            return doc
+        return None
+
+    def count_documents(self, filter: dict | None = None, **kwargs) -> int:
+        return len(self._find_docs(filter))
+
+    def estimated_document_count(self) -> int:
+        return len(self._docs)
+
+    def distinct(self, key: str, filter: dict | None = None) -> list:
+        return self.find(filter).distinct(key)
+
+    def aggregate(self, pipeline: list, **kwargs) -> MemoryCursor:
+        first = pipeline[0] if pipeline else {}
+        docs = self._find_docs(first.get('$match')) if '$match' in first else self._find_docs({})
+        rest = pipeline[1:] if '$match' in first else pipeline
+        # Stages may pass stored documents through untouched; never hand those out
+        return MemoryCursor(self, docs=clone(run_pipeline(self, docs, rest)))
+
+    # ---- writes ----
+
+    def _insert(self, document: dict):
+        document.setdefault('_id', ObjectId())
+        doc = clone(document)
+        with self._lock:
+            self._check_unique(doc)
+            internal_id = next(self._ids)
+            self._docs[internal_id] = doc
+            self._add_to_indexes(internal_id, doc)
+        return doc['_id']
+
+    def _replace(self, internal_id: int, new_doc: dict):
+        old = self._docs[internal_id]
+        self._check_unique(new_doc, internal_id)
+        self._remove_from_indexes(internal_id, old)
+        self._docs[internal_id] = new_doc
+        self._add_to_indexes(internal_id, new_doc)
+
+    def _update(self, filter: dict, update: dict, upsert: bool, multi: bool, array_filters: list | None = None) -> dict:
+        with self._lock:
+            ids = self._find_ids(filter, limit=0 if multi else 1)
+            modified = 0
+            for internal_id in ids:
+                old = self._docs[internal_id]
+                new = apply_update(old, update, array_filters=array_filters)
+                # Dict equality ignores field order, which a BSON document does not
+                if new != old or hashable(new) != hashable(old):
+                    self._replace(internal_id, new)
+                    modified += 1
+            if not ids and upsert:
+                doc = apply_update(_upsert_base(filter), update, inserting=True)
+                if doc.get('_id') is None:
+                    doc.pop('_id', None)
+                upserted_id = self._insert(doc)
+                return {'n': 1, 'nModified': 0, 'upserted': upserted_id, 'updatedExisting': False}
+            return {'n': len(ids), 'nModified': modified, 'updatedExisting': bool(ids)}
+
+    def _delete(self, filter: dict, multi: bool) -> int:
+        with self._lock:
+            ids = self._find_ids(filter, limit=0 if multi else 1)
+            for internal_id in ids:
+                self._remove_from_indexes(internal_id, self._docs.pop(internal_id))
+            return len(ids)
+
+    def insert_one(self, document: dict, **kwargs) -> InsertOneResult:
+        return InsertOneResult(self._insert(document), True)
+
+    def insert_many(self, documents: list, ordered: bool = True, **kwargs) -> InsertManyResult:
+        ids, errors = [], []
+        for index, document in enumerate(documents):
+            try:
+                ids.append(self._insert(document))
+            except DuplicateKeyError as e:
+                errors.append({**e.details, 'index': index, 'op': document})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError(self._bulk_details(errors, n_inserted=len(ids)))
+        return InsertManyResult(ids, True)
+
+    def update_one(self, filter: dict, update: dict, upsert: bool = False, array_filters: list | None = None, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert, multi=False, array_filters=array_filters), True)
+
+    def update_many(self, filter: dict, update: dict, upsert: bool = False, array_filters: list | None = None, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert, multi=True, array_filters=array_filters), True)
+
+    def replace_one(self, filter: dict, replacement: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, replacement, upsert, multi=False), True)
+
+    def delete_one(self, filter: dict, **kwargs) -> DeleteResult:
+        return DeleteResult({'n': self._delete(filter, multi=False)}, True)
+
+    def delete_many(self, filter: dict, **kwargs) -> DeleteResult:
+        return DeleteResult({'n': self._delete(filter, multi=True)}, True)
+
+    @staticmethod
+    def _bulk_details(errors: list, **counts) -> dict:
+        return {
+            'writeErrors': errors,
+            'writeConcernErrors': [],
+            'nInserted': counts.get('n_inserted', 0),
+            'nUpserted': counts.get('n_upserted', 0),
+            'nMatched': counts.get('n_matched', 0),
+            'nModified': counts.get('n_modified', 0),
+            'nRemoved': counts.get('n_removed', 0),
+            'upserted': counts.get('upserted', []),
+        }
+
+    def bulk_write(self, requests: list, ordered: bool = True, **kwargs) -> BulkWriteResult:
+        counts = {'n_inserted': 0, 'n_upserted': 0, 'n_matched': 0, 'n_modified': 0, 'n_removed': 0, 'upserted': []}
+        errors = []
+        with self._lock:
+            for index, request in enumerate(requests):
+                try:
+                    if isinstance(request, InsertOne):
+                        self._insert(request._doc)
+                        counts['n_inserted'] += 1
+                    elif isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+                        raw = self._update(
+                            request._filter, request._doc, request._upsert, isinstance(request, UpdateMany),
+                            getattr(request, '_array_filters', None)
+                        )
+                        if 'upserted' in raw:
+                            counts['n_upserted'] += 1
+                            counts['upserted'].append({'index': index, '_id': raw['upserted']})
+                        else:
+                            counts['n_matched'] += raw['n']
+                            counts['n_modified'] += raw['nModified']
+                    elif isinstance(request, (DeleteOne, DeleteMany)):
+                        counts['n_removed'] += self._delete(request._filter, isinstance(request, DeleteMany))
+                    else:
+                        raise OperationFailure(f'Unsupported bulk operation {type(request).__name__}')
+                except DuplicateKeyError as e:
+                    errors.append({**e.details, 'index': index})
+                    if ordered:
+                        break
+        details = self._bulk_details(errors, **counts)
+        if errors:
+            raise BulkWriteError(details)
+        return BulkWriteResult(details, True)
+
+    def drop(self):
+        with self._lock:
+            self._docs.clear()
+            self._by_id.clear()
+            self._indexes.clear()
+
+
+class MemoryDatabase:
+    def __init__(self, name: str):
+        self.name = name
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            with self._lock:
+                collection = self._collections.setdefault(name, MemoryCollection(self, name))
+        return collection
+
+    def get_collection(self, name: str) -> MemoryCollection:
+        return self[name]
+
+    def list_collection_names(self) -> list:
+        return list(self._collections)
+
+    def drop_collection(self, name: str):
+        self._collections.pop(name, None)
+
+
+# --------------------------------------
+# Async API
+# --------------------------------------
+
+class AsyncMemoryCursor:
+    """pymongo AsyncCursor look-alike over a MemoryCursor; the engine never blocks, so nothing is awaited."""
+
+    def __init__(self, cursor: MemoryCursor):
+        self._cursor = cursor
+
+    def sort(self, key_or_list, direction: int = 1):
+        self._cursor.sort(key_or_list, direction)
+        return self
+
+    def skip(self, count: int):
+        self._cursor.skip(count)
+        return self
+
+    def limit(self, count: int):
+        self._cursor.limit(count)
+        return self
+
+    def batch_size(self, size: int):
+        return self
+
+    async def distinct(self, key: str) -> list:
+        return self._cursor.distinct(key)
+
+    async def to_list(self, length: int | None = None) -> list:
+        docs = list(self._cursor)
+        return docs[:length] if length else docs
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._cursor)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def close(self):
+        self._cursor.close()
+
+
+class AsyncMemoryCollection:
+    def __init__(self, collection: MemoryCollection):
+        self.sync = collection
+        self.name = collection.name
+        self.full_name = collection.full_name
+
+    def find(self, *args, **kwargs) -> AsyncMemoryCursor:
+        return AsyncMemoryCursor(self.sync.find(*args, **kwargs))
+
+    async def aggregate(self, pipeline: list, **kwargs) -> AsyncMemoryCursor:
+        return AsyncMemoryCursor(self.sync.aggregate(pipeline, **kwargs))
+
+    def __getattr__(self, name: str):
+        method = getattr(self.sync, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+
+        return call
+
+
+class AsyncMemoryDatabase:
+    def __init__(self, database: MemoryDatabase):
+        self.sync = database
+        self.name = database.name
+
+    def __getitem__(self, name: str) -> AsyncMemoryCollection:
+        return AsyncMemoryCollection(self.sync[name])
+
+    def get_collection(self, name: str) -> AsyncMemoryCollection:
+        return self[name]
+
+    async def list_collection_names(self) -> list:
+        return self.sync.list_collection_names()
@@ -11,6 +11,7 @@ class MCQType(BaseModel):
     title: str
     options: Dict[str, str]
     correct_options: List[str]
+    partial_credit: bool = False  # multi-answer keys: credit for each correct pick, less each wrong one
 
 
 class TrueOrFalseType(BaseModel):
@@ -53,7 +54,7 @@ class Class(BaseModel):
     class_id: str = ""
     name: str
     created_on: datetime  # Can be datetime if parsed accordingly
-    students: List[str]  # List of student_ids
+    student_ids: List[str] = []
     teacher_id: str = ""
 
 
@@ -67,10 +68,11 @@ class Quiz(BaseModel):
     teacher_id: str = ""
     description: str
     class_id: str
-    excluded_students_id: List[str] = []
+    excluded_student_ids: List[str] = []
     public: bool = False
     created_on: datetime
     question_ids: List[str] = []
+    version: int = 0  # incremented by every write to the quiz or its questions
 
 
 # --------------------------------------
@@ -84,23 +86,64 @@ class Question(BaseModel):
     marks: float
     type: str  # Should be 'mcq' or 'trueorfalse'
     data: QuestionDataType
+    tags: List[str] = []
+    difficulty: Optional[str] = None  # 'easy', 'medium' or 'hard'
+    language: Optional[str] = None
+    # Derived for the question bank (see models.question_bank)
+    content_hash: str = ""
+    minhash: List[int] = []
+    option_texts: List[str] = []
 
 
 # --------------------------------------
-# Result Model
+# Answer Model
 # --------------------------------------
-class Result(BaseModel):
-    result_id: str = ""
-    student_id: str = ""
-    quiz_id: str = ""
-    question_id: str = ""
-    option_id: str = ""
+class Answer(BaseModel):
+    question_id: str
+    option_ids: List[str]  # as selected, in option order
+    mask: int  # option_ids as bits in the question's option order (see models.grading)
     marks: float
-    created_on: datetime
+    correct: bool = False
+
+
+# --------------------------------------
+# Attempt Model
+# --------------------------------------
+class Attempt(BaseModel):
+    # One document per (student, quiz): the graded answers are stored inline, so a submission is
+    # a single insert and a report reads one document per student
+    attempt_id: str = ""
+    student_id: str
+    quiz_id: str
+    score: float
+    max_score: float
+    correct_count: int
+    total_questions: int
+    answers: List[Answer] = []
+    started_on: Optional[datetime] = None
+    submitted_on: datetime
     
 
 # --------------------------------------
-# Result Model
+# Regrade Job Model
+# --------------------------------------
+class RegradeJob(BaseModel):
+    job_id: str = ""
+    quiz_id: str
+    question_ids: List[str] = []
+    status: str = "queued"  # queued, running, done or failed
+    total: int = 0  # attempts to check
+    processed: int = 0  # attempts checked so far
+    changed: int = 0  # answers whose grade changed
+    error: Optional[str] = None
+    created_on: datetime
+    started_on: Optional[datetime] = None
+    finished_on: Optional[datetime] = None
+    updated_on: Optional[datetime] = None  # heartbeat of the worker running it
+
+
+# --------------------------------------
+# Session Model
 # --------------------------------------
 class Session(BaseModel):
     session_id: str = ""
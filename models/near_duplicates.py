@@ -0,0 +1,198 @@
+import re
+import threading
+import zlib
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+import numpy as np
+
+
+# Signature length, split into BANDS bands of ROWS values for locality-sensitive hashing. Two
+# questions share a band (and are compared) with probability 1 - (1 - s^ROWS)^BANDS at Jaccard
+# similarity s: ~99% at 0.7, ~12% at 0.3
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+# Estimated similarity from which a generated question counts as a near-duplicate. Paraphrases
+# of one question with the same options score ~0.65-0.85; unrelated questions below 0.3
+THRESHOLD = 0.7
+
+SHINGLE_SIZE = 3
+
+# Universal hashing (a * x + b) mod p over 32-bit shingle hashes; p is the smallest prime above
+# 2^32 and a < 2^31, so the products fit in uint64. Fixed seed: stored signatures stay comparable
+_PRIME = np.uint64(4294967311)
+_rng = np.random.default_rng(20240611)
+_A = _rng.integers(1, 1 << 31, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, int(_PRIME), NUM_PERM, dtype=np.uint64)
+# Fold a band's rows into one bucket key, distinct per band; collisions only add candidates,
+# which are verified against the full signature
+_BAND_WEIGHTS = _rng.integers(1, 1 << 62, ROWS, dtype=np.int64)
+_BAND_SALTS = _rng.integers(0, 1 << 62, BANDS, dtype=np.int64)
+
+# Rows added to an index are scanned directly until this many accumulate and are merged
+# into its sorted buckets; as many removed rows also trigger a merge, which drops them
+MERGE_EVERY = 1024
+
+_WORD = re.compile(r'\w+')
+
+
+def shingles(text: str) -> set:
+    """
+    Character 3-grams of each word of `text`.
+
+    Shingling within words makes the set insensitive to word order and to the
+    small rewordings that separate a regenerated question from the original,
+    and works for scripts written without spaces.
+    """
+    result = set()
+    for word in _WORD.findall(text):
+        word = f' {word} '
+        result.update(word[i:i + SHINGLE_SIZE] for i in range(len(word) - SHINGLE_SIZE + 1))
+    return result
+
+
+def minhash(text: str) -> List[int]:
+    """
+    MinHash signature of a text's shingles.
+
+    Args:
+        text: Normalized text, e.g. from models.question_bank.question_text
+
+    Returns:
+        NUM_PERM integers; the share of positions two signatures agree on estimates
+        the Jaccard similarity of their shingle sets. Empty for text without words.
+    """
+    tokens = shingles(text)
+    if not tokens:
+        return []
+    hashes = np.fromiter((zlib.crc32(token.encode('utf-8')) for token in tokens), dtype=np.uint64, count=len(tokens))
+    return ((_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME).min(axis=1).astype(np.int64).tolist()
+
+
+def band_keys(signatures: np.ndarray) -> np.ndarray:
+    """
+    One bucket key per band of each signature row: a (rows, BANDS) int64 array.
+    """
+    return (signatures.reshape(len(signatures), BANDS, ROWS) * _BAND_WEIGHTS).sum(axis=2) + _BAND_SALTS
+
+
+class MinHashIndex:
+    """
+    Thread-safe LSH index of MinHash signatures for near-duplicate lookup.
+
+    Signatures are rows of one matrix, and the bucket keys of every row's bands
+    are kept sorted next to their row numbers, so a lookup is BANDS binary
+    searches plus a comparison of the rows found there, independent of the
+    index size. Removed rows are skipped until the next merge drops them.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self._matrix = np.zeros((capacity, NUM_PERM), dtype=np.int64)
+        self._keys: List[Optional[Hashable]] = []
+        self._rows: Dict[Hashable, int] = {}
+        self._bucket_keys = np.zeros(0, dtype=np.int64)
+        self._bucket_rows = np.zeros(0, dtype=np.intp)
+        self._merged = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._rows
+
+    @property
+    def capacity(self) -> int:
+        """
+        Signature rows allocated, including removed and spare ones: what the index's memory scales with.
+        """
+        return len(self._matrix)
+
+    def update(self, items: Iterable[Tuple[Hashable, List[int]]]) -> None:
+        """
+        Add or replace signatures by key; items without a signature are skipped
+        (and drop a previous signature of their key).
+        """
+        items = list(items)
+        with self._lock:
+            for key, _ in items:
+                self._remove(key)
+            items = [(key, signature) for key, signature in items if len(signature) == NUM_PERM]
+            if not items:
+                self._merge_if_due()
+                return
+            start = len(self._keys)
+            if start + len(items) > len(self._matrix):
+                grown = np.zeros((max(2 * len(self._matrix), start + len(items)), NUM_PERM), dtype=np.int64)
+                grown[:start] = self._matrix[:start]
+                self._matrix = grown
+            self._matrix[start:start + len(items)] = np.array([signature for _, signature in items], dtype=np.int64)
+            for offset, (key, _) in enumerate(items):
+                self._keys.append(key)
+                self._rows[key] = start + offset
+            self._merge_if_due()
+
+    def add(self, key: Hashable, signature: List[int]) -> None:
+        self.update([(key, signature)])
+
+    def remove(self, key: Hashable) -> None:
+        with self._lock:
+            self._remove(key)
+            self._merge_if_due()
+
+    def _remove(self, key: Hashable) -> None:
+        row = self._rows.pop(key, None)
+        if row is not None:
+            self._keys[row] = None
+
+    def _merge_if_due(self) -> None:
+        if len(self._keys) - self._merged >= MERGE_EVERY or len(self._keys) - len(self._rows) >= MERGE_EVERY:
+            self._merge()
+
+    def _merge(self) -> None:
+        # Removed rows are dropped first, leaving room for the next MERGE_EVERY additions
+        if len(self._rows) < len(self._keys):
+            live = np.fromiter(self._rows.values(), dtype=np.intp, count=len(self._rows))
+            live.sort()
+            matrix = np.zeros((len(live) + MERGE_EVERY, NUM_PERM), dtype=np.int64)
+            matrix[:len(live)] = self._matrix[live]
+            self._matrix = matrix
+            self._keys = [self._keys[row] for row in live.tolist()]
+            self._rows = {key: row for row, key in enumerate(self._keys)}
+        keys = band_keys(self._matrix[:len(self._keys)]).ravel()
+        order = np.argsort(keys)
+        self._bucket_keys = keys[order]
+        self._bucket_rows = order // BANDS
+        self._merged = len(self._keys)
+
+    def query(self, signature: List[int], threshold: float = THRESHOLD) -> List[Tuple[Hashable, float]]:
+        """
+        Indexed signatures similar to `signature`.
+
+        Args:
+            signature: A signature from minhash
+            threshold: Least estimated Jaccard similarity to report
+
+        Returns:
+            (key, similarity) pairs, most similar first
+        """
+        if len(signature) != NUM_PERM:
+            return []
+        signature = np.asarray(signature, dtype=np.int64)
+        buckets = band_keys(signature[None, :])[0]
+        with self._lock:
+            lower = np.searchsorted(self._bucket_keys, buckets, 'left').tolist()
+            upper = np.searchsorted(self._bucket_keys, buckets, 'right').tolist()
+            found = [self._bucket_rows[lo:hi] for lo, hi in zip(lower, upper) if hi > lo]
+            if self._merged < len(self._keys):
+                recent = np.isin(band_keys(self._matrix[self._merged:len(self._keys)]), buckets).any(axis=1)
+                found.append(np.flatnonzero(recent) + self._merged)
+            if not found:
+                return []
+            rows = np.unique(np.concatenate(found))
+            similarity = (self._matrix[rows] == signature).mean(axis=1)
+            matches = [
+                (self._keys[row], s) for row, s in zip(rows.tolist(), similarity.tolist())
+                if s >= threshold and self._keys[row] is not None
+            ]
+        return sorted(matches, key=lambda match: -match[1])
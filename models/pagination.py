@@ -0,0 +1,101 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+
+# Rows per page when the request does not ask, and the most it may ask for
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def page_size(value, default: int = PAGE_SIZE) -> int:
+    """
+    Clamp a requested page size (e.g. the `limit` query argument) to 1..MAX_PAGE_SIZE.
+    """
+    try:
+        return min(max(int(value), 1), MAX_PAGE_SIZE)
+    except (TypeError, ValueError):
+        return default
+
+
+def encode_cursor(doc: dict, sort_field: str, id_field: str) -> str:
+    """
+    Opaque cursor pointing just after `doc` in a (sort_field, id_field) ordering.
+
+    Args:
+        doc: The last document of the current page
+        sort_field: Timestamp field the listing is ordered by, e.g. `created_on`
+        id_field: Unique tie-breaker field, e.g. `quiz_id`
+
+    Returns:
+        URL-safe token to pass back as the `after` argument
+    """
+    value = doc.get(sort_field)
+    payload = [value.isoformat() if isinstance(value, datetime) else None, doc[id_field]]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: str) -> Tuple[Optional[datetime], str]:
+    """
+    Inverse of encode_cursor.
+
+    Raises:
+        InvalidCursor: The token was not produced by encode_cursor
+    """
+    try:
+        value, id_ = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        if not isinstance(id_, str):
+            raise ValueError(id_)
+        return (datetime.fromisoformat(value) if value is not None else None), id_
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError) as e:
+        raise InvalidCursor(f'Invalid page cursor {token!r}') from e
+
+
+def keyset_match(after: Optional[str], sort_field: str, id_field: str) -> dict:
+    """
+    Filter selecting the documents that follow a cursor in newest-first order.
+
+    Documents without a timestamp sort last (null is the lowest BSON value), so they
+    follow every dated cursor and are paged among themselves by id.
+
+    Args:
+        after: Cursor from encode_cursor, or None for the first page
+        sort_field: Timestamp field the listing is ordered by
+        id_field: Unique tie-breaker field
+
+    Returns:
+        Query to AND into the listing's own filter (empty for the first page)
+    """
+    if not after:
+        return {}
+    value, id_ = decode_cursor(after)
+    if value is None:
+        return {sort_field: None, id_field: {'$lt': id_}}
+    return {'$or': [
+        {sort_field: {'$lt': value}},
+        {sort_field: value, id_field: {'$lt': id_}},
+        {sort_field: None}
+    ]}
+
+
+def keyset_sort(sort_field: str, id_field: str) -> dict:
+    return {sort_field: -1, id_field: -1}
+
+
+def split_page(docs: list, limit: int, sort_field: str, id_field: str) -> Tuple[List[dict], Optional[str]]:
+    """
+    Split `limit + 1` fetched documents into the page and the cursor of the next one.
+
+    Returns:
+        The page's documents, and the next page's cursor (None on the last page)
+    """
+    if len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    return docs, encode_cursor(docs[-1], sort_field, id_field)
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import unicodedata
+from typing import Dict, Iterable, List, Optional
+from .near_duplicates import THRESHOLD, MinHashIndex, minhash
+
+
+DIFFICULTIES = ('easy', 'medium', 'hard')
+
+
+def normalize_text(text) -> str:
+    """
+    Text as compared for dedup: NFKC-normalized, casefolded, whitespace collapsed.
+    """
+    return ' '.join(unicodedata.normalize('NFKC', str(text or '')).casefold().split())
+
+
+def normalize_tags(tags: Iterable[str] | None) -> List[str]:
+    """
+    Lowercased, trimmed tags without blanks or duplicates, in their original order.
+    """
+    return list(dict.fromkeys(tag for tag in (normalize_text(tag) for tag in tags or []) if tag))
+
+
+def normalize_difficulty(difficulty) -> Optional[str]:
+    difficulty = normalize_text(difficulty)
+    return difficulty if difficulty in DIFFICULTIES else None
+
+
+def option_texts(question: dict) -> List[str]:
+    """
+    The texts of an MCQ's options, indexed for search alongside the title (empty for trueorfalse).
+    """
+    if question.get('type') != 'mcq':
+        return []
+    return list(((question.get('data') or {}).get('options') or {}).values())
+
+
+def content_hash(question: dict) -> str:
+    """
+    Fingerprint of what a question asks and how it is graded.
+
+    Titles and option texts are normalized, and options are compared by text
+    rather than by id or position, so a retyped or regenerated copy of a question
+    hashes the same. Marks and partial credit are included: a question is only
+    reused when reusing it cannot change anyone's grade.
+
+    Args:
+        question: A question document
+
+    Returns:
+        Hex SHA-256 digest
+    """
+    data = question.get('data') or {}
+    if question.get('type') == 'trueorfalse':
+        choices, key = [], bool(data.get('answer'))
+    else:
+        options = data.get('options') or {}
+        choices = sorted(normalize_text(text) for text in options.values())
+        key = sorted(normalize_text(options.get(option_id, option_id)) for option_id in data.get('correct_options', []))
+    payload = [
+        question.get('type'), normalize_text(data.get('title')), choices, key,
+        float(question.get('marks', 0)), bool(data.get('partial_credit'))
+    ]
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def question_text(question: dict) -> str:
+    """
+    Normalized title and option texts, the text near-duplicate detection compares.
+    """
+    data = question.get('data') or {}
+    return ' '.join([normalize_text(data.get('title')), *map(normalize_text, option_texts(question))])
+
+
+def bank_fields(question: dict) -> dict:
+    """
+    The derived fields a stored question carries for dedup, near-duplicate detection and search.
+    """
+    return {
+        'content_hash': content_hash(question),
+        'minhash': minhash(question_text(question)),
+        'option_texts': option_texts(question)
+    }
+
+
+def flag_near_duplicates(questions: Dict[str, dict], index: Optional[MinHashIndex] = None,
+                         threshold: float = THRESHOLD, drop: bool = False) -> Dict[str, dict]:
+    """
+    Mark (or drop) generated questions that nearly repeat a bank question or an
+    earlier question of the same batch.
+
+    Unlike content_hash, this catches rewordings and reordered or retouched
+    options, so it only advises: the teacher decides what to keep.
+
+    Args:
+        questions: Generated questions by key, in order
+        index: The teacher's bank index, keyed by question_id (None to check the batch only)
+        threshold: Least estimated similarity that counts as a near-duplicate
+        drop: Leave near-duplicates out instead of marking them
+
+    Returns:
+        The kept questions by key, in order; each near-duplicate carries
+        `near_duplicate` with the matched `question_id`, the `similarity` and
+        whether the match is `in_bank` (otherwise it is an earlier generated question)
+    """
+    batch = MinHashIndex(capacity=max(len(questions), 1))
+    kept = {}
+    for key, question in questions.items():
+        signature = minhash(question_text(question))
+        matches = [(question_id, similarity, True) for question_id, similarity in (index.query(signature, threshold) if index is not None else [])]
+        matches += [(question_id, similarity, False) for question_id, similarity in batch.query(signature, threshold)]
+        if matches:
+            if drop:
+                continue
+            question_id, similarity, in_bank = max(matches, key=lambda match: match[1])
+            question['near_duplicate'] = {'question_id': question_id, 'similarity': round(similarity, 3), 'in_bank': in_bank}
+        batch.add(question.get('question_id', key), signature)
+        kept[key] = question
+    return kept
@@ -0,0 +1,97 @@
+from typing import Callable, Dict, List, Set, Tuple
+
+
+def answer_key(question: dict) -> tuple:
+    """
+    The parts of a question that decide how an answer is graded.
+
+    Args:
+        question: A question document
+
+    Returns:
+        Hashable (type, correct answer, marks, option order, partial credit); two
+        questions grade and encode every answer the same way exactly when their keys
+        are equal. The option order is part of it because stored answer masks are
+        bits in that order.
+    """
+    data = question.get('data') or {}
+    if question.get('type') == 'trueorfalse':
+        correct = bool(data.get('answer'))
+    else:
+        correct = frozenset(data.get('correct_options', []))
+    return (
+        question.get('type'), correct, float(question.get('marks', 0)),
+        tuple(data.get('options', {})), bool(data.get('partial_credit'))
+    )
+
+
+def diff_questions(old: List[dict], new: List[dict]) -> Dict[str, list]:
+    """
+    Compare a quiz's stored questions with the edited ones.
+
+    Args:
+        old: The stored question documents
+        new: The edited question documents; existing questions keep their
+            `question_id`, added ones have an id not among `old`
+
+    Returns:
+        Dictionary with the `added` and `changed` question documents, the
+        `removed` question ids, and the `rekeyed` ids: changed questions whose
+        answer key, marks or options differ, so their stored answers need regrading.
+        Questions with only text edits are `changed` but not `rekeyed`.
+    """
+    stored = {q['question_id']: q for q in old}
+    new_ids = {q['question_id'] for q in new}
+
+    added, changed, rekeyed = [], [], []
+    for question in new:
+        previous = stored.get(question['question_id'])
+        if previous is None:
+            added.append(question)
+            continue
+        # Dict equality ignores key order, so reordered options only show in the answer key
+        rekey = answer_key(previous) != answer_key(question)
+        if rekey or any(previous.get(field) != question.get(field) for field in ('type', 'marks', 'data')):
+            changed.append(question)
+            if rekey:
+                rekeyed.append(question['question_id'])
+
+    return {
+        'added': added,
+        'changed': changed,
+        'removed': [question_id for question_id in stored if question_id not in new_ids],
+        'rekeyed': rekeyed
+    }
+
+
+def fork_shared(diff: Dict[str, list], shared: Set[str], new_id: Callable[[], str]) -> Tuple[Dict[str, list], Dict[str, str]]:
+    """
+    Copy-on-write for changed questions that other quizzes also use.
+
+    A question document can be in several quizzes (see models.question_bank), so
+    editing it in place would change the other quizzes' text and answer key too.
+    Each shared changed question is instead stored as a new question; the other
+    quizzes keep the original.
+
+    Args:
+        diff: Result of diff_questions
+        shared: Ids of questions that are also in another quiz
+        new_id: Returns a fresh question id
+
+    Returns:
+        The diff with shared questions moved from `changed` to `added` under their
+        new ids (and renamed in `rekeyed`), and the old id -> new id mapping
+    """
+    renamed, added, changed = {}, list(diff['added']), []
+    for question in diff['changed']:
+        if question['question_id'] in shared:
+            renamed[question['question_id']] = new_id()
+            added.append({**question, 'question_id': renamed[question['question_id']]})
+        else:
+            changed.append(question)
+    return {
+        **diff,
+        'added': added,
+        'changed': changed,
+        'rekeyed': [renamed.get(question_id, question_id) for question_id in diff['rekeyed']]
+    }, renamed
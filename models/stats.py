@@ -0,0 +1,119 @@
+import math
+from typing import Dict, List
+
+
+# Score histogram buckets, by percentage of max_score: 0-9%, 10-19%, ... 90-100%
+HISTOGRAM_BUCKETS = 10
+
+
+def score_bucket(score: float, max_score: float) -> int:
+    """
+    Histogram bucket of one attempt's score.
+
+    Args:
+        score: Marks the attempt earned
+        max_score: Marks available in the quiz at submission time
+
+    Returns:
+        Bucket index in range(HISTOGRAM_BUCKETS)
+    """
+    if max_score <= 0:
+        return 0
+    return min(max(int(score / max_score * HISTOGRAM_BUCKETS), 0), HISTOGRAM_BUCKETS - 1)
+
+
+def stats_increment(grade: dict) -> Dict[str, float]:
+    """
+    The `$inc` document that adds one graded attempt to a quiz_stats document.
+
+    Args:
+        grade: An attempt's grade as returned by grade_quiz (only `score`, `max_score`
+            and the per-question `correct` flags are used)
+
+    Returns:
+        Dotted counter paths mapped to their increments
+    """
+    score = grade['score']
+    increment = {
+        'attempts': 1,
+        'score_sum': score,
+        'score_sq_sum': score * score,
+        f"histogram.{score_bucket(score, grade['max_score'])}": 1,
+    }
+    for question_id, graded in grade['questions'].items():
+        increment[f'questions.{question_id}.attempts'] = 1
+        increment[f'questions.{question_id}.correct'] = 1 if graded['correct'] else 0
+    return increment
+
+
+def stats_delta(old: dict, new: dict) -> Dict[str, float]:
+    """
+    The `$inc` document that turns one recorded attempt's counters into those of its regrade.
+
+    Args:
+        old: The attempt's grade as it was recorded, in the shape stats_increment takes
+        new: The attempt's grade after the regrade, over the same questions
+
+    Returns:
+        Dotted counter paths mapped to their non-zero increments
+    """
+    delta = stats_increment(new)
+    for path, value in stats_increment(old).items():
+        delta[path] = delta.get(path, 0) - value
+    return {path: value for path, value in delta.items() if value}
+
+
+def build_stats(grades: List[dict]) -> dict:
+    """
+    The counters a quiz_stats document holds after the given attempts were recorded.
+
+    Args:
+        grades: Graded attempts, in the shape stats_increment takes
+
+    Returns:
+        Nested counter fields, ready to be stored as a quiz_stats document
+    """
+    stats = {}
+    for grade in grades:
+        for path, value in stats_increment(grade).items():
+            *parents, leaf = path.split('.')
+            target = stats
+            for parent in parents:
+                target = target.setdefault(parent, {})
+            target[leaf] = target.get(leaf, 0) + value
+    return stats
+
+
+def summarize_stats(stats: dict) -> dict:
+    """
+    Derive the dashboard figures from a quiz_stats document.
+
+    Args:
+        stats: The stored quiz_stats document (may be None for a quiz without attempts)
+
+    Returns:
+        Dictionary with `attempts`, `mean`, `std_dev`, `max_score`, the `histogram`
+        as a list of HISTOGRAM_BUCKETS counts, and per-question `attempts`,
+        `correct` and `correct_rate` keyed by question_id
+    """
+    stats = stats or {}
+    attempts = stats.get('attempts', 0)
+    mean = stats.get('score_sum', 0) / attempts if attempts else 0.0
+    variance = stats.get('score_sq_sum', 0) / attempts - mean * mean if attempts else 0.0
+    histogram = stats.get('histogram', {})
+
+    return {
+        'attempts': attempts,
+        'mean': mean,
+        'std_dev': math.sqrt(max(variance, 0.0)),
+        'max_score': stats.get('max_score', 0),
+        'histogram': [histogram.get(str(i), 0) for i in range(HISTOGRAM_BUCKETS)],
+        'questions': {
+            question_id: {
+                **counts,
+                'correct_rate': counts.get('correct', 0) / counts['attempts'] if counts.get('attempts') else 0.0
+            }
+            for question_id, counts in stats.get('questions', {}).items()
+        },
+        'updated_on': stats.get('updated_on'),
+    }
@@ -4,8 +4,11 @@ from flask import (
     redirect, url_for, render_template, flash,
     get_flashed_messages
 )
-from models.models import Student, Session, Result
-from models.handler import Handler, StudentHandler, ResultHandler, ClassHandler, QuizHandler, QuestionHandler, SessionHandler
+from models.models import Student, Session, Answer, Attempt
+from utils import generate_uuid
+from models.grading import grade_quiz, selected_options
+from models.pagination import InvalidCursor, page_size
+from models.handler import AlreadyExists, Handler, StudentHandler, AttemptHandler, ClassHandler, QuizHandler, SessionHandler, StatsHandler
 
 bp = Blueprint('student', __name__, url_prefix='/student')
 
@@ -13,41 +16,38 @@ handler = Handler()
 student_handler = StudentHandler(handler)
 session_handler = SessionHandler(handler)
 quiz_handler = QuizHandler(handler)
-question_handler = QuestionHandler(handler)
 class_handler = ClassHandler(handler)
-result_handler = ResultHandler(handler)
+attempt_handler = AttemptHandler(handler)
+stats_handler = StatsHandler(handler)
 
 @bp.before_request
 def before_request():
     if request.endpoint in ['static', 'student.login', 'student.register']:
         return
-    print(request.endpoint)
     session_id = session.get('session_id', None)
     user_id = session.get('user_id', None)
     ip_address =  request.remote_addr if request.remote_addr else '-1'
-    if (user_id and session_id) and session_handler.check_session(session_id, user_id, ip_address):
-        session['session_id'] = session_id
-        session['user_id'] = user_id
-        
-        user_type = session.get('user_type', None)
-    
-        if user_type != 'student':
-            return redirect(url_for('student.login'))
+    if not (user_id and session_id) or session.get('user_type', None) != 'student':
+        return redirect(url_for('student.login'))
     
-        student = student_handler.get_student(user_id)
-        if not student:
-            return redirect(url_for('student.login'))
-        
-        session['user_data'] = student
-        return None
-    else:
+    # Cached for a few seconds, so most requests do not touch the database here
+    student = session_handler.verify_session(session_id, user_id, ip_address, 'student')
+    if not student:
         return redirect(url_for('student.login'))
+    
+    session['user_data'] = student
+    return None
 
 @bp.after_request
 def after_request(response):
     session.pop("user_data", None)
     return response  # Return the response object
 
+@bp.errorhandler(InvalidCursor)
+def invalid_cursor(error):
+    flash('That page link is no longer valid, showing the first page', 'warning')
+    return redirect(request.path)
+
 @bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'GET':
@@ -58,7 +58,7 @@ def login():
         password = request.form['password']
         
         if student_handler.match_username_password(username, password):
-            student = student_handler.get_student_from_username(username)
+            student = student_handler.get_student_from_username(username, {'_id': 0, 'student_id': 1})
             
             if not student:
                 return render_template('student/login.html', error='Invalid username or password')
@@ -108,27 +108,23 @@ def register():
             created_on=datetime.datetime.now()
         )
         
-        # Student Data Validation
-        if student_handler.student_username_exists(student.username):
-            return render_template('student/register.html', error='Username already exists')
-        if student_handler.student_email_exists(student.email):
-            return render_template('student/register.html', error='Email already exists')
+        # Username and email uniqueness is enforced by the unique indexes
+        try:
+            student_handler.create_student(student)
+        except AlreadyExists as e:
+            return render_template('student/register.html', error=str(e))
         
-        if student_handler.create_student(student):
-            flash('Registration successful!', 'success')
-            return redirect(url_for('student.login'))
-        return render_template('student/register.html', error='Registration failed! Could not insert student!')
+        flash('Registration successful!', 'success')
+        return redirect(url_for('student.login'))
     return render_template('student/register.html')
 
 @bp.route('/')
 def index():
-    classes = []
-    for class_ in class_handler.get_student_classes(session['user_id']):
-        classes.append(
-            class_handler.get_class(class_)
-        )
-    student = student_handler.get_student(session['user_id'])
-    return render_template('student/index.html', classes=classes, student=student)
+    classes, next_cursor = class_handler.get_student_class_list(
+        session['user_id'], request.args.get('after'), page_size(request.args.get('limit'))
+    )
+    student = session['user_data']
+    return render_template('student/index.html', classes=classes, student=student, next_cursor=next_cursor)
 
 @bp.route('/class/<class_id>')
 def class_with_id(class_id):
@@ -137,20 +133,12 @@ def class_with_id(class_id):
         flash(f"Class #{class_id} not found!", "error")
         return redirect(url_for("student.index"))  # Fixed redirect
     
-    quizzes = []
-    
-    user_id = session['user_id']
-    attended_quizzes = quiz_handler.get_student_class_quizzes(user_id, class_id)
+    # Visible quizzes with the student's attempt status, in one round trip
+    quizzes, next_cursor = quiz_handler.get_student_class_quiz_list(
+        session['user_id'], class_id, request.args.get('after'), page_size(request.args.get('limit'))
+    )
     
-    for _quiz in quiz_handler.get_student_class_quizzes(user_id, class_id):
-        _quiz = quiz_handler.get_quiz(_quiz)
-        if _quiz:
-            _quiz['attended'] = _quiz.get('quiz_id') in attended_quizzes
-            quizzes.append(
-                _quiz
-            )
-    
-    return render_template('student/class.html', class_=class_obj, quizzes=quizzes)  # Added quizzes to template
+    return render_template('student/class.html', class_=class_obj, quizzes=quizzes, next_cursor=next_cursor)  # Added quizzes to template
 
 
 @bp.route("/class/join", methods = ['POST'])
@@ -193,22 +181,22 @@ def attend_quiz():
 
 @bp.route('/quiz/<quiz_id>')
 def quiz(quiz_id):
-    quiz = quiz_handler.get_quiz(quiz_id)
+    # Check if student has already taken this quiz, fetching their answers in the same round trip
+    attempt = attempt_handler.get_attempt_with_answers(session['user_id'], quiz_id)
+    attended = attempt is not None
+    
+    # Quiz and its ordered questions, from the payload cache; the answer key is only sent after submission
+    payload = quiz_handler.get_quiz_payload(quiz_id, include_answers=attended)
     
-    if not quiz:
+    if not payload:
         flash(f"Quiz #{quiz_id} not found!", "error")
         return redirect(url_for('student.index'))
     
-    # Get all questions for this quiz
-    questions = []
-    for question_id in quiz_handler.get_quiz_questions(quiz_id):
-        questions.append(question_handler.get_question(question_id))
+    quiz, questions = payload['quiz'], payload['questions']
     
-    # Check if student has already taken this quiz
-    if session['user_id'] in result_handler.get_quiz_attended_students(quiz_id):
-        # Get student's results and format them as a dictionary for easy lookup
-        results = result_handler.get_result_by_student_and_quiz(session['user_id'], quiz_id)
-        student_result = {result['question_id']: result['option_id'] for result in results}
+    if attended:
+        # Format the student's answers as a dictionary for easy lookup
+        student_result = {answer['question_id']: answer for answer in attempt['answers']}
         
         return render_template('student/quiz_submit.html', 
                               quiz=quiz, 
@@ -216,41 +204,68 @@ def quiz(quiz_id):
                               student_result=student_result)
     
     # If student hasn't taken the quiz yet, show the quiz taking page
-    return render_template('student/quiz.html', quiz=quiz, questions=questions)
+    session['quiz_started'] = [quiz_id, datetime.datetime.now().isoformat()]
+    return render_template('student/quiz.html', quiz=quiz, questions=questions, submission_id=generate_uuid())
 
 
 @bp.route('/quiz/<quiz_id>/submit', methods=['POST'])
 def submit_quiz(quiz_id):
-    quiz = quiz_handler.get_quiz(quiz_id)
+    payload = quiz_handler.get_quiz_payload(quiz_id, include_answers=True)
     
-    if not quiz:
+    if not payload:
         flash(f'Quiz #{quiz_id} does not exist!', 'error')
         return redirect(url_for('student.index'))
     
-    questions = []
-    
-    for question_id in quiz_handler.get_quiz_questions(quiz_id):
-        questions.append(question_handler.get_question(question_id))
+    questions = payload['questions']
     
-    answers = []
+    # Validate every answer before grading or writing anything
+    answers = {}
     for question in questions:
         question_id = question['question_id']  # Accessing question id properly
-        option_id = request.form.get(str(question_id))
+        # Checkbox questions post one value per selected option
+        selected = selected_options(question, request.form.getlist(str(question_id)))
         
-        if option_id is None:
+        if not selected:
             flash(f'Please answer question {question_id}!', 'error')
             return redirect(url_for('student.quiz', quiz_id=quiz_id))
         
-        answers.append(option_id)
-        
-        result = Result(
+        answers[question_id] = selected
+    
+    grade = grade_quiz(questions, answers)
+    now = datetime.datetime.now()
+    
+    started_on = None
+    started = session.pop('quiz_started', None)
+    if started and started[0] == quiz_id:
+        started_on = datetime.datetime.fromisoformat(started[1])
+    
+    # The submission id rendered into the form is the idempotency key for this attempt
+    attempt_id = request.form.get('submission_id') or generate_uuid()
+    try:
+        attempt_handler.create_attempt(Attempt(
+            attempt_id=attempt_id,
             student_id=session['user_id'],
             quiz_id=quiz_id,
-            question_id=question_id,
-            option_id=option_id,
-            marks=0,  # You might want to calculate marks here
-            created_on=datetime.datetime.now()
-        )
-        result_handler.create_result(result)
+            score=grade['score'],
+            max_score=grade['max_score'],
+            correct_count=grade['correct_count'],
+            total_questions=grade['total_questions'],
+            answers=[
+                Answer(question_id=question_id, option_ids=option_ids, **grade['questions'][question_id])
+                for question_id, option_ids in answers.items()
+            ],
+            started_on=started_on,
+            submitted_on=now
+        ))
+    except AlreadyExists:
+        # The attempt and its answers are one document, so a retried submission (double-click or
+        # resent POST) has nothing left to write
+        existing = attempt_handler.get_attempt(session['user_id'], quiz_id, {'_id': 0, 'attempt_id': 1})
+        if not existing or existing['attempt_id'] != attempt_id:
+            flash('You have already submitted this quiz!', 'warning')
+            return redirect(url_for('student.quiz', quiz_id=quiz_id))
+    else:
+        # Counted once per attempt, by whichever request created it
+        stats_handler.record_attempt(quiz_id, grade)
     
     return redirect(url_for('student.quiz', quiz_id=quiz_id))
\ No newline at end of file
@@ -0,0 +1,155 @@
+import asyncio
+import datetime
+from quart import (
+    Blueprint, request, session,
+    redirect, url_for, render_template, flash
+)
+from models.models import Answer, Attempt
+from utils import generate_uuid
+from models.grading import grade_quiz, selected_options
+from models.handler import AlreadyExists, strip_answers
+from models.pagination import InvalidCursor, page_size
+from models.async_handler import AsyncHandler, AsyncSessionHandler, AsyncClassHandler, AsyncQuizHandler, AsyncAttemptHandler, AsyncStatsHandler
+
+# Async versions of the student blueprint's exam-time endpoints, served by asgi.py.
+# Endpoint names and URLs match routes/student.py so templates and url_for work unchanged.
+bp = Blueprint('student', __name__, url_prefix='/student')
+
+handler = AsyncHandler()
+session_handler = AsyncSessionHandler(handler)
+class_handler = AsyncClassHandler(handler)
+quiz_handler = AsyncQuizHandler(handler)
+attempt_handler = AsyncAttemptHandler(handler)
+stats_handler = AsyncStatsHandler(handler)
+
+@bp.before_request
+async def before_request():
+    session_id = session.get('session_id', None)
+    user_id = session.get('user_id', None)
+    ip_address = request.remote_addr if request.remote_addr else '-1'
+    if not (user_id and session_id) or session.get('user_type', None) != 'student':
+        return redirect(url_for('student.login'))
+
+    student = await session_handler.verify_session(session_id, user_id, ip_address, 'student')
+    if not student:
+        return redirect(url_for('student.login'))
+
+    session['user_data'] = student
+    return None
+
+@bp.after_request
+async def after_request(response):
+    session.pop("user_data", None)
+    return response
+
+@bp.errorhandler(InvalidCursor)
+async def invalid_cursor(error):
+    await flash('That page link is no longer valid, showing the first page', 'warning')
+    return redirect(request.path)
+
+
+@bp.route('/')
+async def index():
+    classes, next_cursor = await class_handler.get_student_class_list(
+        session['user_id'], request.args.get('after'), page_size(request.args.get('limit'))
+    )
+    student = session['user_data']
+    return await render_template('student/index.html', classes=classes, student=student, next_cursor=next_cursor)
+
+@bp.route('/class/<class_id>')
+async def class_with_id(class_id):
+    class_obj, (quizzes, next_cursor) = await asyncio.gather(
+        class_handler.get_class(class_id),
+        quiz_handler.get_student_class_quiz_list(session['user_id'], class_id, request.args.get('after'), page_size(request.args.get('limit')))
+    )
+    if class_obj is None:
+        await flash(f"Class #{class_id} not found!", "error")
+        return redirect(url_for("student.index"))
+
+    return await render_template('student/class.html', class_=class_obj, quizzes=quizzes, next_cursor=next_cursor)
+
+
+@bp.route('/quiz/<quiz_id>')
+async def quiz(quiz_id):
+    # The attempt lookup and the quiz payload are independent, so the answer-key variant is
+    # fetched for everyone and stripped here for students who have not submitted
+    attempt, payload = await asyncio.gather(
+        attempt_handler.get_attempt_with_answers(session['user_id'], quiz_id),
+        quiz_handler.get_quiz_payload(quiz_id, include_answers=True)
+    )
+
+    if not payload:
+        await flash(f"Quiz #{quiz_id} not found!", "error")
+        return redirect(url_for('student.index'))
+
+    if attempt is not None:
+        student_result = {answer['question_id']: answer for answer in attempt['answers']}
+        return await render_template('student/quiz_submit.html',
+                                     quiz=payload['quiz'],
+                                     questions=payload['questions'],
+                                     student_result=student_result)
+
+    session['quiz_started'] = [quiz_id, datetime.datetime.now().isoformat()]
+    questions = [strip_answers(question) for question in payload['questions']]
+    return await render_template('student/quiz.html', quiz=payload['quiz'], questions=questions, submission_id=generate_uuid())
+
+
+@bp.route('/quiz/<quiz_id>/submit', methods=['POST'])
+async def submit_quiz(quiz_id):
+    form, payload = await asyncio.gather(
+        request.form,
+        quiz_handler.get_quiz_payload(quiz_id, include_answers=True)
+    )
+
+    if not payload:
+        await flash(f'Quiz #{quiz_id} does not exist!', 'error')
+        return redirect(url_for('student.index'))
+
+    questions = payload['questions']
+
+    answers = {}
+    for question in questions:
+        question_id = question['question_id']
+        # Checkbox questions post one value per selected option
+        selected = selected_options(question, form.getlist(str(question_id)))
+
+        if not selected:
+            await flash(f'Please answer question {question_id}!', 'error')
+            return redirect(url_for('student.quiz', quiz_id=quiz_id))
+
+        answers[question_id] = selected
+
+    grade = grade_quiz(questions, answers)
+    now = datetime.datetime.now()
+
+    started_on = None
+    started = session.pop('quiz_started', None)
+    if started and started[0] == quiz_id:
+        started_on = datetime.datetime.fromisoformat(started[1])
+
+    attempt_id = form.get('submission_id') or generate_uuid()
+    try:
+        await attempt_handler.create_attempt(Attempt(
+            attempt_id=attempt_id,
+            student_id=session['user_id'],
+            quiz_id=quiz_id,
+            score=grade['score'],
+            max_score=grade['max_score'],
+            correct_count=grade['correct_count'],
+            total_questions=grade['total_questions'],
+            answers=[
+                Answer(question_id=question_id, option_ids=option_ids, **grade['questions'][question_id])
+                for question_id, option_ids in answers.items()
+            ],
+            started_on=started_on,
+            submitted_on=now
+        ))
+    except AlreadyExists:
+        existing = await attempt_handler.get_attempt(session['user_id'], quiz_id, {'_id': 0, 'attempt_id': 1})
+        if not existing or existing['attempt_id'] != attempt_id:
+            await flash('You have already submitted this quiz!', 'warning')
+            return redirect(url_for('student.quiz', quiz_id=quiz_id))
+    else:
+        await stats_handler.record_attempt(quiz_id, grade)
+
+    return redirect(url_for('student.quiz', quiz_id=quiz_id))
@@ -1,15 +1,23 @@
+import logging
 from datetime import datetime
 from flask import (
     Blueprint, request, jsonify, session,
     redirect, url_for, render_template, flash,
-    get_flashed_messages
+    get_flashed_messages, Response
 )
 from utils import generate_uuid
+from utils.analysis import item_analysis
+from utils.export import EXPORT_FORMATS, gzip_chunks
+from utils.roster import MAX_ROSTER_ENTRIES, parse_roster
 from utils.gemini_api_old import generate_quiz_questions, create_quiz_prompt, process_questions
 from models.models import MCQType, Teacher, Session, Class, Question, Quiz, QuizPrompt, TrueOrFalseType
-from models.handler import Handler, StudentHandler, TeacherHandler, SessionHandler, ResultHandler, ClassHandler, QuizHandler, QuestionHandler
+from models.pagination import InvalidCursor, page_size
+from models.question_bank import content_hash, normalize_difficulty, normalize_tags, normalize_text
+from models.quiz_diff import diff_questions, fork_shared
+from models.handler import quiz_payload_cache, session_cache, AlreadyExists, Handler, StudentHandler, TeacherHandler, SessionHandler, ResultHandler, AttemptHandler, ClassHandler, QuizHandler, QuestionHandler, StatsHandler, RegradeHandler
 
 bp = Blueprint('teacher', __name__, url_prefix='/teacher')
+logger = logging.getLogger(__name__)
 
 handler = Handler()
 teacher_handler = TeacherHandler(handler)
@@ -19,6 +27,9 @@ quiz_handler = QuizHandler(handler)
 question_handler = QuestionHandler(handler)
 class_handler = ClassHandler(handler)
 result_handler = ResultHandler(handler)
+attempt_handler = AttemptHandler(handler)
+stats_handler = StatsHandler(handler)
+regrade_handler = RegradeHandler(handler)
 
 
 
@@ -30,27 +41,26 @@ def before_request():
     session_id = session.get('session_id', None)
     user_id = session.get('user_id', None)
     ip_address =  request.remote_addr if request.remote_addr else '-1'
-    if (user_id and session_id) and session_handler.check_session(session_id, user_id, ip_address):
-        session['session_id'] = session_id
-        session['user_id'] = user_id
-        
-        user_type = session.get('user_type', None)
-        if user_type != 'teacher':
-            return redirect(url_for('teacher.login'))
+    if not (user_id and session_id) or session.get('user_type', None) != 'teacher':
+        return redirect(url_for('teacher.login'))
     
-        teacher = teacher_handler.get_teacher(user_id)
-        if not teacher:
-            return redirect(url_for('teacher.login'))
-        
-        session['user_data'] = teacher    
-    else:
+    # Cached for a few seconds, so most requests do not touch the database here
+    teacher = session_handler.verify_session(session_id, user_id, ip_address, 'teacher')
+    if not teacher:
         return redirect(url_for('teacher.login'))
+    
+    session['user_data'] = teacher
 
 @bp.after_request
 def after_request(response):
     session.pop("user_data", None)
     return response
 
+@bp.errorhandler(InvalidCursor)
+def invalid_cursor(error):
+    flash('That page link is no longer valid, showing the first page', 'warning')
+    return redirect(request.path)
+
 
 
 """ USER FUNCTIONS"""
@@ -62,9 +72,11 @@ def index():
     if not teacher:
         teacher = teacher_handler.get_teacher(teacher_id)
     
-    classes = [class_handler.get_class(i) for i in  class_handler.get_teacher_classes(teacher_id)]
+    classes, next_cursor = class_handler.get_teacher_class_list(
+        teacher_id, request.args.get('after'), page_size(request.args.get('limit'))
+    )
     
-    return render_template('teacher/index.html', classes = classes, teacher = teacher)
+    return render_template('teacher/index.html', classes = classes, teacher = teacher, next_cursor = next_cursor)
 
 
 @bp.route('/login', methods=['GET', 'POST'])
@@ -77,7 +89,7 @@ def login():
         password = request.form['password']
         
         if teacher_handler.match_username_password(username, password):
-            teacher = teacher_handler.get_teacher_from_username(username)
+            teacher = teacher_handler.get_teacher_from_username(username, {'_id': 0, 'teacher_id': 1})
             
             if not teacher:
                 return render_template('teacher/login.html', error='Invalid username or password')
@@ -112,7 +124,6 @@ def register():
     if request.method == 'GET':
         return render_template('teacher/register.html')
     elif request.method == 'POST':
-        print(datetime.fromisoformat)
         teacher = Teacher(
             username=request.form['username'],
             password=request.form['password'],
@@ -122,16 +133,14 @@ def register():
             created_on=datetime.now()
         )
         
-        # teacher Data Validation
-        if teacher_handler.teacher_username_exists(teacher.username):
-            return render_template('teacher/register.html', error='Username already exists')
-        if teacher_handler.teacher_email_exists(teacher.email):
-            return render_template('teacher/register.html', error='Email already exists')
+        # Username and email uniqueness is enforced by the unique indexes
+        try:
+            teacher_handler.create_teacher(teacher)
+        except AlreadyExists as e:
+            return render_template('teacher/register.html', error=str(e))
         
-        if teacher_handler.create_teacher(teacher):
-            flash('Registration successful!', 'success')
-            return redirect(url_for('teacher.login'))
-        return render_template('teacher/register.html', error='Registration failed! Could not insert teacher!')
+        flash('Registration successful!', 'success')
+        return redirect(url_for('teacher.login'))
     return render_template('teacher/register.html')
 
 
@@ -145,33 +154,57 @@ def class_with_id(class_id):
         flash(f"Class #{class_id} not found!", "error")
         return redirect("teacher.index")
     
-    quizzes = []
-    for _quiz in quiz_handler.get_teacher_class_quizzes(session['user_id'], class_id):
-        if _quiz:
-            quizzes.append(
-                quiz_handler.get_quiz(_quiz)
-            )
+    quizzes, next_cursor = quiz_handler.get_class_quiz_page(
+        class_id, request.args.get('after'), page_size(request.args.get('limit')),
+        {'_id': 0, 'quiz_id': 1, 'title': 1}
+    )
+    
+    students = sorted(
+        student_handler.get_students(class_.get('student_ids', []), {'_id': 0, 'student_id': 1, 'username': 1, 'name': 1}),
+        key=lambda student: student['username']
+    )
      
-    return render_template('teacher/class.html', class_ = class_, quizzes = quizzes)
+    return render_template('teacher/class.html', class_ = class_, quizzes = quizzes, students = students, next_cursor = next_cursor)
+
+
+def read_roster():
+    # Pasted text and an uploaded CSV can be combined; returns the parsed entries or an error message
+    entries = parse_roster(request.form.get('roster') or request.form.get('students') or '')
+    if (upload := request.files.get('roster_file')) and upload.filename:
+        try:
+            entries = list(dict.fromkeys(entries + parse_roster(upload.read().decode('utf-8-sig'))))
+        except UnicodeDecodeError:
+            return None, 'The roster file must be UTF-8 text or CSV'
+    if len(entries) > MAX_ROSTER_ENTRIES:
+        return None, f'A roster can have at most {MAX_ROSTER_ENTRIES} entries'
+    return entries, None
+
+
+def flash_unknown(unknown: list):
+    if unknown:
+        shown = ', '.join(unknown[:20]) + (f' and {len(unknown) - 20} more' if len(unknown) > 20 else '')
+        flash(f'{len(unknown)} unknown students not added: {shown}', 'warning')
 
 
 @bp.route('/class/create', methods = ['POST'])
 def class_create():
-    students = request.form['students'].split(',')
-    for i in students:
-        if not student_handler.get_student_from_username(i):
-           students.remove(i)
+    entries, error = read_roster()
+    if error:
+        flash(error, 'error')
+        return redirect(url_for('teacher.index'))
+    student_ids, unknown = student_handler.resolve_roster(entries)
             
     new_class = Class(
         class_id=generate_uuid(),
         name=request.form['name'],
         teacher_id=session['user_id'],
         created_on=datetime.now(),
-        students=students
+        student_ids=student_ids
     )
     
     result = class_handler.create_class(new_class)
     if result:
+        flash_unknown(unknown)
         return redirect(url_for('teacher.index'))
     return {
         "error": "error"
@@ -194,13 +227,36 @@ def class_delete():
     
 @bp.route('/class/<class_id>/add_student', methods = ['POST'])
 def class_add_student(class_id):
-    student_username = request.form.get('username', None)
-    if not student_username:
+    student_username = request.form.get('username', '').strip()
+    student_ids, _ = student_handler.resolve_roster([student_username] if student_username else [])
+    if not student_ids:
         flash(f'Student @{student_username} not found!', 'error')
         return redirect(url_for('teacher.class_with_id', class_id=class_id))
-    if not student_handler.get_student_from_username(student_username):
+    class_handler.add_student_to_class(class_id, student_ids[0])
+    return redirect(url_for('teacher.class_with_id', class_id=class_id))
+
+
+@bp.route('/class/<class_id>/roster', methods = ['POST'])
+def class_import_roster(class_id):
+    # Any number of usernames/emails: one lookup query and one update, whatever the class size
+    class_ = class_handler.get_class(class_id, {'_id': 0, 'teacher_id': 1})
+    if not class_ or class_.get('teacher_id') != session['user_id']:
+        flash(f"Class #{class_id} not found!", "error")
+        return redirect(url_for('teacher.index'))
+    
+    entries, error = read_roster()
+    if error:
+        flash(error, 'error')
         return redirect(url_for('teacher.class_with_id', class_id=class_id))
-    class_handler.add_student_to_class(class_id, student_username)
+    
+    student_ids, unknown = student_handler.resolve_roster(entries)
+    if student_ids:
+        class_handler.add_students_to_class(class_id, student_ids)
+    
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({'added': len(student_ids), 'unknown': unknown}), 200
+    flash(f'{len(student_ids)} students added to the class')
+    flash_unknown(unknown)
     return redirect(url_for('teacher.class_with_id', class_id=class_id))
     
 
@@ -221,60 +277,88 @@ def class_add_student(class_id):
 
 @bp.route('/quiz/<quiz_id>')
 def quiz(quiz_id):
-    quiz = quiz_handler.get_quiz(quiz_id)
-    questions = []
+    payload = quiz_handler.get_quiz_payload(quiz_id, include_answers=True)
     
-    if not quiz:
+    if not payload:
         return redirect(url_for('teacher.index'))
     
-    question_data = {}
-    
-    for question_id in quiz_handler.get_quiz_questions(quiz_id):
-        _q = question_handler.get_question(question_id)
-        questions.append(_q)
-        question_data[question_id] = _q
-    
-    # Get students who have attended this quiz
-    student_ids = result_handler.get_quiz_attended_students(quiz_id)
+    quiz, questions = payload['quiz'], payload['questions']
     
-    # Group results by student for easier processing in template
-    students_with_results = {}
-    for student_id in student_ids:
-        # Get student details from student handler
-        student = student_handler.get_student(student_id)
-        if not student:
-            continue
-            
-        # Get all results for this student on this quiz
-        student_answers = list(result_handler.get_result_by_student_and_quiz(student_id, quiz_id))
-        
-        # Calculate correct answers for this student
-        correct_answers = 0
-        for answer in student_answers:
-            question = question_data.get(answer['question_id'])
-            if question:
-                if question['type'] == 'mcq':
-                    s_options = [i['option_id'] for i in result_handler.get_result_by_student_and_question(student_id, answer['question_id'])]
-                    if s_options == question['data']['correct_options']:
-                        correct_answers += 1
-                elif question['type'] == 'trueorfalse':
-                    if (answer['option_id'] == 'true' and question['data']['answer'] == True) or \
-                       (answer['option_id'] == 'false' and question['data']['answer'] == False):
-                        correct_answers += 1
-        
-        students_with_results[student_id] = {
-            'name': student.get('name'),
-            'results': student_answers,
-            'correct_answers': correct_answers,
-            'total_questions': len(questions)
-        }
+    # Scores are graded at submission; the report reads the stored attempt summaries
+    reports, next_cursor = result_handler.get_quiz_report(
+        quiz_id, request.args.get('after'), page_size(request.args.get('limit'))
+    )
+    students_with_results = {report['student_id']: report for report in reports}
     
     return render_template('teacher/quiz.html', 
                           quiz=quiz, 
                           questions=questions, 
-                          students=students_with_results)
+                          students=students_with_results,
+                          next_cursor=next_cursor,
+                          stats=stats_handler.get_quiz_stats(quiz_id))
     
 
+def export_rows(quizzes: list):
+    # Student names are looked up once per export; result rows are only ever held one batch at a time
+    quiz_ids = [quiz['quiz_id'] for quiz in quizzes]
+    students = {
+        student['student_id']: student
+        for student in student_handler.get_students(
+            attempt_handler.get_quiz_student_ids(quiz_ids),
+            {'_id': 0, 'student_id': 1, 'username': 1, 'name': 1}
+        )
+    }
+    for quiz in quizzes:
+        payload = quiz_handler.get_quiz_payload(quiz['quiz_id'], include_answers=True) or {'questions': []}
+        titles = {q['question_id']: q['data'].get('title', '') for q in payload['questions']}
+        for row in result_handler.get_quiz_export_cursor(quiz['quiz_id']):
+            student = students.get(row['student_id'], {})
+            yield {
+                **row,
+                'quiz_id': quiz['quiz_id'],
+                'quiz_title': quiz.get('title', ''),
+                'username': student.get('username', ''),
+                'name': student.get('name', ''),
+                'question': titles.get(row['question_id'], ''),
+                # Multi-select answers are one ';'-separated cell
+                'option_ids': ';'.join(row.get('option_ids') or [])
+            }
+
+
+def export_response(name: str, quizzes: list):
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unknown format {export_format!r}, expected one of {sorted(EXPORT_FORMATS)}'}), 400
+    encode, mimetype, extension = EXPORT_FORMATS[export_format]
+    
+    chunks = encode(export_rows(quizzes))
+    filename = f'{name}.{extension}'
+    if request.args.get('gzip', '0').lower() in ('1', 'true', 'yes'):
+        chunks, mimetype, filename = gzip_chunks(chunks), 'application/gzip', f'{filename}.gz'
+    
+    return Response(chunks, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+@bp.route('/quiz/<quiz_id>/export')
+def quiz_export(quiz_id):
+    quiz = quiz_handler.get_quiz(quiz_id, {'_id': 0, 'quiz_id': 1, 'title': 1, 'teacher_id': 1})
+    if not quiz or quiz.get('teacher_id') != session['user_id']:
+        return jsonify({'error': 'Quiz not found'}), 404
+    return export_response(f'quiz-{quiz_id}-results', [quiz])
+
+
+@bp.route('/class/<class_id>/export')
+def class_export(class_id):
+    class_ = class_handler.get_class(class_id, {'_id': 0, 'teacher_id': 1})
+    if not class_ or class_.get('teacher_id') != session['user_id']:
+        return jsonify({'error': 'Class not found'}), 404
+    quizzes = quiz_handler.get_class_quiz_list(class_id, {'_id': 0, 'quiz_id': 1, 'title': 1})
+    return export_response(f'class-{class_id}-results', quizzes)
+
+
 @bp.get('/quiz/create/<class_id>')
 def quiz_create(class_id):
     class_ = class_handler.get_class(class_id)
@@ -313,74 +397,16 @@ def quiz_create_post(class_id):
         if not quiz_id:
             return jsonify({'error': 'Failed to create quiz'}), 500
         
-        # Process each question
-        questions_data = data['questions']
-        question_ids = []
-        
-        for q_id, q_data in questions_data.items():
-            # Validate question data
-            if not all(key in q_data for key in ['title', 'type']):
-                continue  # Skip invalid questions
-            
-            # For MCQ questions
-            if q_data['type'] == 'mcq':
-                if not all(key in q_data for key in ['options', 'correct_options']):
-                    continue  # Skip if missing required MCQ fields
-                
-                # Convert options from array to dictionary format as required by the model
-                options_dict = {}
-                for option in q_data['options']:
-                    options_dict[option['opt_id']] = option['opt_val']
-                
-                # Create MCQType data
-                question_data = MCQType(
-                    title=q_data['title'],
-                    options=options_dict,
-                    correct_options=q_data['correct_options']
-                )
-                
-                # Create Question object
-                new_question = Question(
-                    created_by=session.get('user_id', ''),
-                    created_on=datetime.now(),
-                    marks=q_data.get('marks', 1.0),  # Default mark value if not provided
-                    type='mcq',
-                    data=question_data
-                )
-                
-                # Save the question
-                question_id = question_handler.create_question(new_question)
-                if question_id:
-                    question_ids.append(question_id)
-                    # Add question to quiz
-                    quiz_handler.add_question_to_quiz(quiz_id, question_id)
-            
-            # Add support for True/False questions
-            elif q_data['type'] == 'trueorfalse':
-                if 'answer' not in q_data:
-                    continue  # Skip if missing required trueorfalse fields
-                
-                # Create TrueOrFalseType data
-                question_data = TrueOrFalseType(
-                    title=q_data['title'],
-                    answer=bool(q_data['answer'])
-                )
-                
-                # Create Question object
-                new_question = Question(
-                    created_by=session.get('user_id', ''),
-                    created_on=datetime.now(),
-                    marks=q_data.get('marks', 1.0),  # Default mark value if not provided
-                    type='trueorfalse',
-                    data=question_data
-                )
-                
-                # Save the question
-                question_id = question_handler.create_question(new_question)
-                if question_id:
-                    question_ids.append(question_id)
-                    # Add question to quiz
-                    quiz_handler.add_question_to_quiz(quiz_id, question_id)
+        # Build every question, then store them through the question bank in one round trip: a question
+        # the teacher already has (same normalized content) is reused rather than stored twice
+        questions = []
+        for q_data in data['questions'].values():
+            question = build_question(q_data, session.get('user_id', ''))
+            if question is not None:
+                questions.append(question)
+        question_ids = list(dict.fromkeys(question_handler.add_questions(questions)))
+        if question_ids:
+            quiz_handler.update_quiz(quiz_id, {'question_ids': question_ids})
         
         # Check if class_id was provided and add it to the quiz
         if 'class_id' in data and data['class_id']:
@@ -404,11 +430,49 @@ def quiz_create_post(class_id):
         }), 201
         
     except Exception as e:
-        # Log the error for debugging
-        print(f"Error creating quiz: {str(e)}")
+        logger.exception("Error creating quiz")
         return jsonify({'error': f'Failed to create quiz: {str(e)}'}), 500
 
 
+def parse_question_data(q_data: dict):
+    # Question data from the editor's JSON, or None if the question is incomplete
+    if not all(key in q_data for key in ['title', 'type']):
+        return None
+    if q_data['type'] == 'mcq':
+        if not all(key in q_data for key in ['options', 'correct_options']):
+            return None
+        return MCQType(
+            title=q_data['title'],
+            options={option['opt_id']: option['opt_val'] for option in q_data['options']},
+            correct_options=q_data['correct_options'],
+            partial_credit=bool(q_data.get('partial_credit'))
+        )
+    if q_data['type'] == 'trueorfalse':
+        if 'answer' not in q_data:
+            return None
+        return TrueOrFalseType(title=q_data['title'], answer=bool(q_data['answer']))
+    return None
+
+
+def build_question(q_data: dict, teacher_id: str, question_id: str = '', created_on: datetime | None = None):
+    # Question document from the editor's JSON, with the bank metadata it carries (e.g. the tags of
+    # the prompt it was generated from), or None if the question is incomplete
+    question_data = parse_question_data(q_data)
+    if question_data is None:
+        return None
+    return Question(
+        question_id=question_id,
+        created_by=teacher_id,
+        created_on=created_on or datetime.now(),
+        marks=q_data.get('marks', 1.0),
+        type=q_data['type'],
+        data=question_data,
+        tags=normalize_tags(q_data.get('tags')),
+        difficulty=normalize_difficulty(q_data.get('difficulty')),
+        language=normalize_text(q_data.get('language')) or None
+    ).model_dump()
+
+
 @bp.route('/quiz/edit/<quiz_id>', methods=['GET', 'POST'])
 def quiz_edit(quiz_id):
     # GET request - render the edit page with quiz data
@@ -423,11 +487,7 @@ def quiz_edit(quiz_id):
         class_ = class_handler.get_class(quiz['class_id'])
         
         # Get all questions for this quiz
-        questions = {}
-        for q_id in quiz['question_ids']:
-            question = question_handler.get_question(q_id)
-            if question:
-                questions[q_id] = question
+        questions = {q['question_id']: q for q in question_handler.get_questions(quiz['question_ids'], {'minhash': 0})}
         
         return render_template('teacher/quiz_edit.html', quiz=quiz, questions=questions, class_=class_)
     
@@ -453,116 +513,80 @@ def quiz_edit(quiz_id):
             if not all(key in data for key in ['title', 'description', 'questions']):
                 return jsonify({'error': 'Missing required fields (title, description, questions)'}), 400
             
-            # Update basic quiz properties
-            quiz_handler.update_quiz(quiz_id, {
-                'title': data['title'],
-                'description': data['description'],
-                'public': data.get('public', existing_quiz.get('public', False))
-            })
-            
-            # Get current question IDs
+            # Build the edited questions; existing ones keep their ids, new ones get fresh ids
             old_question_ids = existing_quiz.get('question_ids', [])
+            old_questions = question_handler.get_questions(old_question_ids)
+            stored = {q['question_id']: q for q in old_questions}
             
-            # Process each question
-            questions_data = data['questions']
-            new_question_ids = []
+            teacher_id = session.get('user_id', '')
+            edited = []
+            for q_id, q_data in data['questions'].items():
+                question = build_question(q_data, teacher_id, q_id if q_id in stored else '', stored.get(q_id, {}).get('created_on'))
+                if question is not None:
+                    edited.append(question)
             
-            for q_id, q_data in questions_data.items():
-                # Validate question data
-                if not all(key in q_data for key in ['title', 'type']):
-                    continue  # Skip invalid questions
-                
-                question_id = None
-                
-                # Check if this is a new question or an existing one
-                is_existing = q_id in old_question_ids
-                
-                # For MCQ questions
-                if q_data['type'] == 'mcq':
-                    if not all(key in q_data for key in ['options', 'correct_options']):
-                        continue  # Skip if missing required MCQ fields
-                    
-                    # Convert options from array to dictionary format
-                    options_dict = {}
-                    for option in q_data['options']:
-                        options_dict[option['opt_id']] = option['opt_val']
-                    
-                    # Create MCQType data
-                    question_data = MCQType(
-                        title=q_data['title'],
-                        options=options_dict,
-                        correct_options=q_data['correct_options']
-                    )
-                    
-                    if is_existing:
-                        # Update existing question
-                        question_handler.update_question(q_id, {
-                            'marks': q_data.get('marks', 1.0),
-                            'data': question_data.model_dump()
-                        })
-                        question_id = q_id
+            # Added questions the teacher already has in the bank (same normalized content) are attached
+            # as stored rather than written again
+            banked = question_handler.find_in_bank(teacher_id, [content_hash(q) for q in edited if not q['question_id']])
+            new_questions, attached = {}, set()
+            for question in edited:
+                if not question['question_id']:
+                    question_id = banked.get(content_hash(question))
+                    if question_id is None:
+                        question['question_id'] = generate_uuid()
+                    elif question_id in stored:
+                        question = stored[question_id]
                     else:
-                        # Create new Question object
-                        new_question = Question(
-                            created_by=session.get('user_id', ''),
-                            created_on=datetime.now(),
-                            marks=q_data.get('marks', 1.0),
-                            type='mcq',
-                            data=question_data
-                        )
-                        # Save the question
-                        question_id = question_handler.create_question(new_question)
-                
-                # Add support for True/False questions
-                elif q_data['type'] == 'trueorfalse':
-                    if 'answer' not in q_data:
-                        continue  # Skip if missing required trueorfalse fields
-                    
-                    # Create TrueOrFalseType data
-                    question_data = TrueOrFalseType(
-                        title=q_data['title'],
-                        answer=bool(q_data['answer'])
-                    )
-                    
-                    if is_existing:
-                        # Update existing question
-                        question_handler.update_question(q_id, {
-                            'marks': q_data.get('marks', 1.0),
-                            'data': question_data.model_dump()
-                        })
-                        question_id = q_id
-                    else:
-                        # Create new Question object
-                        new_question = Question(
-                            created_by=session.get('user_id', ''),
-                            created_on=datetime.now(),
-                            marks=q_data.get('marks', 1.0),
-                            type='trueorfalse',
-                            data=question_data
-                        )
-                        # Save the question
-                        question_id = question_handler.create_question(new_question)
-                
-                if question_id:
-                    new_question_ids.append(question_id)
+                        question = {**question, 'question_id': question_id}
+                        attached.add(question_id)
+                new_questions.setdefault(question['question_id'], question)
+            new_questions = list(new_questions.values())
             
-            # Update quiz with new question IDs
-            quiz_handler.update_quiz(quiz_id, {'question_ids': new_question_ids})
+            # Only what changed is written, and stored answers survive the edit: answers to questions
+            # whose answer key or marks changed are regraded, text-only edits keep their grades
+            diff = diff_questions(old_questions, new_questions)
+            diff['added'] = [q for q in diff['added'] if q['question_id'] not in attached]
             
-            # Remove results for this quiz since it has been modified
-            result_handler.delete_quiz_results(quiz_id)
+            # Changed questions that other quizzes also use are copied, so the edit stays in this quiz
+            shared = {
+                question_id
+                for other in quiz_handler.get_quizzes_with_questions([q['question_id'] for q in diff['changed']])
+                if other['quiz_id'] != quiz_id
+                for question_id in other['question_ids']
+            }
+            diff, renamed = fork_shared(diff, shared, generate_uuid)
+            question_handler.apply_question_diff(diff)
+            new_question_ids = [renamed.get(q['question_id'], q['question_id']) for q in new_questions]
+            quiz_handler.update_quiz(quiz_id, {
+                'title': data['title'],
+                'description': data['description'],
+                'public': data.get('public', existing_quiz.get('public', False)),
+                'question_ids': new_question_ids
+            })
+            # The quiz's answers and counters follow its questions to their copies
+            attempt_handler.rename_answer_questions(quiz_id, renamed)
+            stats_handler.rename_questions(quiz_id, renamed)
+            
+            # Regrading runs in the background; the editor polls the job for progress
+            regrade_job = None
+            if diff['rekeyed'] or diff['removed']:
+                regrade_job = regrade_handler.start_regrade(quiz_id, diff['rekeyed'])
             
             # Return success response
             return jsonify({
                 'success': True,
                 'message': 'Quiz updated successfully',
                 'id': quiz_id,
-                'question_count': len(new_question_ids)
+                'question_count': len(new_question_ids),
+                'added': len(diff['added']),
+                'changed': len(diff['changed']),
+                'removed': len(diff['removed']),
+                'regraded': len(diff['rekeyed']),
+                'regrade_job': regrade_job
             }), 200
             
         except Exception as e:
-            # Log the error for debugging
-            print(f"Error updating quiz: {str(e)}")
+            logger.exception("Error updating quiz %s", quiz_id)
             return jsonify({'error': f'Failed to update quiz: {str(e)}'}), 500
 
 @bp.route('/api/generate-quiz', methods=['POST'])
@@ -591,19 +615,122 @@ def generate_quiz_endpoint():
             true_or_false_questions_percent=request_data.get("true_or_false_questions_percent", 0.3)
         )
         
-        print(request_data, request_data.get("language"))
         # Create prompt for ChatGPT
         prompt = create_quiz_prompt(quiz_prompt_data, teacher_id, request_data.get("language", "english"))
         
         # Generate questions
         generated_questions = generate_quiz_questions(prompt)
         
-        # Process and validate questions
-        processed_questions = process_questions(generated_questions, teacher_id)
+        # Process and validate questions, marking (or with drop_duplicates, leaving out) those that nearly
+        # repeat a question of the teacher's bank or of the same batch
+        processed_questions = process_questions(
+            generated_questions, teacher_id,
+            duplicates=question_handler.get_near_duplicate_index(teacher_id),
+            drop_duplicates=bool(request_data.get("drop_duplicates"))
+        )
+        
+        # The prompt's tags and language travel with each question, so the editor saves them into the bank
+        language = normalize_text(request_data.get("language", "english"))
+        for question in processed_questions["questions"].values():
+            question["tags"] = normalize_tags(quiz_prompt_data.tags)
+            question["language"] = language
+            question["difficulty"] = normalize_difficulty(question.get("difficulty"))
+        
+        # The editor shows what each near-duplicate repeats
+        flags = [q["near_duplicate"] for q in processed_questions["questions"].values() if "near_duplicate" in q]
+        titles = {q["question_id"]: q["data"]["title"] for q in processed_questions["questions"].values()}
+        titles.update({
+            q["question_id"]: (q.get("data") or {}).get("title", "")
+            for q in question_handler.get_questions([flag["question_id"] for flag in flags if flag["in_bank"]], {"_id": 0, "data.title": 1})
+        })
+        for flag in flags:
+            flag["title"] = titles.get(flag["question_id"], "")
         
         return jsonify(processed_questions), 200
     
     except Exception as e:
-        print(e)
+        logger.exception("Error generating quiz questions")
         return jsonify({"error": str(e)}), 500
 
+
+@bp.route('/api/cache-stats')
+def cache_stats():
+    return jsonify({
+        'quiz_payload': quiz_payload_cache.stats(),
+        'session': session_cache.stats()
+    }), 200
+
+
+@bp.route('/api/pool-stats')
+def pool_stats():
+    return jsonify(handler.pool_stats()), 200
+
+
+@bp.route('/api/quiz/<quiz_id>/item-analysis')
+def quiz_item_analysis(quiz_id):
+    payload = quiz_handler.get_quiz_payload(quiz_id, include_answers=True)
+    if not payload or payload['quiz'].get('teacher_id') != session['user_id']:
+        return jsonify({'error': 'Quiz not found'}), 404
+    
+    analysis = item_analysis(
+        payload['questions'], result_handler.get_quiz_item_answers(quiz_id), result_handler.count_quiz_attempts(quiz_id)
+    )
+    return jsonify({'quiz_id': quiz_id, **analysis}), 200
+
+
+@bp.route('/api/quiz/<quiz_id>/regrade', methods=['POST'])
+def quiz_regrade(quiz_id):
+    # Regrade the stored answers against the current answer key, e.g. after a key fixed outside the editor
+    quiz = quiz_handler.get_quiz(quiz_id, {'_id': 0, 'teacher_id': 1, 'question_ids': 1})
+    if not quiz or quiz.get('teacher_id') != session['user_id']:
+        return jsonify({'error': 'Quiz not found'}), 404
+    
+    question_ids = (request.get_json(silent=True) or {}).get('question_ids') or quiz.get('question_ids', [])
+    unknown = sorted(set(question_ids) - set(quiz.get('question_ids', [])))
+    if unknown:
+        return jsonify({'error': f'Questions not in this quiz: {unknown}'}), 400
+    
+    job_id = regrade_handler.start_regrade(quiz_id, question_ids)
+    return jsonify({'job_id': job_id, 'status_url': url_for('teacher.regrade_status', job_id=job_id)}), 202
+
+
+@bp.route('/api/regrade/<job_id>')
+def regrade_status(job_id):
+    job = regrade_handler.get_job(job_id)
+    quiz = quiz_handler.get_quiz(job['quiz_id'], {'_id': 0, 'teacher_id': 1}) if job else None
+    if not quiz or quiz.get('teacher_id') != session['user_id']:
+        return jsonify({'error': 'Regrade job not found'}), 404
+    return jsonify(job), 200
+
+
+@bp.route('/api/questions')
+def question_bank_search():
+    # The teacher's question bank, newest first; `q` searches titles and options, `tag` is repeatable
+    try:
+        questions, next_cursor = question_handler.search_bank(
+            session['user_id'],
+            text=request.args.get('q', '').strip() or None,
+            tags=normalize_tags(request.args.getlist('tag')),
+            difficulty=normalize_difficulty(request.args.get('difficulty')),
+            language=normalize_text(request.args.get('language')) or None,
+            type=request.args.get('type') or None,
+            after=request.args.get('after'),
+            limit=page_size(request.args.get('limit'))
+        )
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'questions': questions, 'next': next_cursor}), 200
+
+
+@bp.route('/api/quiz/<quiz_id>/questions', methods=['POST'])
+def quiz_attach_questions(quiz_id):
+    # Attach existing bank questions to a quiz in one update, instead of retyping or regenerating them
+    question_ids = (request.get_json(silent=True) or {}).get('question_ids')
+    if not isinstance(question_ids, list) or not question_ids:
+        return jsonify({'error': 'Expected a non-empty question_ids list'}), 400
+    
+    attached = question_handler.attach_to_quiz(quiz_id, session['user_id'], [str(question_id) for question_id in question_ids])
+    if not attached:
+        return jsonify({'error': 'Quiz or questions not found'}), 404
+    return jsonify({'quiz_id': quiz_id, 'attached': attached}), 200
+
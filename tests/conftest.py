@@ -0,0 +1,101 @@
+import os
+import re
+import sys
+import types
+
+import pytest
+
+# The whole app runs on the in-memory engine; set before anything imports models.connection
+os.environ['MONGO_URI'] = 'memory://tests'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import google.generativeai  # noqa: F401
+except ImportError:
+    # Question generation calls Gemini over the network and is not exercised here; the import
+    # only has to succeed for routes.teacher to load
+    google = types.ModuleType('google')
+    google.generativeai = types.SimpleNamespace(configure=lambda **kwargs: None, GenerativeModel=lambda *args, **kwargs: None)
+    sys.modules.setdefault('google', google)
+    sys.modules.setdefault('google.generativeai', google.generativeai)
+
+import app as app_module  # noqa: E402
+import routes.student  # noqa: E402
+from models.handler import near_duplicate_cache, quiz_payload_cache, session_cache  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    app_module.app.config['TESTING'] = True
+    return app_module.app
+
+
+@pytest.fixture
+def handler():
+    return routes.student.handler
+
+
+@pytest.fixture(autouse=True)
+def clean_database(handler):
+    # Documents go after every test; collections and their indexes stay
+    yield
+    for name in handler.db.list_collection_names():
+        if name != 'schema_meta':
+            handler.db[name].delete_many({})
+    for cache in (quiz_payload_cache, session_cache, near_duplicate_cache):
+        cache.clear()
+
+
+def expect(response, *codes):
+    assert response.status_code in (codes or (200, 302)), (response.status_code, response.data[:500])
+    return response
+
+
+@pytest.fixture
+def teacher(app):
+    client = app.test_client()
+    expect(client.post('/teacher/register', data={'username': 'teacher', 'password': 'pw', 'name': 'Teacher', 'email': 'teacher@example.com', 'dob': '1990-01-01'}))
+    expect(client.post('/teacher/login', data={'username': 'teacher', 'password': 'pw'}))
+    return client
+
+
+@pytest.fixture
+def make_student(app):
+    def make(username: str = 'student'):
+        client = app.test_client()
+        expect(client.post('/student/register', data={'username': username, 'password': 'pw', 'name': username.title(), 'email': f'{username}@example.com', 'dob': '2005-01-01'}))
+        expect(client.post('/student/login', data={'username': username, 'password': 'pw'}))
+        return client
+    return make
+
+
+@pytest.fixture
+def student(make_student):
+    return make_student()
+
+
+@pytest.fixture
+def class_id(teacher, handler):
+    expect(teacher.post('/teacher/class/create', data={'name': 'Class', 'students': ''}))
+    return handler.classes.find_one({}, {'class_id': 1})['class_id']
+
+
+QUESTIONS = {
+    '1': {'title': '2+2', 'type': 'mcq', 'options': [{'opt_id': 'a', 'opt_val': '4'}, {'opt_id': 'b', 'opt_val': '5'}], 'correct_options': ['a'], 'marks': 2},
+    '2': {'title': 'The sky is blue', 'type': 'trueorfalse', 'answer': True},
+}
+
+
+@pytest.fixture
+def quiz_id(teacher, class_id):
+    response = expect(teacher.post(f'/teacher/quiz/create/{class_id}', json={'title': 'Quiz', 'description': 'd', 'questions': QUESTIONS}), 201)
+    return response.get_json()['id']
+
+
+def submit(client, quiz_id: str, answers: dict):
+    # Takes the quiz page first, so the submission carries its rendered idempotency key
+    page = expect(client.get(f'/student/quiz/{quiz_id}'))
+    form = dict(answers)
+    if (submission := re.search(rb'name="submission_id" value="([^"]+)"', page.data)):
+        form['submission_id'] = submission.group(1).decode()
+    return expect(client.post(f'/student/quiz/{quiz_id}/submit', data=form))
@@ -0,0 +1,47 @@
+from utils import analysis
+from utils.analysis import item_analysis, load_matrix
+
+
+QUESTIONS = [
+    {'question_id': 'q1', 'type': 'mcq', 'data': {'title': 'Q1', 'options': {'a': 'A', 'b': 'B'}, 'correct_options': ['a']}},
+    {'question_id': 'q2', 'type': 'trueorfalse', 'data': {'title': 'Q2', 'answer': True}},
+]
+
+
+def attempt(answers: dict) -> dict:
+    # The shape ResultHandler.get_quiz_item_answers returns: (mask, correct) by question id
+    return {
+        'question_ids': list(answers),
+        'masks': [mask for mask, _ in answers.values()],
+        'correct': [correct for _, correct in answers.values()],
+    }
+
+
+def test_load_matrix_maps_answers_to_quiz_columns(monkeypatch):
+    monkeypatch.setattr(analysis, 'LOAD_CHUNK', 2)
+    attempts = [
+        attempt({'q1': (1, True), 'q2': (1, True)}),
+        attempt({'q2': (2, False), 'q1': (2, False)}),
+        attempt({'removed': (1, True)}),
+        attempt({'q1': (1, True), 'removed': (2, False)}),
+    ]
+
+    # A count below the real one still loads everything
+    matrix = load_matrix(QUESTIONS, iter(attempts), count=1)
+
+    assert matrix['students'] == 3
+    rows = sorted(zip(matrix['scores'].tolist(), matrix['masks'].tolist()))
+    assert rows == [([0.0, 0.0], [2, 2]), ([1.0, 0.0], [1, 0]), ([1.0, 1.0], [1, 1])]
+
+
+def test_item_analysis_counts_options():
+    attempts = [attempt({'q1': (1, True), 'q2': (1, True)}), attempt({'q1': (2, False), 'q2': (1, True)})]
+
+    result = item_analysis(QUESTIONS, attempts, len(attempts))
+
+    assert result['students'] == 2
+    q1 = result['items'][0]
+    assert q1['p_value'] == 0.5
+    assert [(option['option_id'], option['count'], option['correct']) for option in q1['options']] == [('a', 1, True), ('b', 1, False)]
+    # Everyone answered q2 correctly: no variance, reported as null
+    assert result['items'][1]['point_biserial'] is None
@@ -0,0 +1,162 @@
+import csv
+import gzip
+import io
+import json
+import re
+import time
+
+from conftest import QUESTIONS, expect, submit
+
+
+def quiz_question_ids(handler, quiz_id: str) -> list:
+    return handler.quizzes.find_one({'quiz_id': quiz_id})['question_ids']
+
+
+def join(client, class_id: str):
+    expect(client.post('/student/class/join', data={'class_id': class_id}))
+
+
+def next_page(response) -> str:
+    # The "older" pagination link rendered from next_cursor
+    return re.search(rb'href="([^"]*\?after=[^"]+)"', response.data).group(1).decode()
+
+
+def test_index_redirects_by_role(app, teacher):
+    assert expect(app.test_client().get('/')).status_code == 200
+    assert teacher.get('/').headers['Location'].endswith('/teacher/')
+
+
+def test_submission_is_graded_and_counted_once(handler, teacher, student, class_id, quiz_id):
+    join(student, class_id)
+    q1, q2 = quiz_question_ids(handler, quiz_id)
+
+    submit(student, quiz_id, {q1: 'a', q2: 'false'})
+    submit(student, quiz_id, {q1: 'b', q2: 'true'})
+
+    attempts = list(handler.attempts.find({'quiz_id': quiz_id}))
+    assert len(attempts) == 1
+    assert (attempts[0]['score'], attempts[0]['max_score'], attempts[0]['correct_count']) == (2.0, 3.0, 1)
+
+    analysis = expect(teacher.get(f'/teacher/api/quiz/{quiz_id}/item-analysis')).get_json()
+    assert analysis['students'] == 1
+    assert expect(teacher.get(f'/teacher/quiz/{quiz_id}')).status_code == 200
+
+
+def test_class_page_lists_quizzes(make_student, class_id, quiz_id):
+    member = make_student('member')
+    join(member, class_id)
+
+    assert b'Quiz' in expect(member.get(f'/student/class/{class_id}')).data
+
+
+def test_edit_regrades_stored_answers(handler, teacher, make_student, class_id, quiz_id):
+    q1, q2 = quiz_question_ids(handler, quiz_id)
+    for username, option in (('right', 'a'), ('wrong', 'b')):
+        client = make_student(username)
+        join(client, class_id)
+        submit(client, quiz_id, {q1: option, q2: 'true'})
+
+    questions = {q1: {**QUESTIONS['1'], 'correct_options': ['b']}, q2: QUESTIONS['2']}
+    response = expect(teacher.post(f'/teacher/quiz/edit/{quiz_id}', json={'title': 'Quiz', 'description': 'd', 'questions': questions}))
+    job_id = response.get_json()['regrade_job']
+
+    deadline = time.monotonic() + 10
+    while (job := teacher.get(f'/teacher/api/regrade/{job_id}').get_json())['status'] not in ('done', 'failed'):
+        assert time.monotonic() < deadline, job
+        time.sleep(0.05)
+    assert job['status'] == 'done', job
+
+    scores = {attempt['student_id']: attempt['score'] for attempt in handler.attempts.find({'quiz_id': quiz_id})}
+    students = {student['username']: student['student_id'] for student in handler.students.find({})}
+    assert scores == {students['right']: 1.0, students['wrong']: 3.0}
+
+    stats = handler.quiz_stats.find_one({'quiz_id': quiz_id})
+    assert (stats['attempts'], stats['score_sum'], stats['questions'][q1]['correct']) == (2, 4.0, 1)
+
+
+def test_emails_match_in_any_case(app, handler, teacher, class_id):
+    expect(app.test_client().post('/student/register', data={'username': 'mixed', 'password': 'pw', 'name': 'Mixed', 'email': 'Mixed.Case@Example.COM', 'dob': '2005-01-01'}))
+    assert handler.students.find_one({'username': 'mixed'})['email'] == 'mixed.case@example.com'
+
+    # The same address in another case is taken
+    expect(app.test_client().post('/student/register', data={'username': 'other', 'password': 'pw', 'name': 'Other', 'email': 'MIXED.case@example.com', 'dob': '2005-01-01'}))
+    assert handler.students.count_documents({}) == 1
+
+    response = expect(teacher.post(f'/teacher/class/{class_id}/roster', data={'roster': 'mixed.CASE@example.com, nobody@example.com'}, headers={'Accept': 'application/json'}))
+    assert response.get_json() == {'added': 1, 'unknown': ['nobody@example.com']}
+
+
+def test_quiz_report_pages_with_cursors(teacher, make_student, class_id, quiz_id, handler):
+    q1, q2 = quiz_question_ids(handler, quiz_id)
+    for username in ('first', 'second'):
+        client = make_student(username)
+        join(client, class_id)
+        submit(client, quiz_id, {q1: 'a', q2: 'true'})
+
+    # Latest submission first, one per page
+    page = expect(teacher.get(f'/teacher/quiz/{quiz_id}?limit=1'))
+    assert b'Responses from Second' in page.data and b'Responses from First' not in page.data
+    page = expect(teacher.get(next_page(page)))
+    assert b'Responses from First' in page.data and b'Responses from Second' not in page.data
+
+    response = expect(teacher.get(f'/teacher/quiz/{quiz_id}?after=not-a-cursor'), 302)
+    assert response.headers['Location'].endswith(f'/teacher/quiz/{quiz_id}')
+
+
+def test_export_round_trips_through_gzip(teacher, student, class_id, quiz_id, handler):
+    join(student, class_id)
+    q1, q2 = quiz_question_ids(handler, quiz_id)
+    submit(student, quiz_id, {q1: 'a', q2: 'false'})
+
+    response = expect(teacher.get(f'/teacher/quiz/{quiz_id}/export?format=csv&gzip=1'))
+    assert response.headers['Content-Disposition'].endswith('.csv.gz"')
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(response.data).decode('utf-8'))))
+    assert sorted((row['question'], row['option_ids'], row['correct']) for row in rows) == [('2+2', 'a', 'True'), ('The sky is blue', 'false', 'False')]
+
+    response = expect(teacher.get(f'/teacher/class/{class_id}/export?format=jsonl&gzip=1'))
+    rows = [json.loads(line) for line in gzip.decompress(response.data).decode('utf-8').splitlines()]
+    assert {(row['username'], row['quiz_id']) for row in rows} == {('student', quiz_id)} and len(rows) == 2
+
+
+def test_roster_csv_upload(teacher, student, class_id, handler):
+    roster = io.BytesIO(b'name,email\nStudent,STUDENT@example.com\nNobody,nobody@example.com\n')
+    response = expect(teacher.post(f'/teacher/class/{class_id}/roster', data={'roster_file': (roster, 'roster.csv')}, headers={'Accept': 'application/json'}))
+
+    assert response.get_json() == {'added': 1, 'unknown': ['nobody@example.com']}
+    student_id = handler.students.find_one({'username': 'student'})['student_id']
+    assert handler.classes.find_one({'class_id': class_id})['student_ids'] == [student_id]
+
+
+def test_bank_reuses_searches_and_attaches(teacher, class_id, quiz_id, handler):
+    q1, q2 = quiz_question_ids(handler, quiz_id)
+
+    # The same question retyped is reused from the bank rather than stored again
+    retyped = {**QUESTIONS['1'], 'title': '  2+2 ', 'options': [{'opt_id': 'x', 'opt_val': '5'}, {'opt_id': 'y', 'opt_val': '4'}], 'correct_options': ['y']}
+    response = expect(teacher.post(f'/teacher/quiz/create/{class_id}', json={'title': 'Other', 'description': 'd', 'questions': {'1': retyped}}), 201)
+    other = response.get_json()['id']
+    assert quiz_question_ids(handler, other) == [q1] and handler.questions.count_documents({}) == 2
+
+    found = expect(teacher.get('/teacher/api/questions?q=sky')).get_json()
+    assert [question['question_id'] for question in found['questions']] == [q2]
+
+    response = expect(teacher.post(f'/teacher/api/quiz/{other}/questions', json={'question_ids': [q2, 'unknown']}))
+    assert response.get_json()['attached'] == [q2]
+    assert quiz_question_ids(handler, other) == [q1, q2]
+
+
+def test_editing_shared_question_leaves_other_quiz(teacher, class_id, quiz_id, handler):
+    q1, q2 = quiz_question_ids(handler, quiz_id)
+    response = expect(teacher.post(f'/teacher/quiz/create/{class_id}', json={'title': 'Other', 'description': 'd', 'questions': QUESTIONS}), 201)
+    other = response.get_json()['id']
+    assert quiz_question_ids(handler, other) == [q1, q2]
+
+    questions = {q1: {**QUESTIONS['1'], 'correct_options': ['b']}, q2: QUESTIONS['2']}
+    expect(teacher.post(f'/teacher/quiz/edit/{quiz_id}', json={'title': 'Quiz', 'description': 'd', 'questions': questions}))
+
+    # The edited quiz gets a copy of the shared question; the other keeps the original
+    edited = quiz_question_ids(handler, quiz_id)
+    assert q1 not in edited and q2 in edited
+    assert quiz_question_ids(handler, other) == [q1, q2]
+    assert handler.questions.find_one({'question_id': q1})['data']['correct_options'] == ['a']
+    copy = next(question_id for question_id in edited if question_id != q2)
+    assert handler.questions.find_one({'question_id': copy})['data']['correct_options'] == ['b']
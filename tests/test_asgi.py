@@ -0,0 +1,51 @@
+import asyncio
+import re
+
+import pytest
+
+from conftest import QUESTIONS
+
+httpx = pytest.importorskip('httpx')
+asgi = pytest.importorskip('asgi')
+
+
+async def expect(request, *codes):
+    response = await request
+    assert response.status_code in (codes or (200, 302)), (response.status_code, response.text[:500])
+    return response
+
+
+async def exam(handler):
+    # The student routes answer from Quart, everything else (teacher, login, static) from Flask
+    transport = httpx.ASGITransport(app=asgi.application)
+    async with httpx.AsyncClient(transport=transport, base_url='http://test') as teacher, \
+            httpx.AsyncClient(transport=transport, base_url='http://test') as student:
+        await expect(teacher.post('/teacher/register', data={'username': 'teacher', 'password': 'pw', 'name': 'Teacher', 'email': 'teacher@example.com', 'dob': '1990-01-01'}))
+        await expect(teacher.post('/teacher/login', data={'username': 'teacher', 'password': 'pw'}))
+        await expect(student.post('/student/register', data={'username': 'student', 'password': 'pw', 'name': 'Student', 'email': 'student@example.com', 'dob': '2005-01-01'}))
+        await expect(student.post('/student/login', data={'username': 'student', 'password': 'pw'}))
+        await expect(teacher.post('/teacher/class/create', data={'name': 'Async class', 'students': ''}))
+        class_id = handler.classes.find_one({}, {'class_id': 1})['class_id']
+        await expect(student.post('/student/class/join', data={'class_id': class_id}))
+        response = await expect(teacher.post(f'/teacher/quiz/create/{class_id}', json={'title': 'Async quiz', 'description': 'd', 'questions': QUESTIONS}), 201)
+        quiz_id = response.json()['id']
+        q1, q2 = handler.quizzes.find_one({'quiz_id': quiz_id})['question_ids']
+
+        assert 'Async class' in (await expect(student.get('/student/'))).text
+        assert 'Async quiz' in (await expect(student.get(f'/student/class/{class_id}'))).text
+        page = await expect(student.get(f'/student/quiz/{quiz_id}'))
+        submission_id = re.search(r'name="submission_id" value="([^"]+)"', page.text).group(1)
+
+        # Retried submissions with one idempotency key store one attempt
+        form = {q1: 'a', q2: 'false', 'submission_id': submission_id}
+        await asyncio.gather(*[expect(student.post(f'/student/quiz/{quiz_id}/submit', data=form)) for _ in range(3)])
+        await expect(student.get(f'/student/quiz/{quiz_id}'))
+        return quiz_id
+
+
+def test_async_student_routes(handler):
+    quiz_id = asyncio.run(exam(handler))
+
+    [attempt] = handler.attempts.find({'quiz_id': quiz_id})
+    assert (attempt['score'], attempt['max_score']) == (2.0, 3.0)
+    assert handler.quiz_stats.find_one({'quiz_id': quiz_id})['attempts'] == 1
@@ -0,0 +1,25 @@
+import numpy as np
+
+from models.grading import _popcount_table, grade_quiz, popcount
+
+
+QUESTION = {
+    'question_id': 'q1', 'type': 'mcq', 'marks': 3,
+    'data': {'options': {'a': 'A', 'b': 'B', 'c': 'C'}, 'correct_options': ['a', 'b'], 'partial_credit': True}
+}
+
+
+def test_popcount_fallback_matches():
+    masks = np.array([[0, 1, 2, 3], [255, 256, 2 ** 40 + 7, 2 ** 62 - 1]], dtype=np.int64)
+    expected = np.array([[bin(int(m)).count('1') for m in row] for row in masks], dtype=np.int64)
+
+    assert (popcount(masks) == expected).all()
+    assert (_popcount_table(masks) == expected).all()
+    assert _popcount_table(np.int64(5)).shape == ()
+
+
+def test_partial_credit_deducts_wrong_selections():
+    assert grade_quiz([QUESTION], {'q1': ['a', 'b']})['score'] == 3.0
+    assert grade_quiz([QUESTION], {'q1': ['a']})['score'] == 1.5
+    assert grade_quiz([QUESTION], {'q1': ['a', 'c']})['score'] == 0.0
+    assert grade_quiz([QUESTION], {'q1': ['a', 'b', 'c']})['questions']['q1']['correct'] is False
@@ -0,0 +1,30 @@
+import pytest
+
+from models.indexes import INDEX_VERSION, IndexBuildError, duplicate_keys, ensure_indexes, get_index_version
+from models.memory import MemoryDatabase
+
+
+def test_duplicates_fail_only_their_index():
+    db = MemoryDatabase('indexes')
+    db['students'].insert_many([
+        {'student_id': 's1', 'username': 'a', 'email': 'same@example.com'},
+        {'student_id': 's2', 'username': 'b', 'email': 'same@example.com'},
+    ])
+
+    with pytest.raises(IndexBuildError) as error:
+        ensure_indexes(db)
+
+    assert list(error.value.failures) == ['students']
+    assert list(error.value.failures['students']) == ['email_unique']
+    assert {'username_unique', 'student_id_unique'} <= set(db['students'].index_information())
+    assert 'quiz_id_unique' in db['quizzes'].index_information()
+    # Not recorded as applied, so the next start tries again
+    assert get_index_version(db) == 0
+
+    [duplicate] = duplicate_keys(db, 'students', 'email_unique')
+    assert duplicate['key'] == {'email': 'same@example.com'} and duplicate['count'] == 2
+    assert duplicate_keys(db, 'students', 'username_unique') == []
+
+    db['students'].update_one({'student_id': 's2'}, {'$set': {'email': 'other@example.com'}})
+    assert ensure_indexes(db) is True
+    assert get_index_version(db) == INDEX_VERSION
@@ -0,0 +1,93 @@
+import pytest
+from pymongo import ASCENDING, DESCENDING, IndexModel, InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from models.memory import MemoryDatabase
+
+
+@pytest.fixture
+def collection():
+    return MemoryDatabase('engine')['docs']
+
+
+def test_inc_creates_and_adds(collection):
+    collection.insert_one({'key': 'a', 'count': 1})
+    collection.update_one({'key': 'a'}, {'$inc': {'count': 2, 'nested.total': 1.5}})
+    collection.update_one({'key': 'b'}, {'$inc': {'count': 1}}, upsert=True)
+
+    assert collection.find_one({'key': 'a'}, {'_id': 0}) == {'key': 'a', 'count': 3, 'nested': {'total': 1.5}}
+    assert collection.find_one({'key': 'b'}, {'_id': 0}) == {'key': 'b', 'count': 1}
+
+
+def test_add_to_set_skips_present_values(collection):
+    collection.insert_one({'key': 'a', 'tags': ['x']})
+    collection.update_one({'key': 'a'}, {'$addToSet': {'tags': 'x'}})
+    collection.update_one({'key': 'a'}, {'$addToSet': {'tags': {'$each': ['y', 'x', 'z']}}})
+
+    assert collection.find_one({'key': 'a'})['tags'] == ['x', 'y', 'z']
+
+
+def test_in_matches_scalars_and_array_elements(collection):
+    collection.insert_many([{'key': 'a', 'tags': ['x', 'y']}, {'key': 'b', 'tags': ['z']}, {'key': 'c'}])
+
+    assert sorted(doc['key'] for doc in collection.find({'key': {'$in': ['a', 'c', 'missing']}})) == ['a', 'c']
+    assert [doc['key'] for doc in collection.find({'tags': {'$in': ['y']}})] == ['a']
+    assert collection.count_documents({'tags': {'$in': []}}) == 0
+
+
+@pytest.mark.parametrize('indexed', [False, True])
+def test_sort_and_skip_on_compound_keys(collection, indexed):
+    if indexed:
+        collection.create_index([('group', ASCENDING), ('created', DESCENDING), ('doc_id', DESCENDING)])
+    collection.insert_many([
+        {'doc_id': f'{group}{n}', 'group': group, 'created': n // 2}
+        for group in 'ba' for n in range(4)
+    ])
+
+    cursor = collection.find({}, {'_id': 0, 'doc_id': 1}).sort([('group', 1), ('created', -1), ('doc_id', -1)]).skip(3).limit(3)
+    assert [doc['doc_id'] for doc in cursor] == ['a0', 'b3', 'b2']
+
+
+def test_unique_index_rejects_duplicates(collection):
+    collection.create_indexes([IndexModel([('group', ASCENDING), ('key', ASCENDING)], name='group_key_unique', unique=True)])
+    collection.insert_one({'group': 1, 'key': 'a'})
+    collection.insert_one({'group': 2, 'key': 'a'})
+
+    with pytest.raises(DuplicateKeyError) as error:
+        collection.insert_one({'group': 1, 'key': 'a'})
+    assert error.value.details['keyPattern'] == {'group': 1, 'key': 1}
+
+    # An update into an existing key fails and leaves the document as it was
+    with pytest.raises(DuplicateKeyError):
+        collection.update_one({'group': 2}, {'$set': {'group': 1}})
+    assert collection.count_documents({'group': 2}) == 1
+
+
+def test_unique_index_on_existing_duplicates_fails(collection):
+    collection.insert_many([{'key': 'a'}, {'key': 'a'}])
+
+    with pytest.raises(DuplicateKeyError):
+        collection.create_index('key', unique=True, name='key_unique')
+    assert 'key_unique' not in collection.index_information()
+
+
+def test_bulk_write_reports_duplicates(collection):
+    collection.create_index('key', unique=True)
+    collection.insert_one({'key': 'a'})
+
+    with pytest.raises(BulkWriteError) as error:
+        collection.bulk_write([InsertOne({'key': 'b'}), InsertOne({'key': 'a'}), InsertOne({'key': 'c'})], ordered=False)
+    assert [e['index'] for e in error.value.details['writeErrors']] == [1]
+    assert error.value.details['nInserted'] == 2
+
+
+def test_array_filters_and_rename(collection):
+    collection.insert_one({'key': 'a', 'answers': [{'question_id': 'q1'}, {'question_id': 'q2'}], 'questions': {'q1': {'correct': 1}}})
+    collection.bulk_write([UpdateOne(
+        {'key': 'a'}, {'$set': {'answers.$[old].question_id': 'q3'}}, array_filters=[{'old.question_id': 'q1'}]
+    )])
+    collection.update_one({'key': 'a'}, {'$rename': {'questions.q1': 'questions.q3'}})
+
+    doc = collection.find_one({'key': 'a'}, {'_id': 0})
+    assert doc['answers'] == [{'question_id': 'q3'}, {'question_id': 'q2'}]
+    assert doc['questions'] == {'q3': {'correct': 1}}
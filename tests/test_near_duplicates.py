@@ -0,0 +1,69 @@
+from datetime import datetime
+
+from models import near_duplicates
+from models.handler import QuestionHandler, near_duplicate_cache
+from models.near_duplicates import MinHashIndex, minhash
+from models.question_bank import bank_fields
+
+
+TEXTS = [
+    'capital of france', 'boiling point of water', 'largest planet', 'author of hamlet',
+    'speed of light', 'chemical symbol for gold', 'longest river', 'year the war ended',
+]
+
+
+def signature(n: int) -> list:
+    return minhash(TEXTS[n])
+
+
+def bank_question(teacher_id: str, title: str) -> dict:
+    question = {'type': 'mcq', 'marks': 1, 'created_by': teacher_id, 'created_on': datetime.now(),
+                'data': {'title': title, 'options': {'a': 'Paris', 'b': 'Lyon'}, 'correct_options': ['a']}}
+    return {**question, **bank_fields(question)}
+
+
+def test_query_finds_near_duplicates():
+    index = MinHashIndex()
+    index.update([('france', minhash('what is the capital city of france paris lyon')), ('water', signature(1))])
+
+    [(key, similarity)] = index.query(minhash('what is the capital of france paris lyon'))
+    assert key == 'france' and similarity >= near_duplicates.THRESHOLD
+    assert index.query(minhash('who painted the mona lisa')) == []
+
+    index.remove('france')
+    assert index.query(minhash('what is the capital city of france paris lyon')) == []
+
+
+def test_merge_drops_removed_rows(monkeypatch):
+    monkeypatch.setattr(near_duplicates, 'MERGE_EVERY', 4)
+    index = MinHashIndex(capacity=4)
+    index.update((n, signature(n)) for n in range(8))
+    for n in range(4):
+        index.remove(n)
+
+    # The fourth removal merged: only live rows are left, plus room for the next additions
+    assert len(index) == 4 and index.capacity == 8
+    assert [key for key, _ in index.query(signature(5))] == [5]
+    assert index.query(signature(1)) == []
+
+
+def test_bank_index_follows_other_processes(handler, teacher):
+    question_handler = QuestionHandler(handler)
+    teacher_id = handler.teachers.find_one({}, {'teacher_id': 1})['teacher_id']
+    [first] = question_handler.add_questions([bank_question(teacher_id, 'What is the capital of France?')])
+    index = question_handler.get_near_duplicate_index(teacher_id)
+    assert first in index
+
+    # A write through this process updates the cached index in place
+    [second] = question_handler.add_questions([bank_question(teacher_id, 'Which city hosts the Louvre museum?')])
+    assert question_handler.get_near_duplicate_index(teacher_id) is index and second in index
+
+    # Another process's write bumps the stored version, so the index is rebuilt
+    handler.questions.insert_one({**bank_question(teacher_id, 'Name the largest city in France'), 'question_id': 'elsewhere'})
+    handler.teachers.update_one({'teacher_id': teacher_id}, {'$inc': {'bank_version': 1}})
+    rebuilt = question_handler.get_near_duplicate_index(teacher_id)
+    assert rebuilt is not index and all(key in rebuilt for key in (first, second, 'elsewhere'))
+
+    question_handler.delete_question(first)
+    assert first not in question_handler.get_near_duplicate_index(teacher_id)
+    assert near_duplicate_cache.stats()['weight'] == rebuilt.capacity
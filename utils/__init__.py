@@ -6,8 +6,16 @@ import hashlib
 def generate_uuid():
     return str(uuid.uuid4())
 
+def generate_stable_uuid(*parts):
+    # Same parts always give the same id, so retried writes collide instead of duplicating
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, ':'.join(parts)))
+
 def generate_quiz_id(quiz_handler):
     return str(uuid.uuid4())
 
 def hash_password(pwd):
-    return hashlib.sha256(pwd.encode()).hexdigest()
\ No newline at end of file
+    return hashlib.sha256(pwd.encode()).hexdigest()
+
+def normalize_email(email):
+    # Stored and looked up lowercased, so addresses match whatever case they are typed in
+    return email.strip().lower()
@@ -0,0 +1,163 @@
+import math
+from itertools import islice, repeat
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+from models.grading import option_ids
+
+
+# Attempts converted to arrays per call while loading
+LOAD_CHUNK = 1000
+
+
+def correct_option_ids(question: dict) -> List[str]:
+    data = question.get('data') or {}
+    if question.get('type') == 'trueorfalse':
+        return ['true' if data.get('answer') else 'false']
+    return list(data.get('correct_options', []))
+
+
+def _number(value) -> Optional[float]:
+    # NaN (no variance, no attempts) is reported as null in JSON
+    value = float(value)
+    return None if math.isnan(value) else value
+
+
+def load_matrix(questions: List[dict], attempts: Iterable[dict], count: int = 0) -> dict:
+    """
+    Load a quiz's graded attempts into students x questions arrays in one pass.
+
+    Args:
+        questions: The quiz's questions, in quiz order
+        attempts: One document per attempt with its answers as parallel `question_ids`,
+            `masks` and `correct` arrays, e.g. a cursor; consumed as it streams
+        count: Expected number of attempts, to allocate the arrays once
+
+    Returns:
+        Dictionary with the `scores` matrix (1.0 for a correct answer, 0.0 otherwise,
+        unanswered included), the `masks` matrix of selected options (bit n is the
+        question's n-th option, 0 when unanswered), the `options` list of
+        (question index, option_id, bit) triples and the number of `students`
+    """
+    column_index = {q['question_id']: i for i, q in enumerate(questions)}
+    options = [(i, option_id, bit) for i, question in enumerate(questions) for bit, option_id in enumerate(option_ids(question))]
+
+    # Attempts stream in chunks, and a chunk's attempts that answered the same questions in the
+    # same order (normally all of them) are converted to arrays in one call and written into
+    # their rows at once. Answers to removed questions map to -1 and are dropped.
+    layouts = {}
+    scores = np.zeros((max(count, 1), len(questions)), dtype=np.float64)
+    masks = np.zeros((max(count, 1), len(questions)), dtype=np.int64)
+    students = 0
+    attempts = iter(attempts)
+    while chunk := list(islice(attempts, LOAD_CHUNK)):
+        groups = {}
+        for attempt in chunk:
+            groups.setdefault(tuple(attempt.get('question_ids') or ()), []).append(attempt)
+        for question_ids, group in groups.items():
+            if (layout := layouts.get(question_ids)) is None:
+                columns = np.fromiter(map(column_index.get, question_ids, repeat(-1)), dtype=np.intp, count=len(question_ids))
+                layout = layouts[question_ids] = (columns >= 0, columns[columns >= 0])
+            known, columns = layout
+            if not len(columns):
+                # Students whose only answers were to removed questions do not count
+                continue
+            if students + len(group) > len(scores):
+                grow = max(len(scores), len(group))
+                scores = np.concatenate([scores, np.zeros((grow, len(questions)), dtype=np.float64)])
+                masks = np.concatenate([masks, np.zeros((grow, len(questions)), dtype=np.int64)])
+            rows = slice(students, students + len(group))
+            scores[rows, columns] = np.array([attempt['correct'] for attempt in group], dtype=np.float64)[:, known]
+            masks[rows, columns] = np.array([attempt['masks'] for attempt in group], dtype=np.int64)[:, known]
+            students += len(group)
+
+    return {'scores': scores[:students], 'masks': masks[:students], 'options': options, 'students': students}
+
+
+def option_counts(masks: np.ndarray, options: list) -> np.ndarray:
+    """
+    How many students selected each option, distractors included, from the mask matrix:
+    each option's bit is shifted out of its question's column and summed.
+    """
+    if not options:
+        return np.zeros(0, dtype=np.int64)
+    columns = np.array([i for i, _, _ in options], dtype=np.intp)
+    bits = np.array([bit for _, _, bit in options], dtype=np.int64)
+    return ((masks[:, columns] >> bits) & 1).sum(axis=0)
+
+
+def point_biserial(scores: np.ndarray) -> np.ndarray:
+    """
+    Corrected point-biserial discrimination of every item: the correlation between the
+    item score and the rest of the test (total minus the item), so an item is not
+    correlated with itself.
+    """
+    rest = scores.sum(axis=1, keepdims=True) - scores
+    item = scores - scores.mean(axis=0)
+    rest = rest - rest.mean(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (item * rest).sum(axis=0) / np.sqrt((item ** 2).sum(axis=0) * (rest ** 2).sum(axis=0))
+
+
+def cronbach_alpha(scores: np.ndarray) -> float:
+    """
+    Internal consistency of the whole quiz; NaN with fewer than two students or items.
+    """
+    students, items = scores.shape
+    if students < 2 or items < 2:
+        return float('nan')
+    total_variance = scores.sum(axis=1).var(ddof=1)
+    if total_variance == 0:
+        return float('nan')
+    return items / (items - 1) * (1 - scores.var(axis=0, ddof=1).sum() / total_variance)
+
+
+def item_analysis(questions: List[dict], attempts: Iterable[dict], count: int = 0) -> Dict:
+    """
+    Per-question psychometrics for one quiz.
+
+    Args:
+        questions: The quiz's questions with their answer keys, in quiz order
+        attempts: The quiz's graded attempts, streamed (see load_matrix)
+        count: Expected number of attempts
+
+    Returns:
+        Dictionary with the number of `students`, the quiz's `cronbach_alpha`, and
+        per-question `items`: `p_value` (share answering correctly),
+        `point_biserial`, and `options` with each choice's `count`, `proportion`
+        and whether it is `correct`
+    """
+    matrix = load_matrix(questions, attempts, count)
+    scores, masks, students = matrix['scores'], matrix['masks'], matrix['students']
+
+    p_values = scores.mean(axis=0) if students else np.full(len(questions), np.nan)
+    discrimination = point_biserial(scores) if students else np.full(len(questions), np.nan)
+    answered = (masks != 0).sum(axis=0)
+    counts = option_counts(masks, matrix['options'])
+
+    items = []
+    for i, question in enumerate(questions):
+        items.append({
+            'question_id': question['question_id'],
+            'title': (question.get('data') or {}).get('title', ''),
+            'type': question.get('type'),
+            'answered': int(answered[i]),
+            'p_value': _number(p_values[i]),
+            'point_biserial': _number(discrimination[i]),
+            'options': []
+        })
+
+    correct = {i: set(correct_option_ids(q)) for i, q in enumerate(questions)}
+    for index, (i, option_id, _) in enumerate(matrix['options']):
+        items[i]['options'].append({
+            'option_id': option_id,
+            'text': (questions[i].get('data') or {}).get('options', {}).get(option_id, option_id.title()),
+            'count': int(counts[index]),
+            'proportion': int(counts[index]) / students if students else 0.0,
+            'correct': option_id in correct[i]
+        })
+
+    return {
+        'students': students,
+        'cronbach_alpha': _number(cronbach_alpha(scores)),
+        'items': items
+    }
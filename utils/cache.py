@@ -0,0 +1,73 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class TTLCache:
+    """
+    Thread-safe, process-local LRU cache whose entries also expire after `ttl` seconds.
+
+    `maxsize` bounds the number of entries, or with `weigh` the sum of `weigh(value)`
+    over them (taken when a value is set). The newest entry is kept even if it alone
+    weighs more.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 300.0, weigh: Callable[[Any], int] | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.weigh = weigh
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._weight = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                    self._weight -= entry[2]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        weight = self.weigh(value) if self.weigh else 1
+        with self._lock:
+            if (entry := self._data.pop(key, None)) is not None:
+                self._weight -= entry[2]
+            self._data[key] = (time.monotonic() + self.ttl, value, weight)
+            self._weight += weight
+            while self._weight > self.maxsize and len(self._data) > 1:
+                self._weight -= self._data.popitem(last=False)[1][2]
+
+    def pop(self, key: Hashable) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None:
+                return None
+            self._weight -= entry[2]
+            return entry[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._weight = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'weight': self._weight,
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
@@ -0,0 +1,85 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Iterable, Iterator, List
+
+
+EXPORT_FIELDS = [
+    'quiz_id', 'quiz_title', 'student_id', 'username', 'name', 'attempt_id',
+    'question_id', 'question', 'option_ids', 'correct', 'marks', 'created_on'
+]
+
+# Rows per yielded chunk: large enough to keep per-chunk overhead low, small enough
+# that memory stays flat however many rows are exported
+CHUNK_ROWS = 1000
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def csv_chunks(rows: Iterable[dict], fields: List[str] = EXPORT_FIELDS, chunk_rows: int = CHUNK_ROWS) -> Iterator[str]:
+    """
+    Encode rows as CSV, a header line first, yielding text a chunk at a time.
+
+    Args:
+        rows: Row dictionaries; keys outside `fields` are ignored
+        fields: Column names, in order
+        chunk_rows: Rows per yielded chunk
+
+    Returns:
+        Iterator of CSV text chunks
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction='ignore')
+    writer.writeheader()
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def jsonl_chunks(rows: Iterable[dict], fields: List[str] = EXPORT_FIELDS, chunk_rows: int = CHUNK_ROWS) -> Iterator[str]:
+    """
+    Encode rows as JSON Lines, one object per row, yielding text a chunk at a time.
+    """
+    lines = []
+    for row in rows:
+        lines.append(json.dumps({field: row.get(field) for field in fields}, default=_json_default))
+        if len(lines) >= chunk_rows:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def gzip_chunks(chunks: Iterable[str], level: int = 6) -> Iterator[bytes]:
+    """
+    Gzip a text stream incrementally, so compression never holds the whole export.
+
+    Args:
+        chunks: Text chunks, e.g. from csv_chunks or jsonl_chunks
+        level: zlib compression level
+
+    Returns:
+        Iterator of gzip-framed bytes
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        if data := compressor.compress(chunk.encode('utf-8')):
+            yield data
+    yield compressor.flush()
+
+
+# format name -> (encoder, mimetype, file extension)
+EXPORT_FORMATS = {
+    'csv': (csv_chunks, 'text/csv', 'csv'),
+    'jsonl': (jsonl_chunks, 'application/x-ndjson', 'jsonl'),
+}
@@ -3,6 +3,8 @@ import requests, uuid, json
 from datetime import datetime
 import os
 from models.models import Question, QuizPrompt, QuestionDataType, MCQType, TrueOrFalseType
+from models.near_duplicates import MinHashIndex
+from models.question_bank import flag_near_duplicates
 import google.generativeai as genai
 import base64
 from io import BytesIO
@@ -394,7 +396,8 @@ def validate_question(question: Dict[str, Any], language_code: str = "en") -> bo
     
     return True
 
-def process_questions(generated_data: Dict[str, Any], teacher_id: str, language_code: str = "en") -> Dict[str, Any]:
+def process_questions(generated_data: Dict[str, Any], teacher_id: str, language_code: str = "en",
+                      duplicates: Optional[MinHashIndex] = None, drop_duplicates: bool = False) -> Dict[str, Any]:
     """
     Process and validate the generated questions.
     
@@ -402,6 +405,9 @@ def process_questions(generated_data: Dict[str, Any], teacher_id: str, language_
         generated_data: The data generated by the AI
         teacher_id: The ID of the teacher creating the quiz
         language_code: ISO language code for language-specific processing
+        duplicates: The teacher's question bank index; questions nearly repeating one of
+            its questions (or an earlier generated one) are marked with `near_duplicate`
+        drop_duplicates: Leave near-duplicates out instead of marking them
         
     Returns:
         Processed and validated questions
@@ -435,6 +441,12 @@ def process_questions(generated_data: Dict[str, Any], teacher_id: str, language_
         if validate_question(question, language_code):
             result["questions"][q_id] = question
     
+    # Near-duplicates are found before the questions reach the editor
+    if result["questions"]:
+        result["questions"] = flag_near_duplicates(result["questions"], duplicates, drop=drop_duplicates)
+        if not result["questions"]:
+            raise ValueError("All generated questions nearly duplicate existing ones")
+    
     # Ensure we have at least one valid question
     if not result["questions"]:
         raise ValueError("No valid questions were generated")
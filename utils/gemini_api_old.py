@@ -3,6 +3,8 @@ import requests, uuid, json
 from datetime import datetime
 import os
 from models.models import Question, QuizPrompt, QuestionDataType, MCQType, TrueOrFalseType
+from models.near_duplicates import MinHashIndex
+from models.question_bank import flag_near_duplicates
 import google.generativeai as genai
 import base64
 from io import BytesIO
@@ -55,7 +57,8 @@ def create_quiz_prompt(quiz_data: QuizPrompt, teacher_id: str, values_language:
                     // For True/False:
                     "title": "question text",
                     "answer": true or false
-                }}
+                }},
+                "difficulty": "easy or hard"
             }},
             // More questions...
         }}
@@ -261,13 +264,17 @@ def validate_question(question: Dict[str, Any]) -> bool:
     
     return True
 
-def process_questions(generated_data: Dict[str, Any], teacher_id: str) -> Dict[str, Any]:
+def process_questions(generated_data: Dict[str, Any], teacher_id: str,
+                      duplicates: Optional[MinHashIndex] = None, drop_duplicates: bool = False) -> Dict[str, Any]:
     """
     Process and validate the generated questions.
     
     Args:
         generated_data: The data generated by the AI
         teacher_id: The ID of the teacher creating the quiz
+        duplicates: The teacher's question bank index; questions nearly repeating one of
+            its questions (or an earlier generated one) are marked with `near_duplicate`
+        drop_duplicates: Leave near-duplicates out instead of marking them
     
     Returns:
         Processed and validated questions
@@ -297,6 +304,12 @@ def process_questions(generated_data: Dict[str, Any], teacher_id: str) -> Dict[s
         if validate_question(question):
             result["questions"][q_id] = question
     
+    # Near-duplicates are found before the questions reach the editor
+    if result["questions"]:
+        result["questions"] = flag_near_duplicates(result["questions"], duplicates, drop=drop_duplicates)
+        if not result["questions"]:
+            raise ValueError("All generated questions nearly duplicate existing ones")
+    
     # Ensure we have at least one valid question
     if not result["questions"]:
         raise ValueError("No valid questions were generated")
@@ -0,0 +1,42 @@
+import csv
+import io
+import re
+from typing import List
+
+
+# Header cells that mark a CSV column as holding usernames or emails
+ROSTER_COLUMNS = ('username', 'email', 'user', 'student', 'usernames', 'emails')
+
+# Upper bound on entries per import, so one request cannot send an unbounded $in
+MAX_ROSTER_ENTRIES = 10000
+
+
+def parse_roster(text: str) -> List[str]:
+    """
+    Extract usernames and emails from a pasted list or CSV text.
+
+    A first row whose cells name a roster column (e.g. `username`, `email`) is
+    treated as a header and only those columns are read; otherwise every cell
+    is. Cells are further split on whitespace and semicolons, so comma-,
+    newline- and space-separated pastes all work.
+
+    Args:
+        text: The pasted list or the decoded CSV file
+
+    Returns:
+        The entries in their original order, without blanks or duplicates
+    """
+    rows = list(csv.reader(io.StringIO(text or '')))
+    columns = []
+    if rows:
+        header = [cell.strip().lower() for cell in rows[0]]
+        columns = [i for i, cell in enumerate(header) if cell in ROSTER_COLUMNS]
+        if columns:
+            rows = rows[1:]
+
+    entries = []
+    for row in rows:
+        cells = [row[i] for i in columns if i < len(row)] if columns else row
+        for cell in cells:
+            entries.extend(re.split(r'[\s;]+', cell.strip()))
+    return list(dict.fromkeys(entry for entry in entries if entry))